@@ -0,0 +1,91 @@
+import argparse
+import json
+import socket
+import tempfile
+import threading
+import time
+from typing import Any
+
+from bench.engines import percentile, play_games, start_server
+from lib.proto import MessageType, send_and_recv_message
+
+def register(port: int, usernames: list[str]) -> None:
+  connection = socket.create_connection(("127.0.0.1", port))
+  for username in usernames:
+    send_and_recv_message(connection, {
+      "type": MessageType.REGISTER_REQUEST.name,
+      "username": username,
+      "password": username
+    })
+  connection.close()
+
+def flood(port: int, usernames: list[str], deadline: float, counts: dict[str, int], lock: threading.Lock) -> None:
+  connection = socket.create_connection(("127.0.0.1", port))
+  seen: set[str] = set()
+  while time.perf_counter() < deadline:
+    for username in usernames:
+      if time.perf_counter() >= deadline:
+        break
+      response = send_and_recv_message(connection, {
+        "type": MessageType.LOGIN_REQUEST.name,
+        "username": username,
+        "password": username
+      })
+      send_and_recv_message(connection, {
+        "type": MessageType.LOGOUT_REQUEST.name
+      })
+      kind = "warm" if username in seen else "cold"
+      seen.add(username)
+      with lock:
+        counts[kind] += 1
+        if response["type"] != MessageType.OK.name:
+          counts["failed"] += 1
+  connection.close()
+
+def run(engine: str, port: int, flooders: int, users_per_flooder: int, duration: float) -> dict[str, Any]:
+  with tempfile.TemporaryDirectory() as workdir:
+    process, port = start_server(engine, port, workdir)
+    try:
+      groups = [[f"flood-{i}-{j}" for j in range(users_per_flooder)] for i in range(flooders)]
+      registrars = [threading.Thread(target=register, args=[port, group]) for group in groups]
+      for registrar in registrars:
+        registrar.start()
+      for registrar in registrars:
+        registrar.join()
+      quiet: list[float] = []
+      play_games(port, f"{engine}-quiet", "json", time.perf_counter() + duration / 2, quiet)
+      counts = {"cold": 0, "warm": 0, "failed": 0}
+      lock = threading.Lock()
+      deadline = time.perf_counter() + duration
+      threads = [threading.Thread(target=flood, args=[port, group, deadline, counts, lock]) for group in groups]
+      for thread in threads:
+        thread.start()
+      loaded: list[float] = []
+      play_games(port, f"{engine}-loaded", "json", deadline, loaded)
+      for thread in threads:
+        thread.join()
+    finally:
+      process.terminate()
+      process.wait()
+  return {
+    "engine": engine,
+    "flooders": flooders,
+    "logins_per_sec": (counts["cold"] + counts["warm"]) / duration,
+    "cold_logins": counts["cold"],
+    "warm_logins": counts["warm"],
+    "failed_logins": counts["failed"],
+    "quiet_p99_move_ms": percentile(quiet, 0.99) * 1000,
+    "flood_p50_move_ms": percentile(loaded, 0.50) * 1000,
+    "flood_p99_move_ms": percentile(loaded, 0.99) * 1000,
+  }
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="login throughput and move latency during a login flood")
+  parser.add_argument("--engines", nargs="+", default=["thread", "asyncio"])
+  parser.add_argument("--port", type=int, default=23556)
+  parser.add_argument("--flooders", type=int, default=32)
+  parser.add_argument("--users-per-flooder", type=int, default=8)
+  parser.add_argument("--duration", type=float, default=10.0)
+  args = parser.parse_args()
+  for engine in args.engines:
+    print(json.dumps(run(engine, args.port, args.flooders, args.users_per_flooder, args.duration)))
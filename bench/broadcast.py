@@ -0,0 +1,91 @@
+import argparse
+import json
+import random
+import socket
+import threading
+import time
+from typing import Any
+
+from bench.codecs import random_card
+from lib.proto import CODECS, MessageType, broadcast_message, set_codec
+
+class CountingSocket:
+  __connection: socket.socket
+  syscalls: int
+
+  def __init__(self, connection: socket.socket) -> None:
+    self.__connection = connection
+    self.syscalls = 0
+
+  def sendall(self, data: bytes | memoryview) -> None:
+    self.syscalls += 1
+    self.__connection.sendall(data)
+
+  def sendmsg(self, buffers: list[bytes | memoryview]) -> int:
+    self.syscalls += 1
+    return self.__connection.sendmsg(buffers)
+
+def drain(connection: socket.socket) -> None:
+  while connection.recv(1 << 16):
+    pass
+
+def legacy_send_message(connection: CountingSocket, message: dict[str, Any]) -> None:
+  message_bytes = json.dumps(message).encode('utf-8')
+  message_length = len(message_bytes).to_bytes(4)
+  connection.sendall(message_length)
+  connection.sendall(message_bytes)
+
+def run(mode: str, players: int, hand_size: int, moves: int) -> dict[str, Any]:
+  rng = random.Random(players)
+  hands = [[random_card(rng) for _ in range(hand_size)] for _ in range(players)]
+  connections = []
+  readers = []
+  for _ in range(players):
+    sender, receiver = socket.socketpair()
+    connection = CountingSocket(sender)
+    if mode != "legacy":
+      set_codec(connection, mode)
+    connections.append((connection, sender))
+    reader = threading.Thread(target=drain, args=[receiver], daemon=True)
+    reader.start()
+    readers.append((reader, receiver))
+  start = time.thread_time()
+  for move in range(moves):
+    current_card = hands[move % players][0]
+    if mode == "legacy":
+      for (i, (connection, _)) in enumerate(connections):
+        legacy_send_message(connection, {
+          "type": MessageType.GAME_UPDATE.name,
+          "hand": list(hands[i]),
+          "turn": move % players,
+          "current_card": current_card,
+        })
+    else:
+      broadcast_message({
+        "type": MessageType.GAME_UPDATE.name,
+        "turn": move % players,
+        "current_card": current_card,
+      }, [(connection, {"hand": list(hands[i])}) for (i, (connection, _)) in enumerate(connections)])
+  elapsed = time.thread_time() - start
+  syscalls = sum(connection.syscalls for (connection, _) in connections)
+  for (_, sender) in connections:
+    sender.close()
+  for (reader, receiver) in readers:
+    reader.join()
+    receiver.close()
+  return {
+    "mode": mode,
+    "players": players,
+    "hand_size": hand_size,
+    "syscalls_per_move": syscalls / moves,
+    "cpu_us_per_move": elapsed / moves * 1e6,
+  }
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="per-recipient send_message against broadcast_message")
+  parser.add_argument("--players", type=int, default=10)
+  parser.add_argument("--hand-size", type=int, default=7)
+  parser.add_argument("--moves", type=int, default=5000)
+  args = parser.parse_args()
+  for mode in ["legacy", *CODECS]:
+    print(json.dumps(run(mode, args.players, args.hand_size, args.moves)))
@@ -0,0 +1,59 @@
+import argparse
+import json
+import random
+import time
+from typing import Any
+
+from lib.proto import CARD_COLORS, CARD_TYPES, CODECS, MessageType, decode_frame
+
+def random_card(rng: random.Random) -> dict[str, Any]:
+  color = rng.choice(CARD_COLORS)
+  if color == "black":
+    return {"color": color, "type": rng.choice(["wildcard", "+4"])}
+  return {"color": color, "type": rng.choice(CARD_TYPES[:13])}
+
+def game_updates(players: int, hand_size: int, rng: random.Random) -> list[dict[str, Any]]:
+  current_card = random_card(rng)
+  return [
+    {
+      "type": MessageType.GAME_UPDATE.name,
+      "hand": [random_card(rng) for _ in range(hand_size)],
+      "turn": rng.randrange(players),
+      "current_card": current_card,
+    }
+    for _ in range(players)
+  ]
+
+def measure(codec_name: str, players: int, hand_size: int, rounds: int) -> dict[str, Any]:
+  codec = CODECS[codec_name]
+  updates = game_updates(players, hand_size, random.Random(players))
+  frames = [codec.encode(update) for update in updates]
+  assert [decode_frame(frame) for frame in frames] == updates
+  start = time.perf_counter_ns()
+  for _ in range(rounds):
+    for update in updates:
+      codec.encode(update)
+  encode_ns = (time.perf_counter_ns() - start) / (rounds * players)
+  start = time.perf_counter_ns()
+  for _ in range(rounds):
+    for frame in frames:
+      decode_frame(frame)
+  decode_ns = (time.perf_counter_ns() - start) / (rounds * players)
+  return {
+    "codec": codec_name,
+    "players": players,
+    "hand_size": hand_size,
+    "bytes_per_update": sum(len(frame) + 4 for frame in frames),
+    "encode_ns_per_message": encode_ns,
+    "decode_ns_per_message": decode_ns,
+  }
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="compare JSON and binary codecs on GAME_UPDATE traffic")
+  parser.add_argument("--players", type=int, nargs="+", default=[2, 4, 6, 8, 10])
+  parser.add_argument("--hand-size", type=int, default=7)
+  parser.add_argument("--rounds", type=int, default=2000)
+  args = parser.parse_args()
+  for players in args.players:
+    for codec_name in CODECS:
+      print(json.dumps(measure(codec_name, players, args.hand_size, args.rounds)))
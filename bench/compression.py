@@ -0,0 +1,142 @@
+import argparse
+import json
+import random
+import time
+import zlib
+from typing import Any, Iterator
+
+from lib.journal import END, MOVE, RESTORE, START, read_journal
+from lib.proto import CODECS, COMPRESSION_MEM_LEVEL, COMPRESSION_WBITS, HEADER_SIZE, MessageType, ZlibCompressor, decode_frame, decompress_frame
+from uno.uno import COLORS, UnoCard, UnoGame
+
+def serialize_card(card: UnoCard) -> dict[str, Any]:
+  return {"color": card.color, "type": card.card_type}
+
+def current_card(game: UnoGame) -> dict[str, Any]:
+  card = game.current_card
+  return {"color": card.temp_color or card.color, "type": card.card_type}
+
+def record_games(games: int, players: int, seed: int) -> Iterator[tuple]:
+  rng = random.Random(seed)
+  for room_id in range(games):
+    game_seed = rng.getrandbits(63)
+    game = UnoGame(players, seed=game_seed)
+    yield (START, room_id, 0.0, players, game_seed)
+    while game.winner is None:
+      player = game.current_player
+      playable = [i for (i, card) in enumerate(player.hand) if game.current_card.playable(card)]
+      if not playable:
+        game.play(player.player_id)
+        yield (MOVE, room_id, 0.0, player.player_id, None, None, None)
+        continue
+      card_index = rng.choice(playable)
+      card = player.hand[card_index]
+      color = rng.choice(COLORS) if card.color == "black" else None
+      game.play(player.player_id, card_index, color)
+      yield (MOVE, room_id, 0.0, player.player_id, card_index, card.code, color)
+    yield (END, room_id, 0.0, game.winner.player_id)
+
+def replay_traffic(records: Iterator[tuple]) -> dict[str, list[dict[str, Any]]]:
+  traffic: dict[str, list[dict[str, Any]]] = {"full": [], "delta": []}
+  games: dict[int, tuple[UnoGame, list[int]]] = {}
+  for record in records:
+    kind, room_id = record[:2]
+    if kind == START or kind == RESTORE:
+      game = UnoGame(record[3], seed=record[4]) if kind == START else UnoGame.from_state(record[4], record[3])
+      games[room_id] = (game, [1])
+      for player in game.players:
+        traffic["full"].append({
+          "type": MessageType.GAME_START_UPDATE.name,
+          "version": 0,
+          "hand": list(map(serialize_card, player.hand)),
+          "turn": game.current_player.player_id,
+          "id": player.player_id,
+          "room_id": room_id,
+          "current_card": current_card(game),
+        })
+    elif kind == MOVE and room_id in games:
+      game, version = games[room_id]
+      _, _, _, mover, card_index, _, color = record
+      hand_sizes = [len(player.hand) for player in game.players]
+      try:
+        game.play(mover, card_index, color)
+      except ValueError:
+        del games[room_id]
+        continue
+      if game.winner is not None:
+        continue
+      update = {
+        "type": MessageType.GAME_UPDATE.name,
+        "version": version[0],
+        "turn": game.current_player.player_id,
+        "current_card": current_card(game),
+      }
+      version[0] += 1
+      for (i, player) in enumerate(game.players):
+        removed = [card_index] if i == mover and card_index is not None else []
+        traffic["full"].append({**update, "hand": list(map(serialize_card, player.hand))})
+        traffic["delta"].append({**update, "removed": removed, "added": list(map(serialize_card, player.hand[hand_sizes[i] - len(removed):]))})
+    elif kind == END:
+      games.pop(room_id, None)
+  return traffic
+
+def measure(codec_name: str, kind: str, messages: list[dict[str, Any]], level: int, threshold: int) -> dict[str, Any]:
+  codec = CODECS[codec_name]
+  frames = [codec.encode(message) for message in messages]
+  compressor = ZlibCompressor(level, threshold)
+  start = time.perf_counter_ns()
+  compressed = [compressor.compress([frame], len(frame)) for frame in frames]
+  compress_ns = time.perf_counter_ns() - start
+  packed = [data for data in compressed if data is not None]
+  start = time.perf_counter_ns()
+  for data in packed:
+    decompress_frame(data)
+  decompress_ns = time.perf_counter_ns() - start
+  for (frame, data) in zip(frames[:100], compressed[:100]):
+    assert data is None or decode_frame(decompress_frame(data)) == decode_frame(frame)
+  plain = zlib.compressobj(level, zlib.DEFLATED, COMPRESSION_WBITS, COMPRESSION_MEM_LEVEL)
+  without_dictionary = 0
+  for frame in frames:
+    if len(frame) >= threshold:
+      context = plain.copy()
+      without_dictionary += min(len(frame), len(context.compress(frame) + context.flush()))
+    else:
+      without_dictionary += len(frame)
+  raw = sum(len(frame) for frame in frames)
+  sent = sum(len(frame) if data is None else len(data) for (frame, data) in zip(frames, compressed))
+  return {
+    "codec": codec_name,
+    "updates": kind,
+    "frames": len(frames),
+    "compressed_frames": compressor.frames,
+    "mean_frame_bytes": raw / len(frames),
+    "raw_bytes": raw + HEADER_SIZE * len(frames),
+    "sent_bytes": sent + HEADER_SIZE * len(frames),
+    "saved_ratio": compressor.saved / (raw + HEADER_SIZE * len(frames)),
+    "saved_ratio_without_dictionary": (raw - without_dictionary) / (raw + HEADER_SIZE * len(frames)),
+    "compress_ns_per_frame": compress_ns / len(frames),
+    "decompress_ns_per_compressed_frame": decompress_ns / len(packed) if packed else 0.0,
+    "saved_bytes_per_cpu_us": compressor.saved / max(1, compress_ns + decompress_ns) * 1000,
+  }
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="bytes saved against CPU spent by frame compression on replayed game traffic")
+  parser.add_argument("journals", nargs="*", help="move journals recorded with --journal-file, self-play games when omitted")
+  parser.add_argument("--games", type=int, default=200)
+  parser.add_argument("--players", type=int, default=4)
+  parser.add_argument("--seed", type=int, default=1)
+  parser.add_argument("--level", type=int, default=6)
+  parser.add_argument("--thresholds", type=int, nargs="+", default=[0, 64, 128, 256])
+  args = parser.parse_args()
+  if args.journals:
+    records: list[tuple] = []
+    for path in args.journals:
+      with open(path, "rb") as journal:
+        records.extend(read_journal(journal.read()))
+  else:
+    records = list(record_games(args.games, args.players, args.seed))
+  traffic = replay_traffic(iter(records))
+  for threshold in args.thresholds:
+    for codec_name in CODECS:
+      for (kind, messages) in traffic.items():
+        print(json.dumps({"threshold": threshold, **measure(codec_name, kind, messages, args.level, threshold)}))
@@ -0,0 +1,157 @@
+import argparse
+import json
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Any
+
+from lib.proto import CODECS, MessageType, playable, recv_message, send_and_recv_message, send_message, set_codec
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def start_server(engine: str, port: int, workdir: str, *options: str) -> tuple[subprocess.Popen, int]:
+  subprocess.run([sys.executable, os.path.join(REPO_ROOT, "models.py")], cwd=workdir, check=True)
+  process = subprocess.Popen(
+    [sys.executable, "-u", os.path.join(REPO_ROOT, "server.py"), "--engine", engine, "--port", str(port), *options],
+    cwd=workdir,
+    stdout=subprocess.PIPE,
+    stderr=subprocess.STDOUT,
+    text=True,
+  )
+  assert process.stdout
+  for line in process.stdout:
+    match = re.search(r"listening on [\d.]+:(\d+)", line)
+    if match:
+      port = int(match.group(1))
+      break
+  threading.Thread(target=lambda: [None for _ in process.stdout or []], daemon=True).start()
+  return process, port
+
+def process_stats(pid: int) -> dict[str, int]:
+  stats = {}
+  with open(f"/proc/{pid}/status") as status:
+    for line in status:
+      key, _, value = line.partition(":")
+      if key == "VmRSS":
+        stats["rss_kb"] = int(value.split()[0])
+      elif key == "Threads":
+        stats["threads"] = int(value)
+  return stats
+
+def login(port: int, username: str, codec: str) -> socket.socket:
+  connection = socket.create_connection(("127.0.0.1", port))
+  send_and_recv_message(connection, {
+    "type": MessageType.REGISTER_REQUEST.name,
+    "username": username,
+    "password": username
+  })
+  response = send_and_recv_message(connection, {
+    "type": MessageType.LOGIN_REQUEST.name,
+    "username": username,
+    "password": username,
+    "codec": codec
+  })
+  assert response["type"] == MessageType.OK.name
+  if "codec" in response:
+    set_codec(connection, response["codec"])
+  return connection
+
+def wait_for(connection: socket.socket, message_type: MessageType) -> dict[str, Any]:
+  while (True):
+    message = recv_message(connection)
+    if message["type"] == message_type.name:
+      return message
+
+def play_games(port: int, prefix: str, codec: str, deadline: float, latencies: list[float]) -> None:
+  game_index = 0
+  while time.perf_counter() < deadline:
+    owner = login(port, f"{prefix}-{game_index}-a", codec)
+    guest = login(port, f"{prefix}-{game_index}-b", codec)
+    game_index += 1
+    room_id = send_and_recv_message(owner, {
+      "type": MessageType.ROOM_CREATION_REQUEST.name,
+      "player_count": 2
+    })["room_id"]
+    send_message(guest, {
+      "type": MessageType.ROOM_CONNECTION_REQUEST.name,
+      "room_id": room_id
+    })
+    connections = [owner, guest]
+    states = [wait_for(connection, MessageType.GAME_START_UPDATE) for connection in connections]
+    while time.perf_counter() < deadline:
+      turn = states[0]["turn"]
+      state = states[turn]
+      move: dict[str, Any] = {"type": MessageType.DRAW_CARD_REQUEST.name}
+      for (i, card) in enumerate(state["hand"]):
+        if playable(card, state["current_card"]):
+          move = {"type": MessageType.CARD_DROP_REQUEST.name, "card_index": i, "color": "red"}
+          break
+      start = time.perf_counter()
+      send_message(connections[turn], move)
+      states = [recv_message(connection) for connection in connections]
+      latencies.append(time.perf_counter() - start)
+      if states[0]["type"] != MessageType.GAME_UPDATE.name:
+        break
+    for connection in connections:
+      connection.close()
+
+def percentile(values: list[float], fraction: float) -> float:
+  ordered = sorted(values)
+  return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+def bench_engine(engine: str, port: int, idle_connections: int, rooms: int, duration: float, codec: str) -> dict[str, Any]:
+  with tempfile.TemporaryDirectory() as workdir:
+    process, port = start_server(engine, port, workdir)
+    try:
+      baseline = process_stats(process.pid)
+      idle = []
+      for _ in range(idle_connections):
+        idle.append(socket.create_connection(("127.0.0.1", port)))
+      for connection in idle:
+        send_message(connection, {"type": MessageType.WHOAMI_REQUEST.name})
+      for connection in idle:
+        recv_message(connection)
+      loaded = process_stats(process.pid)
+      latencies: list[float] = []
+      deadline = time.perf_counter() + duration
+      players = [
+        threading.Thread(target=play_games, args=[port, f"{engine}-{i}", codec, deadline, latencies])
+        for i in range(rooms)
+      ]
+      for player in players:
+        player.start()
+      for player in players:
+        player.join()
+      for connection in idle:
+        connection.close()
+    finally:
+      process.terminate()
+      process.wait()
+  return {
+    "engine": engine,
+    "codec": codec,
+    "idle_connections": idle_connections,
+    "rss_kb_per_connection": (loaded["rss_kb"] - baseline["rss_kb"]) / max(1, idle_connections),
+    "threads": loaded["threads"],
+    "moves": len(latencies),
+    "moves_per_sec": len(latencies) / duration,
+    "p50_move_ms": percentile(latencies, 0.50) * 1000,
+    "p99_move_ms": percentile(latencies, 0.99) * 1000,
+  }
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="compare the threaded and asyncio server engines")
+  parser.add_argument("--engines", nargs="+", default=["thread", "asyncio"])
+  parser.add_argument("--port", type=int, default=23456)
+  parser.add_argument("--idle-connections", type=int, default=2000)
+  parser.add_argument("--rooms", type=int, default=16)
+  parser.add_argument("--duration", type=float, default=10.0)
+  parser.add_argument("--codec", choices=list(CODECS), default="json")
+  args = parser.parse_args()
+  for engine in args.engines:
+    print(json.dumps(bench_engine(engine, args.port, args.idle_connections, args.rooms, args.duration, args.codec)))
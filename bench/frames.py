@@ -0,0 +1,95 @@
+import argparse
+import json
+import time
+import tracemalloc
+from typing import Any
+
+from lib.proto import FrameReader
+
+class MemoryConnection:
+  __data: memoryview
+  __offset: int
+  recv_calls: int
+
+  def __init__(self, data: bytes) -> None:
+    self.__data = memoryview(data)
+    self.__offset = 0
+    self.recv_calls = 0
+
+  def recv(self, size: int) -> bytes:
+    self.recv_calls += 1
+    chunk = bytes(self.__data[self.__offset:self.__offset + size])
+    self.__offset += len(chunk)
+    return chunk
+
+  def recv_into(self, buffer: memoryview) -> int:
+    self.recv_calls += 1
+    size = min(len(buffer), len(self.__data) - self.__offset)
+    buffer[:size] = self.__data[self.__offset:self.__offset + size]
+    self.__offset += size
+    return size
+
+def legacy_recv_frame(connection: Any) -> bytes:
+  CHUNK_SIZE = 1024
+  message_length_bytes = connection.recv(4)
+  message_length = int.from_bytes(message_length_bytes)
+  message = b""
+  while (message_length > CHUNK_SIZE):
+    message += connection.recv(CHUNK_SIZE)
+    message_length -= 1024
+  if (message_length > 0):
+    message += connection.recv(message_length)
+  return message
+
+def make_stream(payload_size: int, frames: int) -> bytes:
+  hand = [{"color": "red", "type": 7}] * max(1, payload_size // 27)
+  body = json.dumps({"type": "GAME_UPDATE", "hand": hand}).encode('utf-8')
+  return (len(body).to_bytes(4) + body) * frames
+
+def run(name: str, payload_size: int, frames: int) -> dict[str, Any]:
+  stream = make_stream(payload_size, frames)
+  connection = MemoryConnection(stream)
+  reader = None
+  if name == "legacy":
+    recv = lambda: legacy_recv_frame(connection)
+  else:
+    reader = FrameReader(connection)
+    recv = lambda: reader.recv_frame().release()
+  allocated = 0
+  tracemalloc.start()
+  start = time.perf_counter()
+  for _ in range(frames):
+    tracemalloc.reset_peak()
+    before, _ = tracemalloc.get_traced_memory()
+    recv()
+    allocated += tracemalloc.get_traced_memory()[1] - before
+  elapsed = time.perf_counter() - start
+  tracemalloc.stop()
+  capacity = reader.capacity if reader else 0
+  connection = MemoryConnection(stream)
+  if name != "legacy":
+    reader = FrameReader(connection)
+  start = time.perf_counter()
+  for _ in range(frames):
+    recv()
+  untraced = time.perf_counter() - start
+  return {
+    "reader": name,
+    "frame_bytes": len(stream) // frames,
+    "frames": frames,
+    "mb_per_sec": len(stream) / untraced / 1e6,
+    "recv_calls_per_frame": connection.recv_calls / frames,
+    "allocated_bytes_per_frame": allocated / frames,
+    "buffer_kb_after": capacity / 1024,
+    "traced_us_per_frame": elapsed / frames * 1e6,
+  }
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="compare the legacy recv loop against FrameReader")
+  parser.add_argument("--sizes", type=int, nargs="+", default=[128, 16 * 1024, 512 * 1024])
+  parser.add_argument("--bytes", type=int, default=64 * 1024 * 1024)
+  args = parser.parse_args()
+  for size in args.sizes:
+    frames = max(10, args.bytes // size)
+    for name in ["legacy", "frame_reader"]:
+      print(json.dumps(run(name, size, frames)))
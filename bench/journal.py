@@ -0,0 +1,78 @@
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from typing import Any
+
+from lib.journal import Journal
+from lib.room import Room
+from lib.user import User
+from replay import run as run_replay
+
+def play_games(games: int, players: int, journal: Journal | None, rng: random.Random) -> tuple[int, list[int]]:
+  moves = 0
+  durations = []
+  for _ in range(games):
+    users = [User(f"journal-{i}", None) for i in range(players)]
+    room = Room(users[0], players)
+    for user in users[1:]:
+      room.add_user(user)
+    if journal:
+      journal.record_start(room)
+    game = room.game
+    while game.is_active:
+      current_player = game.current_player
+      playable = [i for (i, card) in enumerate(current_player.hand) if game.current_card.playable(card)]
+      start = time.perf_counter_ns()
+      if playable:
+        card_index = rng.choice(playable)
+        card = current_player.hand[card_index]
+        color = rng.choice(["red", "green", "blue", "yellow"]) if card.color == "black" else None
+        game.play(current_player.player_id, card_index, color)
+        if journal:
+          journal.record_move(room.id, current_player.player_id, card_index, card.code, color)
+      else:
+        game.play(current_player.player_id)
+        if journal:
+          journal.record_move(room.id, current_player.player_id, None, None, None)
+      durations.append(time.perf_counter_ns() - start)
+      moves += 1
+    if journal:
+      journal.record_end(room.id, game.winner.player_id if game.winner else 0)
+  return moves, durations
+
+def percentile(values: list[int], fraction: float) -> float:
+  ordered = sorted(values)
+  return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+def run(games: int, players: int, seed: int) -> dict[str, Any]:
+  _, plain = play_games(games, players, None, random.Random(seed))
+  with tempfile.TemporaryDirectory() as workdir:
+    path = os.path.join(workdir, "moves.journal")
+    journal = Journal(path)
+    journal.start()
+    moves, journaled = play_games(games, players, journal, random.Random(seed))
+    journal.stop()
+    size = os.path.getsize(path)
+    replayed = run_replay([path])
+  return {
+    "games": games,
+    "moves": moves,
+    "plain_move_p50_us": percentile(plain, 0.50) / 1000,
+    "plain_move_p99_us": percentile(plain, 0.99) / 1000,
+    "journaled_move_p50_us": percentile(journaled, 0.50) / 1000,
+    "journaled_move_p99_us": percentile(journaled, 0.99) / 1000,
+    "journal_bytes_per_move": size / moves,
+    "replay_moves_per_sec": replayed["replay_moves_per_sec"],
+    "replay_mismatches": replayed["mismatches"],
+  }
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="cost of journaling moves and speed of replaying them")
+  parser.add_argument("--games", type=int, default=5_000)
+  parser.add_argument("--players", type=int, default=4)
+  parser.add_argument("--seed", type=int, default=0)
+  args = parser.parse_args()
+  print(json.dumps(run(args.games, args.players, args.seed)))
@@ -0,0 +1,89 @@
+import argparse
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+from typing import Any, Callable
+
+def percentiles(samples: list[float]) -> dict[str, float]:
+  ordered = sorted(samples)
+  return {
+    "p50_us": ordered[len(ordered) // 2] * 1e6,
+    "p99_us": ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1e6,
+  }
+
+def timed(calls: list[Callable[[], Any]]) -> dict[str, float]:
+  samples = []
+  for call in calls:
+    start = time.perf_counter()
+    call()
+    samples.append(time.perf_counter() - start)
+  return percentiles(samples)
+
+def populate(models: Any, users: int, seed: int) -> None:
+  rng = random.Random(seed)
+  models.User._schema.create_table(safe=True)
+  with models.db.atomic():
+    for start in range(0, users, 50_000):
+      rows = []
+      for i in range(start, min(users, start + 50_000)):
+        games = int(rng.expovariate(1 / 40))
+        wins = rng.randint(0, games)
+        rows.append((f"player-{i}", "x", wins, games - wins))
+      models.db.cursor().executemany('INSERT INTO "user" (username, password, wins, losses) VALUES (?, ?, ?, ?)', rows)
+
+def run(models: Any, users: int, requests: int, seed: int) -> dict[str, Any]:
+  from lib.leaderboard import Leaderboard
+  rng = random.Random(seed + 1)
+  result: dict[str, Any] = {"users": users}
+  start = time.perf_counter()
+  populate(models, users, seed)
+  result["populate_s"] = time.perf_counter() - start
+  start = time.perf_counter()
+  models.ensure_indexes()
+  result["index_s"] = time.perf_counter() - start
+  stats_writer = models.StatsWriter(models.db)
+  user_cache = models.UserCache(stats_writer, requests)
+  leaderboard = Leaderboard(stats_writer, user_cache)
+  start = time.perf_counter()
+  leaderboard.load()
+  result["cold_start_s"] = time.perf_counter() - start
+  sampled = [f"player-{rng.randrange(users)}" for _ in range(requests)]
+  result["rank_uncached"] = timed([lambda username=username: leaderboard.rank("wins", username) for username in sampled])
+  for order in ["wins", "win_rate"]:
+    result[f"{order}_page"] = timed([lambda offset=rng.randrange(0, 980): leaderboard.page(order, offset, 20) for _ in range(requests)])
+    result[f"{order}_rank"] = timed([lambda username=username: leaderboard.rank(order, username) for username in sampled])
+  games = [(sampled[i], [sampled[i + 1]]) for i in range(0, len(sampled) - 1, 2)]
+  stats_writer.start()
+  result["record_game"] = timed([lambda game=game: stats_writer.record_game(*game) for game in games])
+  start = time.perf_counter()
+  stats_writer.stop()
+  result["flush_and_rank_games_ms"] = (time.perf_counter() - start) * 1e3
+  queries = {
+    "sql_wins_page": ('SELECT username, wins, losses FROM "user" ORDER BY wins DESC, username LIMIT 20 OFFSET ?', lambda: (rng.randrange(0, 980),)),
+    "sql_wins_rank": ('SELECT COUNT(*) FROM "user" WHERE wins > ?', lambda: (rng.randrange(0, 200),)),
+    "sql_unindexed_page": ('SELECT username, wins, losses FROM "user" ORDER BY wins + 0 DESC, username LIMIT 20 OFFSET ?', lambda: (rng.randrange(0, 980),)),
+  }
+  for (name, (query, parameters)) in queries.items():
+    count = requests if name != "sql_unindexed_page" else max(1, min(requests, 20))
+    result[name] = timed([lambda query=query, values=parameters(): models.db.execute_sql(query, values).fetchall() for _ in range(count)])
+  return result
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="leaderboard pages, own rank and game-end updates at scale against SQLite queries")
+  parser.add_argument("--users", type=int, nargs="+", default=[100_000, 1_000_000])
+  parser.add_argument("--requests", type=int, default=2000)
+  parser.add_argument("--seed", type=int, default=1)
+  args = parser.parse_args()
+  logging.disable(logging.CRITICAL)
+  for users in args.users:
+    workdir = tempfile.mkdtemp()
+    os.chdir(workdir)
+    import models
+    models.db.close()
+    models.open_database(os.path.join(workdir, f"leaderboard-{users}.db"))
+    models.db.connect()
+    print(json.dumps(run(models, users, args.requests, args.seed)))
+    models.db.close()
@@ -0,0 +1,210 @@
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from typing import Any
+
+from bench.engines import start_server
+from lib.proto import MessageType, StreamConnection, playable, recv_message_async, send_message, set_codec
+
+class Stats:
+  connect: list[float]
+  login: list[float]
+  move: list[float]
+  messages: int
+  errors: dict[str, int]
+  games: int
+
+  def __init__(self) -> None:
+    self.connect = []
+    self.login = []
+    self.move = []
+    self.messages = 0
+    self.errors = {}
+    self.games = 0
+
+  def error(self, kind: str) -> None:
+    self.errors[kind] = self.errors.get(kind, 0) + 1
+
+def choose_move(state: dict[str, Any]) -> dict[str, Any]:
+  if state.pop("force_draw", False):
+    return {"type": MessageType.DRAW_CARD_REQUEST.name}
+  hand = state["hand"]
+  for (i, card) in enumerate(hand):
+    if card["color"] != "black" and playable(card, state["current_card"]):
+      return {"type": MessageType.CARD_DROP_REQUEST.name, "card_index": i}
+  for (i, card) in enumerate(hand):
+    if card["color"] == "black":
+      colors = [card["color"] for card in hand if card["color"] != "black"]
+      color = max(set(colors), key=colors.count) if colors else "red"
+      return {"type": MessageType.CARD_DROP_REQUEST.name, "card_index": i, "color": color}
+  return {"type": MessageType.DRAW_CARD_REQUEST.name}
+
+class Bot:
+  __name: str
+  __stats: Stats
+  __codec: str
+  __reader: asyncio.StreamReader
+  __connection: StreamConnection
+
+  def __init__(self, name: str, stats: Stats, codec: str) -> None:
+    self.__name = name
+    self.__stats = stats
+    self.__codec = codec
+
+  async def request(self, message: dict[str, Any]) -> dict[str, Any]:
+    self.send(message)
+    return await self.recv()
+
+  def send(self, message: dict[str, Any]) -> None:
+    send_message(self.__connection, message)
+    self.__stats.messages += 1
+
+  async def recv(self) -> dict[str, Any]:
+    message = await recv_message_async(self.__reader)
+    self.__stats.messages += 1
+    if message["type"] == MessageType.ERROR.name:
+      self.__stats.error("error_reply")
+    return message
+
+  async def connect(self, host: str, port: int) -> None:
+    start = time.perf_counter()
+    self.__reader, writer = await asyncio.open_connection(host, port)
+    self.__stats.connect.append(time.perf_counter() - start)
+    self.__connection = StreamConnection(writer)
+    await self.request({
+      "type": MessageType.REGISTER_REQUEST.name,
+      "username": self.__name,
+      "password": self.__name
+    })
+    start = time.perf_counter()
+    response = await self.request({
+      "type": MessageType.LOGIN_REQUEST.name,
+      "username": self.__name,
+      "password": self.__name,
+      "codec": self.__codec
+    })
+    self.__stats.login.append(time.perf_counter() - start)
+    if response["type"] != MessageType.OK.name:
+      raise Exception(f"login failed for {self.__name}")
+    if "codec" in response:
+      set_codec(self.__connection, response["codec"])
+
+  async def wait_for(self, message_type: MessageType) -> dict[str, Any]:
+    while (True):
+      message = await self.recv()
+      if message["type"] in [message_type.name, MessageType.ROOM_CLOSE_UPDATE.name]:
+        return message
+
+  async def play(self, state: dict[str, Any]) -> None:
+    player_id = state["id"]
+    move_started: float | None = None
+    while (True):
+      if state["turn"] == player_id and move_started is None:
+        move_started = time.perf_counter()
+        self.send(choose_move(state))
+      message = await self.recv()
+      if message["type"] == MessageType.GAME_END_UPDATE.name:
+        if move_started is not None:
+          self.__stats.move.append(time.perf_counter() - move_started)
+        if player_id == 0:
+          self.__stats.games += 1
+        return
+      if message["type"] == MessageType.ROOM_CLOSE_UPDATE.name:
+        self.__stats.error("room_closed")
+        return
+      if message["type"] == MessageType.ERROR.name:
+        move_started = None
+        state["force_draw"] = True
+        continue
+      if message["type"] != MessageType.GAME_UPDATE.name:
+        continue
+      if move_started is not None:
+        self.__stats.move.append(time.perf_counter() - move_started)
+        move_started = None
+      state.update(message)
+
+  def close(self) -> None:
+    self.__connection.close()
+
+async def run_table(table: int, host: str, port: int, players: int, prefix: str, codec: str, deadline: float, stats: Stats) -> None:
+  bots = [Bot(f"{prefix}-{table}-{i}", stats, codec) for i in range(players)]
+  try:
+    await asyncio.gather(*[bot.connect(host, port) for bot in bots])
+    while time.monotonic() < deadline:
+      response = await bots[0].request({
+        "type": MessageType.ROOM_CREATION_REQUEST.name,
+        "player_count": players
+      })
+      if response["type"] != MessageType.OK.name:
+        stats.error("room_create")
+        return
+      for bot in bots[1:]:
+        bot.send({
+          "type": MessageType.ROOM_CONNECTION_REQUEST.name,
+          "room_id": response["room_id"]
+        })
+      states = await asyncio.gather(*[bot.wait_for(MessageType.GAME_START_UPDATE) for bot in bots])
+      if any(state["type"] != MessageType.GAME_START_UPDATE.name for state in states):
+        stats.error("room_closed")
+        return
+      await asyncio.gather(*[bot.play(state) for (bot, state) in zip(bots, states)])
+  except Exception as e:
+    stats.error(type(e).__name__)
+  finally:
+    for bot in bots:
+      try:
+        bot.close()
+      except Exception:
+        pass
+
+def histogram(values: list[float]) -> dict[str, float]:
+  ordered = sorted(values)
+  pick = lambda fraction: ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] * 1000 if ordered else 0.0
+  return {"count": len(ordered), "p50_ms": pick(0.50), "p95_ms": pick(0.95), "p99_ms": pick(0.99)}
+
+async def run(host: str, port: int, connections: int, players: int, duration: float, codec: str) -> dict[str, Any]:
+  stats = Stats()
+  prefix = f"load-{os.getpid()}-{int(time.time())}"
+  deadline = time.monotonic() + duration
+  start = time.perf_counter()
+  await asyncio.gather(*[
+    run_table(table, host, port, players, prefix, codec, deadline, stats)
+    for table in range(max(1, connections // players))
+  ])
+  elapsed = time.perf_counter() - start
+  return {
+    "connections": max(1, connections // players) * players,
+    "players_per_room": players,
+    "codec": codec,
+    "duration_s": elapsed,
+    "games": stats.games,
+    "messages_per_sec": stats.messages / elapsed,
+    "connect": histogram(stats.connect),
+    "login": histogram(stats.login),
+    "move": histogram(stats.move),
+    "errors": stats.errors,
+  }
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="headless load generator that plays full games against server.py")
+  parser.add_argument("--host", default="127.0.0.1")
+  parser.add_argument("--port", type=int, default=12345)
+  parser.add_argument("--spawn", choices=["thread", "asyncio"], help="start a scratch server with this engine")
+  parser.add_argument("--connections", type=int, default=100)
+  parser.add_argument("--players", type=int, default=4)
+  parser.add_argument("--duration", type=float, default=30.0)
+  parser.add_argument("--codec", choices=["json", "binary"], default="json")
+  args = parser.parse_args()
+  if args.spawn:
+    with tempfile.TemporaryDirectory() as workdir:
+      process, port = start_server(args.spawn, args.port, workdir)
+      try:
+        print(json.dumps(asyncio.run(run(args.host, port, args.connections, args.players, args.duration, args.codec))))
+      finally:
+        process.terminate()
+        process.wait()
+  else:
+    print(json.dumps(asyncio.run(run(args.host, args.port, args.connections, args.players, args.duration, args.codec))))
@@ -0,0 +1,95 @@
+import argparse
+import bisect
+import json
+import random
+import time
+from typing import Any
+
+from bench.registry import BenchRoom
+from lib.matchmaking import Matchmaker
+from lib.registry import RoomRegistry
+from lib.user import User
+
+def percentiles(values: list[float]) -> dict[str, float]:
+  ordered = sorted(values)
+  return {
+    "p50_us": ordered[len(ordered) // 2] * 1e6,
+    "p99_us": ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1e6,
+  }
+
+def bench_matchmaking(players: int) -> dict[str, Any]:
+  rng = random.Random(1)
+  matchmaker = Matchmaker(widen_after=0.001)
+  users = [User(f"player-{i}", None) for i in range(players)]
+  enqueue = []
+  matched = 0
+  for user in users:
+    games = rng.randrange(0, 200)
+    wins = rng.randrange(0, games + 1)
+    start = time.perf_counter()
+    match = matchmaker.enqueue(user, rng.randrange(2, 5), wins, games - wins)
+    enqueue.append(time.perf_counter() - start)
+    matched += len(match) if match else 0
+  waiting = len(matchmaker)
+  start = time.perf_counter()
+  swept = sum(len(match) for match in matchmaker.sweep(time.monotonic() + 60))
+  sweep = time.perf_counter() - start
+  cancel = []
+  for user in users[:10_000]:
+    start = time.perf_counter()
+    matchmaker.cancel(user)
+    cancel.append(time.perf_counter() - start)
+  return {
+    "players": players,
+    "matched_on_enqueue": matched,
+    "waiting_before_sweep": waiting,
+    "matched_by_sweep": swept,
+    "sweep_ms": sweep * 1e3,
+    "enqueue": percentiles(enqueue),
+    "cancel": percentiles(cancel),
+  }
+
+def bench_listing(room_count: int, pages: int) -> dict[str, Any]:
+  registry = RoomRegistry()
+  rooms = [BenchRoom(User(f"owner-{room_count}-{i}", None)) for i in range(room_count)]
+  for room in rooms:
+    registry.add(room)
+  cursors = [rooms[(i * 7919) % room_count].id for i in range(pages)]
+  start = time.perf_counter()
+  for cursor in cursors:
+    registry.open_rooms(cursor, 20)
+  indexed = (time.perf_counter() - start) / pages
+  scan_pages = max(1, min(pages, 2_000_000 // room_count))
+  start = time.perf_counter()
+  for cursor in cursors[:scan_pages]:
+    sorted(room.id for room in registry if not room.is_full and room.id > cursor)[:20]
+  scan = (time.perf_counter() - start) / scan_pages
+  churned = [rooms[(i * 7919) % (room_count // 2 + 1)] for i in range(pages)]
+  start = time.perf_counter()
+  for room in churned:
+    registry.remove(room)
+    registry.add(room)
+  update = (time.perf_counter() - start) / pages
+  ids = sorted(room.id for room in rooms)
+  start = time.perf_counter()
+  for room in churned:
+    del ids[bisect.bisect_left(ids, room.id)]
+    bisect.insort(ids, room.id)
+  list_update = (time.perf_counter() - start) / pages
+  return {
+    "open_rooms": room_count,
+    "indexed_page_us": indexed * 1e6,
+    "scan_page_us": scan * 1e6,
+    "close_reopen_us": update * 1e6,
+    "sorted_list_close_reopen_us": list_update * 1e6,
+  }
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="matchmaking queue and lobby listing cost as the waiting pool grows")
+  parser.add_argument("--players", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+  parser.add_argument("--pages", type=int, default=20_000)
+  args = parser.parse_args()
+  for count in args.players:
+    print(json.dumps(bench_matchmaking(count)))
+  for count in args.players:
+    print(json.dumps(bench_listing(count, args.pages)))
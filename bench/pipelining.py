@@ -0,0 +1,113 @@
+import argparse
+import heapq
+import json
+import socket
+import tempfile
+import threading
+import time
+from typing import Any
+
+from bench.engines import start_server
+from lib.proto import Dispatcher, MessageType, send_and_recv_message
+
+def forward(source: socket.socket, target: socket.socket, delay: float) -> None:
+  pending: list[tuple[float, int, bytes]] = []
+  ready = threading.Condition()
+  closed = False
+
+  def deliver() -> None:
+    while (True):
+      with ready:
+        while not pending and not closed:
+          ready.wait()
+        if not pending:
+          break
+        due, _, data = pending[0]
+        wait = due - time.perf_counter()
+        if wait > 0:
+          ready.wait(wait)
+          continue
+        heapq.heappop(pending)
+      target.sendall(data)
+    target.shutdown(socket.SHUT_WR)
+
+  sender = threading.Thread(target=deliver, daemon=True)
+  sender.start()
+  sequence = 0
+  while data := source.recv(1 << 16):
+    with ready:
+      heapq.heappush(pending, (time.perf_counter() + delay, sequence, data))
+      sequence += 1
+      ready.notify()
+  with ready:
+    closed = True
+    ready.notify()
+
+def start_proxy(upstream: int, rtt: float) -> int:
+  listener = socket.create_server(("127.0.0.1", 0))
+
+  def accept() -> None:
+    while (True):
+      client, _ = listener.accept()
+      server = socket.create_connection(("127.0.0.1", upstream))
+      for (source, target) in ((client, server), (server, client)):
+        source.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        threading.Thread(target=forward, daemon=True, args=[source, target, rtt / 2]).start()
+
+  threading.Thread(target=accept, daemon=True).start()
+  return listener.getsockname()[1]
+
+def lockstep(port: int, messages: list[dict[str, Any]]) -> float:
+  connection = socket.create_connection(("127.0.0.1", port))
+  start = time.perf_counter()
+  for message in messages:
+    send_and_recv_message(connection, message)
+  elapsed = time.perf_counter() - start
+  connection.close()
+  return elapsed
+
+def pipelined(port: int, messages: list[dict[str, Any]]) -> float:
+  connection = socket.create_connection(("127.0.0.1", port))
+  dispatcher = Dispatcher(connection, lambda message: None)
+  dispatcher.start()
+  start = time.perf_counter()
+  for future in [dispatcher.request(message) for message in messages]:
+    future.result(60)
+  elapsed = time.perf_counter() - start
+  connection.close()
+  return elapsed
+
+def registrations(prefix: str, count: int) -> list[dict[str, Any]]:
+  return [{
+    "type": MessageType.REGISTER_REQUEST.name,
+    "username": f"{prefix}-{i}",
+    "password": f"{prefix}-{i}"
+  } for i in range(count)]
+
+def measure(port: int, requests: int, prefix: str) -> dict[str, Any]:
+  whoami = [{"type": MessageType.WHOAMI_REQUEST.name} for _ in range(requests)]
+  return {
+    "whoami_lockstep_ms": lockstep(port, whoami) * 1000,
+    "whoami_pipelined_ms": pipelined(port, whoami) * 1000,
+    "register_lockstep_ms": lockstep(port, registrations(f"{prefix}-lockstep", requests)) * 1000,
+    "register_pipelined_ms": pipelined(port, registrations(f"{prefix}-pipelined", requests)) * 1000,
+  }
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="lockstep vs pipelined requests over a link with artificial latency")
+  parser.add_argument("--engines", nargs="+", default=["thread", "asyncio"])
+  parser.add_argument("--port", type=int, default=23700)
+  parser.add_argument("--rtt", type=float, nargs="+", default=[0.0, 0.02, 0.1])
+  parser.add_argument("--requests", type=int, default=20)
+  args = parser.parse_args()
+  for engine in args.engines:
+    with tempfile.TemporaryDirectory() as workdir:
+      process, port = start_server(engine, args.port, workdir, "--log-level", "warning")
+      try:
+        for rtt in args.rtt:
+          proxy = start_proxy(port, rtt)
+          result = measure(proxy, args.requests, f"{engine}-{rtt}")
+          print(json.dumps({"engine": engine, "rtt_ms": rtt * 1000, "requests": args.requests, **result}))
+      finally:
+        process.terminate()
+        process.wait()
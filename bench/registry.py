@@ -0,0 +1,76 @@
+import argparse
+import json
+import time
+from typing import Any
+
+from lib.registry import RoomRegistry
+from lib.user import User
+
+class BenchRoom:
+  __id_counter: int = 0
+  id: int
+  owner: User
+  users: list[User]
+  is_full = False
+
+  def __init__(self, creator: User) -> None:
+    self.id = BenchRoom.__id_counter
+    BenchRoom.__id_counter += 1
+    self.owner = creator
+    self.users = [creator]
+
+  def add_user(self, user: User) -> None:
+    self.users.append(user)
+
+  def remove_user(self, user: User) -> None:
+    self.users.remove(user)
+
+  def has_user(self, user: User) -> bool:
+    return len(list(filter(lambda u : u.name == user.name, self.users))) != 0
+
+def legacy_join_leave(rooms: list[Any], room_id: int, user: User) -> None:
+  room = next(filter(lambda room : room.id == room_id, rooms))
+  room.add_user(user)
+  for active_room in rooms:
+    if active_room.owner.name == user.name:
+      break
+    elif active_room.has_user(user):
+      active_room.remove_user(user)
+
+def indexed_join_leave(registry: RoomRegistry, room_id: int, user: User) -> None:
+  room = registry.get(room_id)
+  assert room
+  registry.join(room, user)
+  member_room = registry.by_member(user.name)
+  assert member_room
+  registry.leave(member_room, user)
+
+def run(room_count: int, operations: int) -> dict[str, Any]:
+  rooms = [BenchRoom(User(f"owner-{i}", None)) for i in range(room_count)]
+  registry = RoomRegistry()
+  for room in rooms:
+    registry.add(room)
+  guest = User("guest", None)
+  targets = [rooms[(i * 7919) % room_count].id for i in range(operations)]
+  start = time.perf_counter()
+  for room_id in targets:
+    indexed_join_leave(registry, room_id, guest)
+  indexed = (time.perf_counter() - start) / operations
+  legacy_operations = max(1, min(operations, 2_000_000 // room_count))
+  start = time.perf_counter()
+  for room_id in targets[:legacy_operations]:
+    legacy_join_leave(rooms, room_id, guest)
+  legacy = (time.perf_counter() - start) / legacy_operations
+  return {
+    "rooms": room_count,
+    "indexed_join_leave_us": indexed * 1e6,
+    "list_scan_join_leave_us": legacy * 1e6,
+  }
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="join/leave cost of RoomRegistry against list scans")
+  parser.add_argument("--rooms", type=int, nargs="+", default=[10, 100, 1_000, 10_000, 100_000])
+  parser.add_argument("--operations", type=int, default=20_000)
+  args = parser.parse_args()
+  for room_count in args.rooms:
+    print(json.dumps(run(room_count, args.operations)))
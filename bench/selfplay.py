@@ -0,0 +1,108 @@
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import time
+from typing import Any, Callable
+
+from lib.room import Room
+from lib.user import User
+from uno.uno import COLORS, UnoCard, UnoPlayer
+
+ACTION_RANK: dict[int | str, int] = {"+4": 5, "+2": 4, "skip": 3, "reverse": 3, "wildcard": 0}
+
+def random_move(player: UnoPlayer, playable: list[int], rng: random.Random) -> tuple[int, str | None]:
+  card_index = rng.choice(playable)
+  new_color = rng.choice(COLORS) if player.hand[card_index].color == "black" else None
+  return card_index, new_color
+
+def greedy_move(player: UnoPlayer, playable: list[int], rng: random.Random) -> tuple[int, str | None]:
+  def rank(card: UnoCard) -> int:
+    card_type = card.card_type
+    return ACTION_RANK.get(card_type, 1) * 10 + (card_type if type(card_type) is int else 0)
+  card_index = max(playable, key=lambda i: rank(player.hand[i]))
+  if player.hand[card_index].color != "black":
+    return card_index, None
+  counts = {color: 0 for color in COLORS}
+  for card in player.hand:
+    if card.color in counts:
+      counts[card.color] += 1
+  return card_index, max(COLORS, key=lambda color: counts[color])
+
+STRATEGIES: dict[str, Callable[[UnoPlayer, list[int], random.Random], tuple[int, str | None]]] = {
+  "random": random_move,
+  "greedy": greedy_move,
+}
+
+def play_game(players: int, strategy: str, rng: random.Random) -> int:
+  users = [User(f"bot-{i}", None) for i in range(players)]
+  room = Room(users[0], players)
+  for user in users[1:]:
+    room.add_user(user)
+  game = room.game
+  choose = STRATEGIES[strategy]
+  moves = 0
+  while game.is_active:
+    current_player = game.current_player
+    current_card = game.current_card
+    playable = [i for (i, card) in enumerate(current_player.hand) if current_card.playable(card)]
+    if playable and current_player.can_play(current_card):
+      card_index, new_color = choose(current_player, playable, rng)
+      game.play(player=current_player.player_id, card=card_index, new_color=new_color)
+    else:
+      game.play(player=current_player.player_id, card=None)
+    moves += 1
+  return moves
+
+def play_games(players: int, strategy: str, games: int, seed: int) -> tuple[list[int], list[int]]:
+  rng = random.Random(seed)
+  durations = []
+  moves = []
+  for _ in range(games):
+    start = time.perf_counter_ns()
+    moves.append(play_game(players, strategy, rng))
+    durations.append(time.perf_counter_ns() - start)
+  return durations, moves
+
+def percentiles(values: list[float]) -> dict[str, float]:
+  ordered = sorted(values)
+  pick = lambda fraction: ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+  return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99)}
+
+def run(players: int, strategy: str, games: int, processes: int, seed: int) -> dict[str, Any]:
+  chunks = [games // processes + (1 if i < games % processes else 0) for i in range(processes)]
+  jobs = [(players, strategy, chunk, seed * 1_000_003 + i) for (i, chunk) in enumerate(chunks) if chunk]
+  start = time.perf_counter()
+  if processes == 1:
+    results = [play_games(*job) for job in jobs]
+  else:
+    with multiprocessing.Pool(processes) as pool:
+      results = pool.starmap(play_games, jobs)
+  elapsed = time.perf_counter() - start
+  durations = [duration for (chunk_durations, _) in results for duration in chunk_durations]
+  moves = [count for (_, chunk_moves) in results for count in chunk_moves]
+  per_move = [duration / count for (duration, count) in zip(durations, moves)]
+  return {
+    "players": players,
+    "strategy": strategy,
+    "processes": processes,
+    "games": len(moves),
+    "games_per_sec": len(moves) / elapsed,
+    "moves_per_sec": sum(moves) / elapsed,
+    "moves_per_game": percentiles(moves),
+    "game_us": {key: value / 1000 for (key, value) in percentiles(durations).items()},
+    "move_us": {key: value / 1000 for (key, value) in percentiles(per_move).items()},
+  }
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="headless self-play throughput of Room/UnoGame")
+  parser.add_argument("--players", type=int, nargs="+", default=[2, 4, 6, 8, 10])
+  parser.add_argument("--games", type=int, default=20_000)
+  parser.add_argument("--strategy", choices=list(STRATEGIES), default="random")
+  parser.add_argument("--processes", type=int, default=1, help="0 uses every core")
+  parser.add_argument("--seed", type=int, default=0)
+  args = parser.parse_args()
+  processes = args.processes or os.cpu_count() or 1
+  for players in args.players:
+    print(json.dumps(run(players, args.strategy, args.games, processes, args.seed)))
@@ -0,0 +1,54 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import tempfile
+from typing import Any
+
+from bench.engines import process_stats, start_server
+from bench.loadgen import run as run_load
+
+def drive(port: int, connections: int, players: int, duration: float, codec: str) -> dict[str, Any]:
+  return asyncio.run(run_load("127.0.0.1", port, connections, players, duration, codec))
+
+def run(workers: int, port: int, clients: int, connections: int, players: int, duration: float, codec: str) -> dict[str, Any]:
+  with tempfile.TemporaryDirectory() as workdir:
+    process, port = start_server("thread", port, workdir, "--workers", str(workers), "--log-level", "warning")
+    try:
+      with multiprocessing.Pool(clients) as pool:
+        results = pool.starmap(drive, [(port, connections // clients, players, duration, codec)] * clients)
+      children = [int(pid) for pid in open(f"/proc/{process.pid}/task/{process.pid}/children").read().split()]
+      rss_kb = sum(process_stats(pid).get("rss_kb", 0) for pid in children)
+    finally:
+      process.terminate()
+      process.wait()
+  elapsed = max(result["duration_s"] for result in results)
+  moves = sum(result["move"]["count"] for result in results)
+  errors: dict[str, int] = {}
+  for result in results:
+    for (kind, count) in result["errors"].items():
+      errors[kind] = errors.get(kind, 0) + count
+  return {
+    "workers": workers,
+    "cores": os.cpu_count(),
+    "connections": sum(result["connections"] for result in results),
+    "games_per_sec": sum(result["games"] for result in results) / elapsed,
+    "moves_per_sec": moves / elapsed,
+    "p99_move_ms": max(result["move"]["p99_ms"] for result in results),
+    "rss_kb": rss_kb,
+    "errors": errors,
+  }
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="move throughput of the sharded server by worker count")
+  parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+  parser.add_argument("--port", type=int, default=24567)
+  parser.add_argument("--clients", type=int, default=4, help="load generator processes")
+  parser.add_argument("--connections", type=int, default=256)
+  parser.add_argument("--players", type=int, default=4)
+  parser.add_argument("--duration", type=float, default=15.0)
+  parser.add_argument("--codec", choices=["json", "binary"], default="json")
+  args = parser.parse_args()
+  for workers in args.workers:
+    print(json.dumps(run(workers, args.port, args.clients, args.connections, args.players, args.duration, args.codec)))
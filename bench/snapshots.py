@@ -0,0 +1,74 @@
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from typing import Any
+
+from lib.registry import RoomRegistry
+from lib.room import Room
+from lib.snapshots import SnapshotWriter, read_snapshot
+from lib.user import User
+
+def build_rooms(count: int, players: int, moves: int, rng: random.Random) -> list[Room]:
+  rooms = []
+  for i in range(count):
+    users = [User(f"snap-{i}-{j}", None) for j in range(players)]
+    room = Room(users[0], players)
+    for user in users[1:]:
+      room.add_user(user)
+    game = room.game
+    for _ in range(moves):
+      current_player = game.current_player
+      playable = [i for (i, card) in enumerate(current_player.hand) if game.current_card.playable(card)]
+      if not playable:
+        game.play(current_player.player_id)
+        continue
+      card_index = rng.choice(playable)
+      game.play(current_player.player_id, card_index, "red" if current_player.hand[card_index].color == "black" else None)
+      if not game.is_active:
+        break
+    rooms.append(room)
+  return rooms
+
+def run(count: int, players: int, moves: int, seed: int) -> dict[str, Any]:
+  rooms = [room for room in build_rooms(count, players, moves, random.Random(seed)) if room.game.is_active]
+  with tempfile.TemporaryDirectory() as workdir:
+    path = os.path.join(workdir, "rooms.snap")
+    writer = SnapshotWriter(path, lambda: rooms)
+    start = time.perf_counter()
+    writer.write()
+    write_s = time.perf_counter() - start
+    size = os.path.getsize(path)
+    start = time.perf_counter()
+    restored = read_snapshot(path)
+    registry = RoomRegistry()
+    for room in restored:
+      registry.add(room)
+    restore_s = time.perf_counter() - start
+  start = time.perf_counter()
+  for room in restored:
+    room.game
+  materialize_s = time.perf_counter() - start
+  mismatches = sum(1 for (room, copy) in zip(rooms, restored) if room.game.state() != copy.game.state())
+  return {
+    "rooms": len(rooms),
+    "players": players,
+    "bytes": size,
+    "bytes_per_room": size / len(rooms),
+    "write_ms": write_s * 1000,
+    "restore_ms": restore_s * 1000,
+    "materialize_all_ms": materialize_s * 1000,
+    "materialize_per_room_us": materialize_s / len(rooms) * 1e6,
+    "mismatches": mismatches,
+  }
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="size and speed of room snapshots and restores")
+  parser.add_argument("--rooms", type=int, default=10_000)
+  parser.add_argument("--players", type=int, default=4)
+  parser.add_argument("--moves", type=int, default=20)
+  parser.add_argument("--seed", type=int, default=0)
+  args = parser.parse_args()
+  print(json.dumps(run(args.rooms, args.players, args.moves, args.seed)))
@@ -0,0 +1,97 @@
+import argparse
+import json
+import multiprocessing
+import selectors
+import socket
+import tempfile
+import time
+from typing import Any
+
+from bench.engines import login, percentile, start_server, wait_for
+from lib.proto import MessageType, recv_message, send_and_recv_message, send_message
+
+def watch(port: int, room_id: int, count: int, ready: Any, stop: Any, frames: Any) -> None:
+  selector = selectors.DefaultSelector()
+  for _ in range(count):
+    connection = socket.create_connection(("127.0.0.1", port))
+    response = send_and_recv_message(connection, {
+      "type": MessageType.SPECTATE_REQUEST.name,
+      "room_id": room_id
+    })
+    assert response["type"] == MessageType.OK.name
+    connection.setblocking(False)
+    selector.register(connection, selectors.EVENT_READ)
+  ready.set()
+  received = 0
+  while not stop.is_set():
+    for (key, _) in selector.select(0.1):
+      try:
+        received += len(key.fileobj.recv(1 << 16))
+      except BlockingIOError:
+        pass
+  frames.value = received
+
+def measure(port: int, spectators: int, moves: int, prefix: str) -> dict[str, Any]:
+  owner = login(port, f"{prefix}-a", "binary")
+  guest = login(port, f"{prefix}-b", "binary")
+  room_id = send_and_recv_message(owner, {
+    "type": MessageType.ROOM_CREATION_REQUEST.name,
+    "player_count": 2
+  })["room_id"]
+  ready = multiprocessing.Event()
+  stop = multiprocessing.Event()
+  received = multiprocessing.Value("q", 0)
+  watcher = multiprocessing.Process(target=watch, args=[port, room_id, spectators, ready, stop, received])
+  watcher.start()
+  ready.wait()
+  send_message(guest, {
+    "type": MessageType.ROOM_CONNECTION_REQUEST.name,
+    "room_id": room_id
+  })
+  players = [owner, guest]
+  states = [wait_for(connection, MessageType.GAME_START_UPDATE) for connection in players]
+  if states[0]["id"] != 0:
+    players.reverse()
+    states.reverse()
+  turn = states[0]["turn"]
+  latencies = []
+  start = time.perf_counter()
+  for _ in range(moves):
+    sent = time.perf_counter()
+    send_message(players[turn], {
+      "type": MessageType.DRAW_CARD_REQUEST.name
+    })
+    update = recv_message(players[turn])
+    latencies.append(time.perf_counter() - sent)
+    recv_message(players[1 - turn])
+    turn = update["turn"]
+  elapsed = time.perf_counter() - start
+  time.sleep(0.5)
+  stop.set()
+  watcher.join()
+  owner.close()
+  guest.close()
+  return {
+    "spectators": spectators,
+    "moves_per_sec": moves / elapsed,
+    "move_p50_ms": percentile(latencies, 0.50) * 1000,
+    "move_p99_ms": percentile(latencies, 0.99) * 1000,
+    "spectator_bytes": received.value,
+  }
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="move latency on one room as the number of spectators grows")
+  parser.add_argument("--engines", nargs="+", default=["thread", "asyncio"])
+  parser.add_argument("--port", type=int, default=23600)
+  parser.add_argument("--spectators", type=int, nargs="+", default=[0, 100, 1000])
+  parser.add_argument("--moves", type=int, default=2000)
+  args = parser.parse_args()
+  for engine in args.engines:
+    with tempfile.TemporaryDirectory() as workdir:
+      process, port = start_server(engine, args.port, workdir, "--log-level", "warning", "--turn-timeout", "0")
+      try:
+        for spectators in args.spectators:
+          print(json.dumps({"engine": engine, **measure(port, spectators, args.moves, f"{engine}-{spectators}")}))
+      finally:
+        process.terminate()
+        process.wait()
@@ -0,0 +1,151 @@
+import argparse
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Any
+
+from peewee import fn
+
+from lib.proto import HEADER_SIZE, MessageType, decode_frame
+from lib.user import User
+
+class CaptureConnection:
+  __lock: threading.Lock
+  messages: list[dict[str, Any]]
+
+  def __init__(self) -> None:
+    self.__lock = threading.Lock()
+    self.messages = []
+
+  def sendmsg(self, buffers: list[bytes | memoryview]) -> int:
+    frame = b"".join(buffers)
+    with self.__lock:
+      self.messages.append(decode_frame(frame[HEADER_SIZE:]))
+    return len(frame)
+
+  def sendall(self, data: bytes | memoryview) -> None:
+    self.sendmsg([data])
+
+  def close(self) -> None:
+    pass
+
+  def last(self, message_type: MessageType) -> dict[str, Any] | None:
+    with self.__lock:
+      return next((message for message in reversed(self.messages) if message["type"] == message_type.name), None)
+
+def play_seat(server: Any, user: User, room: Any, moves: list[int], errors: list[str]) -> None:
+  connection = user.connection
+  while connection.last(MessageType.GAME_END_UPDATE) is None:
+    game = room.game
+    current_player = game.current_player
+    message: dict[str, Any] = {"card_index": 0, "color": "red"}
+    if current_player.player_id == user.id:
+      for (i, card) in enumerate(list(current_player.hand)):
+        if game.current_card.playable(card):
+          message["card_index"] = i
+          break
+      else:
+        message = {}
+    try:
+      if message:
+        server.drop_card(connection, message, user, room)
+      else:
+        server.draw_card(connection, message, user, room)
+      moves[0] += 1
+    except Exception as e:
+      errors.append(repr(e))
+      return
+    if current_player.player_id != user.id:
+      time.sleep(0.001)
+
+def check_room(connections: list[CaptureConnection]) -> list[str]:
+  problems = []
+  sequences = []
+  for connection in connections:
+    versions = [message["version"] for message in connection.messages if message["type"] == MessageType.GAME_UPDATE.name]
+    if versions != list(range(1, len(versions) + 1)):
+      problems.append(f"non-contiguous versions {versions[:10]}")
+    ends = [message for message in connection.messages if message["type"] == MessageType.GAME_END_UPDATE.name]
+    if len(ends) != 1:
+      problems.append(f"expected one game end, got {len(ends)}")
+    sequences.append([
+      (message["version"], message["turn"], json.dumps(message["current_card"]))
+      for message in connection.messages if message["type"] == MessageType.GAME_UPDATE.name
+    ])
+  if any(sequence != sequences[0] for sequence in sequences):
+    problems.append("players saw different update sequences")
+  return problems
+
+def run(server: Any, rooms: int, players: int) -> dict[str, Any]:
+  seats = []
+  for i in range(rooms):
+    users = [User(f"stress-{i}-{j}", CaptureConnection()) for j in range(players)]
+    room = server.create_room(users[0].connection, {"player_count": players}, users[0])
+    for user in users[1:]:
+      server.join_room(user.connection, {"room_id": room.id}, user)
+    seats.append((room, users))
+  for (_, users) in seats:
+    for user in users:
+      server.user_cache.get(user.name)
+  misses = server.user_cache.misses
+  moves = [0]
+  errors: list[str] = []
+  threads = [
+    threading.Thread(target=play_seat, args=[server, user, room, moves, errors])
+    for (room, users) in seats for user in users
+  ]
+  start = time.perf_counter()
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  elapsed = time.perf_counter() - start
+  problems = [problem for (_, users) in seats for problem in check_room([user.connection for user in users])]
+  for (_, users) in seats:
+    end = users[0].connection.last(MessageType.GAME_END_UPDATE)
+    for user in users:
+      profile = server.user_cache.get(user.name)
+      expected = (1, 0) if end and end["winner"] == user.name else (0, 1)
+      if not profile or (profile.wins, profile.losses) != expected:
+        problems.append(f"cached stats for {user.name} do not match the game result")
+  if server.user_cache.misses != misses:
+    problems.append(f"{server.user_cache.misses - misses} cached profiles were reloaded instead of updated in place")
+  accepted = sum(
+    1 for (_, users) in seats for message in users[0].connection.messages
+    if message["type"] in [MessageType.GAME_UPDATE.name, MessageType.GAME_END_UPDATE.name]
+  )
+  return {
+    "rooms": rooms,
+    "players": players,
+    "attempted_moves": moves[0],
+    "accepted_moves": accepted,
+    "accepted_moves_per_sec": accepted / elapsed,
+    "errors": errors[:10],
+    "problems": problems[:10],
+    "live_rooms_after": len(server.active_rooms),
+  }
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="concurrent moves across many rooms against the server handlers")
+  parser.add_argument("--rooms", type=int, default=50)
+  parser.add_argument("--players", type=int, default=4)
+  args = parser.parse_args()
+  workdir = tempfile.mkdtemp()
+  os.chdir(workdir)
+  logging.disable(logging.CRITICAL)
+  import models
+  import server
+  models.open_database("uno.db")
+  models.db.create_tables([models.User])
+  for i in range(args.rooms):
+    for j in range(args.players):
+      models.User.create(username=f"stress-{i}-{j}", password="stress")
+  server.stats_writer.start()
+  result = run(server, args.rooms, args.players)
+  server.stats_writer.stop()
+  result["recorded_wins"] = models.User.select(fn.SUM(models.User.wins)).scalar() or 0
+  result["recorded_losses"] = models.User.select(fn.SUM(models.User.losses)).scalar() or 0
+  print(json.dumps(result))
@@ -1,98 +1,215 @@
-from math import pi
 import socket
 import sys
+import threading
+import time
 from typing import Any
-from lib.proto import MessageType, recv_message, send_and_recv_message, send_message
+from lib.proto import BINARY_CODEC, Dispatcher, MessageType, ZlibCompressor, playable, set_codec, set_compression
 import readline
 from termcolor import colored
 
-def enter_game(connection: socket.socket, message: dict[str, Any]):
-  id = message["id"]
-  while (True):
-    if message["type"] == MessageType.GAME_END_UPDATE.name:
-      print("game ended")
-      print(f"winner: {message['winner']}")
-      break
-    print(f"your hand:")
-    for (i, card) in enumerate(message["hand"]):
-      print(f"{i}. {colored(card["type"], card["color"])}")
-    print("")
-    current_card = message["current_card"]
-    print(f"current card: {colored(current_card["type"], current_card["color"])}")
-    if id == message["turn"]:
-      valid_move = False 
-      while not valid_move:
-        command = input("> ").strip()
-        
-        if command == "draw":
-          response = send_and_recv_message(connection, {
-            "type": MessageType.DRAW_CARD_REQUEST.name
-          })
-          if response["type"] == MessageType.ERROR.name:
-            print("cannot draw card")
-          else:
-            message = response
-            valid_move = True
-          
-        elif command.startswith("play"):
-          card_index = None
-          try:
-            card_index = int(command[5:])
-            message["hand"][card_index]
-          except:
-            print("invalid card index")
-            continue
-          
-          if card_index != None and message["hand"][card_index]["color"] == "black":
-            color = input("color: ")
-            if color not in ["red", "green", "blue", "yellow"]:
-              print("invalid color")
-              continue
-            
-            response = send_and_recv_message(connection, {
-              "type": MessageType.CARD_DROP_REQUEST.name,
-              "card_index": card_index,
-              "color": color
-            })
-            if response["type"] == MessageType.ERROR.name:
-              print("cannot play card")
-            else:
-              message = response
-              valid_move = True
-              break
-            
-          elif card_index != None:
-            response = send_and_recv_message(connection, {
-              "type": MessageType.CARD_DROP_REQUEST.name,
-              "card_index": card_index
-            })
-            if response["type"] == MessageType.ERROR.name:
-              print("cannot play card")
-            else:
-              message = response
-              valid_move = True
-        
-        else:
-          print("invalid command")
-        
-    else:
-      message = recv_message(connection)
+REQUEST_TIMEOUT = 30.0
+HEARTBEAT_INTERVAL = 60.0
+COLORS = ["red", "green", "blue", "yellow"]
 
-def wait_for_game_start(connection: socket.socket):
-  while (True):
-    message = recv_message(connection)
+class GameMirror:
+  __dispatcher: Dispatcher | None
+  __condition: threading.Condition
+  __state: dict[str, Any] | None
+  __resyncing: bool
+  __ended: bool
+  __closed: bool
+
+  def __init__(self) -> None:
+    self.__dispatcher = None
+    self.__condition = threading.Condition()
+    self.__state = None
+    self.__resyncing = False
+    self.__ended = False
+    self.__closed = False
+
+  def attach(self, dispatcher: Dispatcher) -> None:
+    self.__dispatcher = dispatcher
+
+  def reset(self) -> None:
+    with self.__condition:
+      self.__state = None
+      self.__resyncing = False
+      self.__ended = False
+      self.__closed = False
+
+  @property
+  def finished(self) -> bool:
+    return self.__ended or self.__closed
+
+  @property
+  def my_turn(self) -> bool:
+    with self.__condition:
+      return self.__state is not None and self.__state["turn"] == self.__state["id"]
+
+  def card(self, card_index: int) -> dict[str, Any] | None:
+    with self.__condition:
+      if self.__state is None or not 0 <= card_index < len(self.__state["hand"]):
+        return None
+      return self.__state["hand"][card_index]
+
+  def check_play(self, card_index: int) -> str | None:
+    with self.__condition:
+      if self.__state is None or self.__resyncing:
+        return "waiting for game state"
+      if self.__state["turn"] != self.__state["id"]:
+        return "not your turn"
+      if not 0 <= card_index < len(self.__state["hand"]):
+        return "invalid card index"
+      if not playable(self.__state["hand"][card_index], self.__state["current_card"]):
+        return "card does not match the current card"
+      return None
+
+  def wait_for_game_start(self) -> bool:
+    with self.__condition:
+      self.__condition.wait_for(lambda: self.__state is not None or self.finished)
+      return self.__state is not None
+
+  def handle(self, message: dict[str, Any]) -> None:
     if message["type"] == MessageType.ROOM_JOIN_UPDATE.name:
-      max_player_count = message["max_player_count"]
-      current_player_count = message["current_player_count"]
-      joined_username = message["username"]
-      print(f"{joined_username} join the room")
-      print(f"{current_player_count}/{max_player_count} joined")
-    elif message["type"] == MessageType.GAME_START_UPDATE.name: 
-      enter_game(connection, message)
-      break
+      print(f"{message['username']} join the room")
+      print(f"{message['current_player_count']}/{message['max_player_count']} joined")
+    elif message["type"] == MessageType.GAME_START_UPDATE.name:
+      with self.__condition:
+        self.__state = message
+        self.__condition.notify_all()
+      self.render()
+    elif message["type"] == MessageType.GAME_UPDATE.name:
+      with self.__condition:
+        if self.__state is None and "hand" in message:
+          self.__state = message
+          self.__condition.notify_all()
+        elif self.__state is None or not self.__apply(message):
+          return
+      self.render()
+    elif message["type"] == MessageType.GAME_END_UPDATE.name:
+      print("game ended")
+      print(f"winner: {message['winner']}")
+      print("press enter to continue")
+      with self.__condition:
+        self.__ended = True
+        self.__condition.notify_all()
     elif message["type"] == MessageType.ROOM_CLOSE_UPDATE.name:
       print("room closed")
+      with self.__condition:
+        self.__closed = True
+        self.__condition.notify_all()
+
+  def handle_close(self, error: Exception) -> None:
+    print(f"disconnected: {error}")
+    with self.__condition:
+      self.__closed = True
+      self.__condition.notify_all()
+
+  def render(self) -> None:
+    with self.__condition:
+      if self.__state is None:
+        return
+      state = self.__state
+      print("your hand:")
+      for (i, card) in enumerate(state["hand"]):
+        print(f"{i}. {colored(card['type'], card['color'])}")
+      print("")
+      current_card = state["current_card"]
+      print(f"current card: {colored(current_card['type'], current_card['color'])}")
+      print("your turn" if state["turn"] == state["id"] else f"waiting for player {state['turn']}")
+
+  def __apply(self, message: dict[str, Any]) -> bool:
+    assert self.__state is not None
+    if "hand" in message:
+      self.__state = {**self.__state, **message}
+      self.__resyncing = False
+      return True
+    if self.__resyncing:
+      return False
+    if message["version"] != self.__state["version"] + 1:
+      assert self.__dispatcher is not None
+      self.__resyncing = True
+      self.__dispatcher.request({
+        "type": MessageType.RESYNC_REQUEST.name
+      })
+      return False
+    hand = self.__state["hand"]
+    for card_index in sorted(message["removed"], reverse=True):
+      hand.pop(card_index)
+    hand.extend(message["added"])
+    self.__state["version"] = message["version"]
+    self.__state["turn"] = message["turn"]
+    self.__state["current_card"] = message.get("current_card", self.__state["current_card"])
+    return True
+
+def keep_alive(dispatcher: Dispatcher) -> None:
+  while (True):
+    time.sleep(HEARTBEAT_INTERVAL)
+    try:
+      dispatcher.request({
+        "type": MessageType.HEARTBEAT_REQUEST.name
+      })
+    except OSError:
+      return
+
+def enter_game(dispatcher: Dispatcher, mirror: GameMirror):
+  while not mirror.finished:
+    command = input("> ").strip()
+    if mirror.finished:
       break
+    if command == "hand":
+      mirror.render()
+
+    elif command == "draw":
+      if not mirror.my_turn:
+        print("not your turn")
+        continue
+      response = dispatcher.call({
+        "type": MessageType.DRAW_CARD_REQUEST.name
+      }, REQUEST_TIMEOUT)
+      if response["type"] == MessageType.ERROR.name:
+        print("cannot draw card")
+
+    elif command.startswith("play"):
+      try:
+        card_index = int(command[5:])
+      except:
+        print("invalid card index")
+        continue
+      error = mirror.check_play(card_index)
+      if error:
+        print(error)
+        continue
+      request = {
+        "type": MessageType.CARD_DROP_REQUEST.name,
+        "card_index": card_index
+      }
+      card = mirror.card(card_index)
+      if card and card["color"] == "black":
+        color = input("color: ")
+        if color not in COLORS:
+          print("invalid color")
+          continue
+        request["color"] = color
+      response = dispatcher.call(request, REQUEST_TIMEOUT)
+      if response["type"] == MessageType.ERROR.name:
+        print("cannot play card")
+
+    else:
+      print("invalid command")
+
+def wait_for_game_start(dispatcher: Dispatcher, mirror: GameMirror):
+  if mirror.wait_for_game_start():
+    enter_game(dispatcher, mirror)
+  mirror.reset()
+
+def resume_game(dispatcher: Dispatcher, mirror: GameMirror):
+  response = dispatcher.call({
+    "type": MessageType.RESYNC_REQUEST.name
+  }, REQUEST_TIMEOUT)
+  if response["type"] == MessageType.GAME_UPDATE.name:
+    print("rejoined your game")
+    wait_for_game_start(dispatcher, mirror)
 
 if __name__ == "__main__":
   server_ip = "127.0.0.1"
@@ -102,57 +219,85 @@ if __name__ == "__main__":
   server_address = (server_ip, server_port)
   connection = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
   try:
-    connection.connect(server_address)  
-    while (True):    
+    connection.connect(server_address)
+    mirror = GameMirror()
+    dispatcher = Dispatcher(connection, mirror.handle, mirror.handle_close)
+    mirror.attach(dispatcher)
+    dispatcher.start()
+    threading.Thread(target=keep_alive, daemon=True, args=[dispatcher]).start()
+    while (True):
       command = input("> ").strip()
       if (command == "help"):
         print("login - login to the server")
         print("register - register a new account")
         print("whoami - show the current user")
+        print("leaderboard - show the top players by wins or win rate")
         print("logout - logout from the server")
         print("new room - create a new room")
         print("join room - join a room")
         print("exit - exit the program")
         print("help - show this message")
+        print("in game: hand, draw, play <card index>")
       elif (command == "login"):
         username = input("username: ")
         password = input("password: ")
-        response = send_and_recv_message(connection, {
+        response = dispatcher.call({
           "type": MessageType.LOGIN_REQUEST.name,
           "username": username,
           "password": password,
-        })
+          "codec": BINARY_CODEC.name,
+          "delta": True,
+          "compression": ZlibCompressor.name,
+        }, REQUEST_TIMEOUT)
         if response["type"] == MessageType.ERROR.name:
           print("login failed")
         else:
+          if "codec" in response:
+            set_codec(connection, response["codec"])
+          if "compression" in response:
+            set_compression(connection, response["compression"])
           print("logged in successfully")
+          resume_game(dispatcher, mirror)
       elif (command == "register"):
         username = input("username: ")
         password = input("password: ")
-        send_message(connection, {
+        response = dispatcher.call({
           "type": MessageType.REGISTER_REQUEST.name,
           "username": username,
           "password": password
-        })
-        response = recv_message(connection)
+        }, REQUEST_TIMEOUT)
         if response["type"] == MessageType.ERROR.name:
           print("register failed")
         else:
           print("registered successfully")
       elif (command == "whoami"):
-        response = send_and_recv_message(connection, {
+        response = dispatcher.call({
           "type": MessageType.WHOAMI_REQUEST.name
-        })
+        }, REQUEST_TIMEOUT)
         if response["type"] == MessageType.ERROR.name:
           print("failed to get user information")
         else:
           print(f"{response['username']}")
           print(f"wins: {response['wins']}")
           print(f"losses: {response['losses']}")
+      elif (command == "leaderboard"):
+        order = input("order (wins/win_rate): ").strip() or "wins"
+        response = dispatcher.call({
+          "type": MessageType.LEADERBOARD_REQUEST.name,
+          "order": order,
+          "limit": 10
+        }, REQUEST_TIMEOUT)
+        if response["type"] == MessageType.ERROR.name:
+          print("failed to get leaderboard")
+        else:
+          for entry in response["entries"]:
+            print(f"{entry['rank']}. {entry['username']} {entry['wins']}W {entry['losses']}L")
+          if response.get("rank") is not None:
+            print(f"your rank: {response['rank']}")
       elif (command == "logout"):
-        response = send_and_recv_message(connection, {
+        response = dispatcher.call({
           "type": MessageType.LOGOUT_REQUEST.name
-        })
+        }, REQUEST_TIMEOUT)
         if response["type"] == MessageType.ERROR.name:
           print("failed to logout")
         else:
@@ -163,14 +308,14 @@ if __name__ == "__main__":
         except:
           print("invalid player count")
           continue
-        response = send_and_recv_message(connection, {
+        response = dispatcher.call({
           "type": MessageType.ROOM_CREATION_REQUEST.name,
           "player_count": player_count,
-        })
+        }, REQUEST_TIMEOUT)
         if response["type"] == MessageType.OK.name:
           print(f"room created successfully with id {response['room_id']}")
           print(f"1/{player_count} joined")
-          wait_for_game_start(connection)
+          wait_for_game_start(dispatcher, mirror)
         else:
           print("failed to create room")
       elif (command == "exit"):
@@ -182,18 +327,17 @@ if __name__ == "__main__":
         except:
           print("invalid room id")
           continue
-        response = send_and_recv_message(connection, {
+        response = dispatcher.call({
           "type": MessageType.ROOM_CONNECTION_REQUEST.name,
-          "room_id": room_id 
-        })
+          "room_id": room_id
+        }, REQUEST_TIMEOUT)
         if response["type"] == MessageType.ERROR.name:
           print(f"cannot join room with id {room_id}")
           continue
         print(f"joined room with id {room_id}")
-        print(f"{response["current_player_count"]}/{response["max_player_count"]} joined")
-        wait_for_game_start(connection)
+        wait_for_game_start(dispatcher, mirror)
       else:
         print("invalid command")
   except Exception as e:
     connection.close()
-    print(e)
\ No newline at end of file
+    print(e)
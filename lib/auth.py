@@ -0,0 +1,88 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+import hashlib
+import hmac
+import os
+import threading
+import time
+
+from lib.metrics import metrics
+import models
+
+SCRYPT_N = 1 << 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+HASH_PREFIX = "scrypt"
+
+def hash_password(password: str) -> str:
+  salt = os.urandom(16)
+  digest = hashlib.scrypt(password.encode('utf-8'), salt=salt, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P, dklen=32)
+  return f"{HASH_PREFIX}${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${salt.hex()}${digest.hex()}"
+
+def is_hashed(stored: str) -> bool:
+  return stored.startswith(f"{HASH_PREFIX}$")
+
+def verify_password(password: str, stored: str) -> bool:
+  if not is_hashed(stored):
+    return hmac.compare_digest(stored.encode('utf-8'), password.encode('utf-8'))
+  _, n, r, p, salt, digest = stored.split("$")
+  expected = bytes.fromhex(digest)
+  candidate = hashlib.scrypt(
+    password.encode('utf-8'), salt=bytes.fromhex(salt), n=int(n), r=int(r), p=int(p), dklen=len(expected)
+  )
+  return hmac.compare_digest(candidate, expected)
+
+class Authenticator:
+  __pool: ThreadPoolExecutor
+  __cache: dict[str, tuple[bytes, float]]
+  __cache_lock: threading.Lock
+  __cache_ttl: float
+  __cache_size: int
+  __key: bytes
+
+  def __init__(self, workers: int | None = None, cache_ttl: float = 30.0, cache_size: int = 100_000) -> None:
+    self.__pool = ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1, thread_name_prefix="auth")
+    self.__cache = {}
+    self.__cache_lock = threading.Lock()
+    self.__cache_ttl = cache_ttl
+    self.__cache_size = cache_size
+    self.__key = os.urandom(32)
+
+  def hash(self, password: str) -> Future[str]:
+    return self.__pool.submit(hash_password, password)
+
+  def verify(self, username: str, password: str) -> Future[bool]:
+    token = hmac.new(self.__key, password.encode('utf-8'), hashlib.sha256).digest()
+    with self.__cache_lock:
+      entry = self.__cache.get(username)
+    if entry and entry[1] > time.monotonic() and hmac.compare_digest(entry[0], token):
+      metrics.increment("auth_cache_hits_total")
+      future: Future[bool] = Future()
+      future.set_result(True)
+      return future
+    return self.__pool.submit(self.__verify, username, password, token)
+
+  def forget(self, username: str) -> None:
+    with self.__cache_lock:
+      self.__cache.pop(username, None)
+
+  def shutdown(self) -> None:
+    self.__pool.shutdown(wait=True)
+
+  def __verify(self, username: str, password: str, token: bytes) -> bool:
+    with metrics.timer("db_seconds", operation="load_user"), models.db.atomic():
+      user = models.User.get_or_none(models.User.username == username)
+    if not user or not verify_password(password, user.password):
+      return False
+    if not is_hashed(user.password):
+      with metrics.timer("db_seconds", operation="rehash_password"), models.db.atomic():
+        models.User.update(password=hash_password(password)).where(models.User.id == user.id).execute()
+    now = time.monotonic()
+    with self.__cache_lock:
+      if len(self.__cache) >= self.__cache_size:
+        for (cached_username, (_, expires_at)) in list(self.__cache.items()):
+          if expires_at <= now:
+            del self.__cache[cached_username]
+        while len(self.__cache) >= self.__cache_size:
+          del self.__cache[next(iter(self.__cache))]
+      self.__cache[username] = (token, now + self.__cache_ttl)
+    return True
@@ -0,0 +1,126 @@
+import logging
+import queue
+import struct
+import threading
+import time
+from typing import Iterator
+
+from lib.room import Room
+from uno.uno import COLORS
+
+MAGIC = b"UNOJ\x01"
+NONE = 0xFF
+
+START = 0
+MOVE = 1
+END = 2
+RESTORE = 3
+
+HEADER = struct.Struct(">BQd")
+START_BODY = struct.Struct(">BQ")
+MOVE_BODY = struct.Struct(">BBBB")
+END_BODY = struct.Struct(">B")
+RESTORE_BODY = struct.Struct(">QH")
+
+logger = logging.getLogger("journal")
+
+class Journal:
+  __path: str
+  __queue: queue.SimpleQueue
+  __thread: threading.Thread | None
+  __batch_size: int
+
+  def __init__(self, path: str, batch_size: int = 4096) -> None:
+    self.__path = path
+    self.__queue = queue.SimpleQueue()
+    self.__thread = None
+    self.__batch_size = batch_size
+
+  def record_start(self, room: Room) -> None:
+    self.__queue.put(HEADER.pack(START, room.id, time.time()) + START_BODY.pack(room.max_player_count, room.seed))
+
+  def record_restore(self, room: Room) -> None:
+    state = room.game_state()
+    self.__queue.put(HEADER.pack(RESTORE, room.id, time.time()) + RESTORE_BODY.pack(room.seed, len(state)) + state)
+
+  def record_move(self, room_id: int, player: int, card_index: int | None, card_code: int | None, color: str | None) -> None:
+    self.__queue.put(HEADER.pack(MOVE, room_id, time.time()) + MOVE_BODY.pack(
+      player,
+      NONE if card_index is None else card_index,
+      NONE if card_code is None else card_code,
+      NONE if color is None else COLORS.index(color),
+    ))
+
+  def record_end(self, room_id: int, winner: int) -> None:
+    self.__queue.put(HEADER.pack(END, room_id, time.time()) + END_BODY.pack(winner))
+
+  @property
+  def queued(self) -> int:
+    return self.__queue.qsize()
+
+  def start(self) -> None:
+    self.__thread = threading.Thread(target=self.__run, daemon=True)
+    self.__thread.start()
+
+  def stop(self) -> None:
+    if self.__thread:
+      self.__queue.put(None)
+      self.__thread.join()
+      self.__thread = None
+
+  def __run(self) -> None:
+    with open(self.__path, "ab") as journal:
+      if journal.tell() == 0:
+        journal.write(MAGIC)
+      running = True
+      while running:
+        batch = [self.__queue.get()]
+        while len(batch) < self.__batch_size and not self.__queue.empty():
+          batch.append(self.__queue.get())
+        if None in batch:
+          running = False
+          batch = [record for record in batch if record is not None]
+        try:
+          journal.write(b"".join(batch))
+          journal.flush()
+        except Exception as e:
+          logger.error("failed to write %d journal records: %s", len(batch), e)
+
+def read_journal(data: bytes | memoryview) -> Iterator[tuple]:
+  if bytes(data[:len(MAGIC)]) != MAGIC:
+    raise ValueError("not a move journal")
+  view = memoryview(data)
+  offset = len(MAGIC)
+  try:
+    yield from read_records(view, offset)
+  except struct.error:
+    logger.warning("journal ends with a truncated record")
+
+def read_records(view: memoryview, offset: int) -> Iterator[tuple]:
+  while offset + HEADER.size <= len(view):
+    kind, room_id, timestamp = HEADER.unpack_from(view, offset)
+    offset += HEADER.size
+    if kind == START:
+      players, seed = START_BODY.unpack_from(view, offset)
+      offset += START_BODY.size
+      yield (START, room_id, timestamp, players, seed)
+    elif kind == MOVE:
+      player, card_index, card_code, color = MOVE_BODY.unpack_from(view, offset)
+      offset += MOVE_BODY.size
+      yield (
+        MOVE, room_id, timestamp, player,
+        None if card_index == NONE else card_index,
+        None if card_code == NONE else card_code,
+        None if color == NONE else COLORS[color],
+      )
+    elif kind == END:
+      (winner,) = END_BODY.unpack_from(view, offset)
+      offset += END_BODY.size
+      yield (END, room_id, timestamp, winner)
+    elif kind == RESTORE:
+      seed, state_length = RESTORE_BODY.unpack_from(view, offset)
+      offset += RESTORE_BODY.size
+      yield (RESTORE, room_id, timestamp, seed, bytes(view[offset:offset + state_length]))
+      offset += state_length
+    else:
+      raise ValueError(f"unknown journal record {kind} at offset {offset - HEADER.size}")
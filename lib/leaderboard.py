@@ -0,0 +1,197 @@
+import bisect
+import threading
+from typing import Any
+
+import models
+
+ORDERS = ("wins", "win_rate")
+
+def ranking_score(order: str, wins: int, losses: int) -> int | None:
+  if order == "wins":
+    return wins
+  if wins + losses < models.MIN_RATED_GAMES:
+    return None
+  return wins * models.RATE_SCALE // (wins + losses)
+
+class RankCounter:
+  __counts: list[int]
+  __tree: list[int]
+  __total: int
+
+  def __init__(self, counts: list[tuple[int, int]], size: int = 1024) -> None:
+    size = max([size, *(score + 1 for (score, _) in counts)])
+    self.__counts = [0] * size
+    for (score, count) in counts:
+      self.__counts[score] += count
+    self.__build()
+
+  def add(self, score: int, delta: int) -> None:
+    if score >= len(self.__counts):
+      self.__counts.extend([0] * (max(score + 1, 2 * len(self.__counts)) - len(self.__counts)))
+      self.__build()
+    self.__counts[score] += delta
+    self.__total += delta
+    i = score + 1
+    while i < len(self.__tree):
+      self.__tree[i] += delta
+      i += i & -i
+
+  def above(self, score: int) -> int:
+    i = min(score + 1, len(self.__counts))
+    at_most = 0
+    while i > 0:
+      at_most += self.__tree[i]
+      i -= i & -i
+    return self.__total - at_most
+
+  def __len__(self) -> int:
+    return self.__total
+
+  def __build(self) -> None:
+    self.__tree = [0, *self.__counts]
+    for i in range(1, len(self.__tree)):
+      parent = i + (i & -i)
+      if parent < len(self.__tree):
+        self.__tree[parent] += self.__tree[i]
+    self.__total = sum(self.__counts)
+
+class Ranking:
+  __order: str
+  __capacity: int
+  __counter: RankCounter
+  __keys: list[tuple[int, str]]
+  __stats: dict[str, tuple[int, int]]
+  __complete: bool
+
+  def __init__(self, order: str, capacity: int) -> None:
+    self.__order = order
+    self.__capacity = capacity
+    self.__counter = RankCounter([])
+    self.__keys = []
+    self.__stats = {}
+    self.__complete = True
+
+  def load_counts(self, counts: list[tuple[int, int]]) -> None:
+    self.__counter = RankCounter(counts)
+
+  def load_leaders(self, cutoff: tuple[str, int, int] | None, leaders: list[tuple[str, int, int]]) -> None:
+    bound = None
+    if cutoff is not None:
+      username, wins, losses = cutoff
+      bound = (-(ranking_score(self.__order, wins, losses) or 0), username)
+    entries = []
+    for (username, wins, losses) in leaders:
+      score = ranking_score(self.__order, wins, losses)
+      if score is not None and (bound is None or (-score, username) <= bound):
+        entries.append(((-score, username), (wins, losses)))
+    entries.sort()
+    self.__keys = [key for (key, _) in entries[:self.__capacity]]
+    self.__stats = {key[1]: stats for (key, stats) in entries[:self.__capacity]}
+    self.__complete = cutoff is None and len(entries) <= self.__capacity
+
+  def update(self, username: str, old: tuple[int, int] | None, new: tuple[int, int]) -> None:
+    old_score = None if old is None else ranking_score(self.__order, *old)
+    new_score = ranking_score(self.__order, *new)
+    if old_score != new_score:
+      if old_score is not None:
+        self.__counter.add(old_score, -1)
+      if new_score is not None:
+        self.__counter.add(new_score, 1)
+    bound = self.__keys[-1] if self.__keys else None
+    if username in self.__stats:
+      self.__keys.pop(self.__index(username))
+      del self.__stats[username]
+    if new_score is None:
+      return
+    key = (-new_score, username)
+    if not self.__complete and (bound is None or key > bound):
+      return
+    bisect.insort(self.__keys, key)
+    self.__stats[username] = new
+    if len(self.__keys) > self.__capacity:
+      _, dropped = self.__keys.pop()
+      del self.__stats[dropped]
+      self.__complete = False
+
+  def needs_leaders(self, served: int) -> bool:
+    return not self.__complete and len(self.__keys) < served
+
+  def page(self, offset: int, limit: int) -> list[dict[str, Any]]:
+    entries = []
+    ranks: dict[int, int] = {}
+    for (score, username) in self.__keys[offset:offset + limit]:
+      if score not in ranks:
+        ranks[score] = self.__counter.above(-score) + 1
+      wins, losses = self.__stats[username]
+      entries.append({
+        "username": username,
+        "wins": wins,
+        "losses": losses,
+        "rank": ranks[score],
+      })
+    return entries
+
+  def rank(self, wins: int, losses: int) -> int | None:
+    score = ranking_score(self.__order, wins, losses)
+    return None if score is None else self.__counter.above(score) + 1
+
+  def __len__(self) -> int:
+    return len(self.__keys)
+
+  def __index(self, username: str) -> int:
+    wins, losses = self.__stats.get(username) or (0, 0)
+    return bisect.bisect_left(self.__keys, (-(ranking_score(self.__order, wins, losses) or 0), username))
+
+class Leaderboard:
+  __stats_writer: models.StatsWriter
+  __profiles: models.UserCache
+  __size: int
+  __rankings: dict[str, Ranking]
+  __lock: threading.Lock
+
+  def __init__(self, stats_writer: models.StatsWriter, profiles: models.UserCache, size: int = 1000) -> None:
+    self.__stats_writer = stats_writer
+    self.__profiles = profiles
+    self.__size = size
+    self.__rankings = {order: Ranking(order, 2 * size) for order in ORDERS}
+    self.__lock = threading.Lock()
+    stats_writer.add_listener(self.apply)
+
+  def load(self) -> None:
+    with self.__stats_writer.paused():
+      rankings = {}
+      for order in ORDERS:
+        ranking = Ranking(order, 2 * self.__size)
+        ranking.load_counts(self.__stats_writer.load_counts(order))
+        ranking.load_leaders(*self.__stats_writer.load_leaders(order, 2 * self.__size))
+        rankings[order] = ranking
+      with self.__lock:
+        self.__rankings = rankings
+
+  def apply(self, changes: list[models.StatsChange]) -> None:
+    with self.__lock:
+      for (username, old, new) in changes:
+        for ranking in self.__rankings.values():
+          ranking.update(username, old, new)
+
+  def page(self, order: str, offset: int, limit: int) -> tuple[list[dict[str, Any]], int | None]:
+    limit = max(0, min(limit, self.__size - offset))
+    with self.__lock:
+      refill = self.__rankings[order].needs_leaders(self.__size)
+    if refill:
+      with self.__stats_writer.paused():
+        leaders = self.__stats_writer.load_leaders(order, 2 * self.__size)
+        with self.__lock:
+          self.__rankings[order].load_leaders(*leaders)
+    with self.__lock:
+      ranking = self.__rankings[order]
+      entries = ranking.page(offset, limit)
+      more = offset + limit < min(len(ranking), self.__size)
+    return entries, (offset + limit if more else None)
+
+  def rank(self, order: str, username: str) -> int | None:
+    profile = self.__profiles.get(username)
+    if not profile:
+      return None
+    with self.__lock:
+      return self.__rankings[order].rank(profile.wins, profile.losses)
@@ -0,0 +1,114 @@
+import collections
+import heapq
+import itertools
+import threading
+import time
+
+from lib.user import User
+
+RATING_BUCKETS = 10
+
+def rating_bucket(wins: int, losses: int) -> int:
+  return min(RATING_BUCKETS - 1, (wins + 1) * RATING_BUCKETS // (wins + losses + 2))
+
+class Ticket:
+  __slots__ = ("user", "player_count", "bucket", "queued_at", "sequence", "waiting")
+  user: User
+  player_count: int
+  bucket: int
+  queued_at: float
+  sequence: int
+  waiting: bool
+
+  def __init__(self, user: User, player_count: int, bucket: int, sequence: int) -> None:
+    self.user = user
+    self.player_count = player_count
+    self.bucket = bucket
+    self.queued_at = time.monotonic()
+    self.sequence = sequence
+    self.waiting = True
+
+class Matchmaker:
+  __queues: dict[tuple[int, int], collections.deque[Ticket]]
+  __waiting: dict[tuple[int, int], int]
+  __tickets: dict[str, Ticket]
+  __sequence: itertools.count
+  __widen_after: float
+  __lock: threading.Lock
+
+  def __init__(self, widen_after: float = 5.0) -> None:
+    self.__queues = collections.defaultdict(collections.deque)
+    self.__waiting = collections.defaultdict(int)
+    self.__tickets = {}
+    self.__sequence = itertools.count()
+    self.__widen_after = widen_after
+    self.__lock = threading.Lock()
+
+  def enqueue(self, user: User, player_count: int, wins: int, losses: int) -> list[User] | None:
+    with self.__lock:
+      self.__cancel(user.name)
+      ticket = Ticket(user, player_count, rating_bucket(wins, losses), next(self.__sequence))
+      self.__tickets[user.name] = ticket
+      self.__queues[(player_count, ticket.bucket)].append(ticket)
+      self.__waiting[(player_count, ticket.bucket)] += 1
+      return self.__match(player_count, ticket.bucket, 0)
+
+  def cancel(self, user: User) -> bool:
+    with self.__lock:
+      ticket = self.__tickets.get(user.name)
+      if ticket is None or ticket.user is not user:
+        return False
+      self.__cancel(user.name)
+      return True
+
+  def sweep(self, now: float | None = None) -> list[list[User]]:
+    now = time.monotonic() if now is None else now
+    matches = []
+    with self.__lock:
+      for (player_count, bucket) in sorted(key for (key, count) in self.__waiting.items() if count):
+        head = self.__head(player_count, bucket)
+        if head is None:
+          continue
+        width = int((now - head.queued_at) / self.__widen_after)
+        while width > 0:
+          users = self.__match(player_count, bucket, width)
+          if users is None:
+            break
+          matches.append(users)
+    return matches
+
+  def __len__(self) -> int:
+    return len(self.__tickets)
+
+  def __cancel(self, username: str) -> None:
+    ticket = self.__tickets.pop(username, None)
+    if ticket is not None:
+      ticket.waiting = False
+      self.__waiting[(ticket.player_count, ticket.bucket)] -= 1
+
+  def __head(self, player_count: int, bucket: int) -> Ticket | None:
+    queue = self.__queues.get((player_count, bucket))
+    while queue and not queue[0].waiting:
+      queue.popleft()
+    return queue[0] if queue else None
+
+  def __match(self, player_count: int, bucket: int, width: int) -> list[User] | None:
+    buckets = range(max(0, bucket - width), min(RATING_BUCKETS, bucket + width + 1))
+    if sum(self.__waiting[(player_count, b)] for b in buckets) < player_count:
+      return None
+    heads = []
+    for b in buckets:
+      head = self.__head(player_count, b)
+      if head is not None:
+        heads.append((head.sequence, b))
+    heapq.heapify(heads)
+    users = []
+    while len(users) < player_count:
+      _, b = heapq.heappop(heads)
+      ticket = self.__queues[(player_count, b)].popleft()
+      users.append(ticket.user)
+      self.__cancel(ticket.user.name)
+      head = self.__head(player_count, b)
+      if head is not None:
+        heapq.heappush(heads, (head.sequence, b))
+    return users
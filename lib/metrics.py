@@ -0,0 +1,127 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import os
+import threading
+import time
+from typing import Callable, Iterator
+
+BUCKETS = [1e-6 * 2 ** i for i in range(25)]
+SIZE_BUCKETS = [float(16 ** i) for i in range(9)]
+
+Key = tuple[str, tuple[tuple[str, str], ...]]
+
+class Histogram:
+  __slots__ = ("bounds", "counts", "total", "count")
+  bounds: list[float]
+  counts: list[int]
+  total: float
+  count: int
+
+  def __init__(self, bounds: list[float]) -> None:
+    self.bounds = bounds
+    self.counts = [0] * (len(bounds) + 1)
+    self.total = 0.0
+    self.count = 0
+
+  def observe(self, value: float) -> None:
+    self.counts[bisect_left(self.bounds, value)] += 1
+    self.total += value
+    self.count += 1
+
+class Metrics:
+  __lock: threading.Lock
+  __counters: dict[Key, float]
+  __histograms: dict[Key, Histogram]
+  __gauges: dict[Key, Callable[[], float]]
+
+  def __init__(self) -> None:
+    self.__lock = threading.Lock()
+    self.__counters = {}
+    self.__histograms = {}
+    self.__gauges = {}
+
+  def increment(self, name: str, value: float = 1, **labels: str) -> None:
+    key = (name, tuple(sorted(labels.items())))
+    with self.__lock:
+      self.__counters[key] = self.__counters.get(key, 0) + value
+
+  def observe(self, name: str, value: float, bounds: list[float] = BUCKETS, **labels: str) -> None:
+    key = (name, tuple(sorted(labels.items())))
+    with self.__lock:
+      histogram = self.__histograms.get(key)
+      if histogram is None:
+        histogram = self.__histograms[key] = Histogram(bounds)
+      histogram.observe(value)
+
+  def gauge(self, name: str, read: Callable[[], float], **labels: str) -> None:
+    with self.__lock:
+      self.__gauges[(name, tuple(sorted(labels.items())))] = read
+
+  @contextmanager
+  def timer(self, name: str, **labels: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.observe(name, time.perf_counter() - start, **labels)
+
+  def render(self) -> str:
+    with self.__lock:
+      counters = sorted(self.__counters.items())
+      histograms = sorted(
+        (key, list(histogram.bounds), list(histogram.counts), histogram.total, histogram.count)
+        for (key, histogram) in self.__histograms.items()
+      )
+      gauges = sorted(self.__gauges.items())
+    lines = []
+    for ((name, labels), value) in counters:
+      lines.append(f"{name}{format_labels(labels)} {value:g}")
+    for ((name, labels), read) in gauges:
+      lines.append(f"{name}{format_labels(labels)} {read():g}")
+    for ((name, labels), bounds, counts, total, count) in histograms:
+      cumulative = 0
+      for (bound, bucket_count) in zip([*bounds, float("inf")], counts):
+        cumulative += bucket_count
+        lines.append(f"{name}_bucket{format_labels((*labels, ('le', f'{bound:g}')))} {cumulative}")
+      lines.append(f"{name}_sum{format_labels(labels)} {total:g}")
+      lines.append(f"{name}_count{format_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+  def serve(self, host: str, port: int) -> ThreadingHTTPServer:
+    metrics = self
+    class Handler(BaseHTTPRequestHandler):
+      def do_GET(self) -> None:
+        body = metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+      def log_message(self, format: str, *args: object) -> None:
+        pass
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+  def write_snapshots(self, path: str, interval: float) -> threading.Event:
+    stopped = threading.Event()
+    def run() -> None:
+      while not stopped.wait(interval):
+        self.write_snapshot(path)
+    threading.Thread(target=run, daemon=True).start()
+    return stopped
+
+  def write_snapshot(self, path: str) -> None:
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w") as snapshot:
+      snapshot.write(self.render())
+    os.replace(temporary_path, path)
+
+def format_labels(labels: tuple[tuple[str, str], ...]) -> str:
+  if not labels:
+    return ""
+  return "{" + ",".join(f'{key}="{value}"' for (key, value) in labels) + "}"
+
+metrics = Metrics()
@@ -1,7 +1,23 @@
+import asyncio
+import collections
+from concurrent.futures import Future
+import contextvars
 from enum import Enum, auto
 import json
+import os
+import select
 import socket
-from typing import Any
+import struct
+import threading
+import time
+from typing import Any, Callable
+import weakref
+import zlib
+
+HEADER_SIZE = 4
+MAX_FRAME_SIZE = 1 << 20
+COMPRESSED_FLAG = 1 << 31
+OUTBOX_POLL_INTERVAL = 0.25
 
 class MessageType(Enum):
   ROOM_CONNECTION_REQUEST = auto()
@@ -19,27 +35,857 @@ class MessageType(Enum):
   DRAW_CARD_REQUEST = auto()
   OK = auto()
   ERROR = auto()
+  RESYNC_REQUEST = auto()
+  HEARTBEAT_REQUEST = auto()
+  ROOM_LIST_REQUEST = auto()
+  MATCHMAKE_REQUEST = auto()
+  SPECTATE_REQUEST = auto()
+  SPECTATE_UPDATE = auto()
+  LEADERBOARD_REQUEST = auto()
   
+class StreamConnection:
+  __writer: asyncio.StreamWriter
+
+  def __init__(self, writer: asyncio.StreamWriter) -> None:
+    self.__writer = writer
+
+  def sendall(self, data: bytes) -> None:
+    self.__writer.write(data)
+
+  def sendmsg(self, buffers: list[bytes | memoryview]) -> int:
+    self.__writer.writelines(buffers)
+    return sum(map(len, buffers))
+
+  def close(self) -> None:
+    self.__writer.close()
+
+  def shutdown(self, how: int) -> None:
+    self.__writer.transport.abort()
+
+  @property
+  def writer(self) -> asyncio.StreamWriter:
+    return self.__writer
+
+class FrameError(Exception):
+  pass
+
+CARD_COLORS = ["red", "yellow", "green", "blue", "black"]
+CARD_TYPES: list[int | str] = [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, "skip", "reverse", "+2", "wildcard", "+4"]
+FIELD_NAMES = [
+  "type", "username", "password", "wins", "losses", "room_id", "player_count", "max_player_count",
+  "current_player_count", "hand", "turn", "id", "current_card", "winner", "card_index", "color", "codec",
+  "version", "removed", "added", "delta", "rooms", "cursor", "limit",
+  "hand_sizes", "request_id", "order", "entries", "rank",
+]
+
+def playable(card: dict[str, Any], current_card: dict[str, Any]) -> bool:
+  return card["color"] == "black" or card["color"] == current_card["color"] or card["type"] == current_card["type"]
+
+class JsonCodec:
+  name = "json"
+
+  def encode(self, message: dict[str, Any]) -> bytes:
+    return json.dumps(message).encode('utf-8')
+
+  def decode(self, frame: bytes | memoryview) -> dict[str, Any]:
+    return json.loads(str(frame, 'utf-8'))
+
+  def prepare(self, shared: dict[str, Any]) -> memoryview:
+    return memoryview(self.encode(shared))
+
+  def splice(self, prepared: memoryview, private: dict[str, Any]) -> list[bytes | memoryview]:
+    if not private:
+      return [prepared]
+    encoded = memoryview(self.encode(private))
+    return [encoded[:-1], b", ", prepared[1:]]
+
+class BinaryCodec:
+  name = "binary"
+  __NONE = 0
+  __FALSE = 1
+  __TRUE = 2
+  __INT = 3
+  __STR = 4
+  __LIST = 5
+  __DICT = 6
+  __CARD = 7
+  __CARD_LIST = 8
+  __FLOAT = 9
+  __UNKNOWN_FIELD = 0xFF
+  __message_types = {message_type.name: message_type.value for message_type in MessageType}
+  __message_names = {message_type.value: message_type.name for message_type in MessageType}
+  __field_ids = {field: i for (i, field) in enumerate(FIELD_NAMES)}
+  __card_codes = {
+    (color, card_type): color_index << 4 | type_index
+    for (color_index, color) in enumerate(CARD_COLORS)
+    for (type_index, card_type) in enumerate(CARD_TYPES)
+  }
+  __cards = {code: {"color": color, "type": card_type} for ((color, card_type), code) in __card_codes.items()}
+  __double = struct.Struct(">d")
+
+  def encode(self, message: dict[str, Any]) -> bytes:
+    buffer = bytearray()
+    buffer.append(self.__message_types[message["type"]])
+    self.__write_fields(buffer, message, skip_type=True)
+    return bytes(buffer)
+
+  def decode(self, frame: bytes | memoryview) -> dict[str, Any]:
+    message: dict[str, Any] = {"type": self.__message_names[frame[0]]}
+    self.__read_fields(frame, 1, message)
+    return message
+
+  def prepare(self, shared: dict[str, Any]) -> tuple[int, int, bytes]:
+    items = bytearray()
+    self.__write_items(items, shared, skip_type=True)
+    return self.__message_types[shared["type"]], len(shared) - 1, bytes(items)
+
+  def splice(self, prepared: tuple[int, int, bytes], private: dict[str, Any]) -> list[bytes | memoryview]:
+    message_type, shared_count, shared_items = prepared
+    head = bytearray()
+    head.append(message_type)
+    self.__write_varint(head, shared_count + len(private))
+    self.__write_items(head, private)
+    return [head, shared_items]
+
+  def __card_code(self, value: Any) -> int | None:
+    if type(value) is not dict or len(value) != 2:
+      return None
+    return self.__card_codes.get((value.get("color"), value.get("type")))
+
+  def __write_varint(self, buffer: bytearray, value: int) -> None:
+    while value > 0x7F:
+      buffer.append(value & 0x7F | 0x80)
+      value >>= 7
+    buffer.append(value)
+
+  def __write_str(self, buffer: bytearray, value: str) -> None:
+    encoded = value.encode('utf-8')
+    self.__write_varint(buffer, len(encoded))
+    buffer += encoded
+
+  def __write_fields(self, buffer: bytearray, fields: dict[str, Any], skip_type: bool = False) -> None:
+    self.__write_varint(buffer, len(fields) - 1 if skip_type else len(fields))
+    self.__write_items(buffer, fields, skip_type)
+
+  def __write_items(self, buffer: bytearray, fields: dict[str, Any], skip_type: bool = False) -> None:
+    for (key, value) in fields.items():
+      if skip_type and key == "type":
+        continue
+      field_id = self.__field_ids.get(key)
+      if field_id is None:
+        buffer.append(self.__UNKNOWN_FIELD)
+        self.__write_str(buffer, key)
+      else:
+        buffer.append(field_id)
+      self.__write_value(buffer, value)
+
+  def __write_value(self, buffer: bytearray, value: Any) -> None:
+    if value is None:
+      buffer.append(self.__NONE)
+    elif value is True:
+      buffer.append(self.__TRUE)
+    elif value is False:
+      buffer.append(self.__FALSE)
+    elif type(value) is int:
+      buffer.append(self.__INT)
+      self.__write_varint(buffer, value << 1 if value >= 0 else (-value << 1) - 1)
+    elif type(value) is float:
+      buffer.append(self.__FLOAT)
+      buffer += self.__double.pack(value)
+    elif type(value) is str:
+      buffer.append(self.__STR)
+      self.__write_str(buffer, value)
+    elif type(value) is list:
+      codes = [self.__card_code(item) for item in value]
+      if value and None not in codes:
+        buffer.append(self.__CARD_LIST)
+        self.__write_varint(buffer, len(codes))
+        buffer += bytes(codes)
+        return
+      buffer.append(self.__LIST)
+      self.__write_varint(buffer, len(value))
+      for item in value:
+        self.__write_value(buffer, item)
+    elif type(value) is dict:
+      code = self.__card_code(value)
+      if code is not None:
+        buffer.append(self.__CARD)
+        buffer.append(code)
+      else:
+        buffer.append(self.__DICT)
+        self.__write_fields(buffer, value)
+    else:
+      raise TypeError(f"cannot encode value of type {type(value).__name__}")
+
+  def __read_varint(self, frame: bytes | memoryview, offset: int) -> tuple[int, int]:
+    value = 0
+    shift = 0
+    while True:
+      byte = frame[offset]
+      offset += 1
+      value |= (byte & 0x7F) << shift
+      if byte < 0x80:
+        return value, offset
+      shift += 7
+
+  def __read_str(self, frame: bytes | memoryview, offset: int) -> tuple[str, int]:
+    length, offset = self.__read_varint(frame, offset)
+    return str(frame[offset:offset + length], 'utf-8'), offset + length
+
+  def __read_fields(self, frame: bytes | memoryview, offset: int, fields: dict[str, Any]) -> int:
+    count, offset = self.__read_varint(frame, offset)
+    for _ in range(count):
+      field_id = frame[offset]
+      offset += 1
+      if field_id == self.__UNKNOWN_FIELD:
+        key, offset = self.__read_str(frame, offset)
+      else:
+        key = FIELD_NAMES[field_id]
+      fields[key], offset = self.__read_value(frame, offset)
+    return offset
+
+  def __read_value(self, frame: bytes | memoryview, offset: int) -> tuple[Any, int]:
+    tag = frame[offset]
+    offset += 1
+    if tag == self.__NONE:
+      return None, offset
+    if tag == self.__TRUE:
+      return True, offset
+    if tag == self.__FALSE:
+      return False, offset
+    if tag == self.__INT:
+      value, offset = self.__read_varint(frame, offset)
+      return value >> 1 if value & 1 == 0 else -((value + 1) >> 1), offset
+    if tag == self.__FLOAT:
+      return self.__double.unpack_from(frame, offset)[0], offset + self.__double.size
+    if tag == self.__STR:
+      return self.__read_str(frame, offset)
+    if tag == self.__CARD:
+      return dict(self.__cards[frame[offset]]), offset + 1
+    if tag == self.__CARD_LIST:
+      count, offset = self.__read_varint(frame, offset)
+      return [dict(self.__cards[code]) for code in frame[offset:offset + count]], offset + count
+    if tag == self.__LIST:
+      count, offset = self.__read_varint(frame, offset)
+      items = []
+      for _ in range(count):
+        item, offset = self.__read_value(frame, offset)
+        items.append(item)
+      return items, offset
+    if tag == self.__DICT:
+      fields: dict[str, Any] = {}
+      offset = self.__read_fields(frame, offset, fields)
+      return fields, offset
+    raise FrameError(f"unknown value tag {tag}")
+
+JSON_CODEC = JsonCodec()
+BINARY_CODEC = BinaryCodec()
+CODECS: dict[str, JsonCodec | BinaryCodec] = {
+  JSON_CODEC.name: JSON_CODEC,
+  BINARY_CODEC.name: BINARY_CODEC,
+}
+
+_codecs: weakref.WeakKeyDictionary[Any, JsonCodec | BinaryCodec] = weakref.WeakKeyDictionary()
+
+def set_codec(connection: socket.socket, name: str) -> None:
+  _codecs[connection] = CODECS[name]
+
+def connection_codec(connection: socket.socket) -> JsonCodec | BinaryCodec:
+  return _codecs.get(connection, JSON_CODEC)
+
+def decode_frame(frame: bytes | memoryview) -> dict[str, Any]:
+  if len(frame) > 0 and frame[0] == ord("{"):
+    return JSON_CODEC.decode(frame)
+  return BINARY_CODEC.decode(frame)
+
+def _compression_dictionary() -> bytes:
+  cards = [
+    {"color": color, "type": card_type}
+    for color in CARD_COLORS[:-1]
+    for card_type in CARD_TYPES[:13]
+  ] + [{"color": "black", "type": card_type} for card_type in CARD_TYPES[13:]]
+  fragments = [f'"{field}": ' for field in FIELD_NAMES]
+  fragments += [f'"type": "{message_type.name}"' for message_type in MessageType]
+  binary = bytes(CARD_COLORS.index(card["color"]) << 4 | CARD_TYPES.index(card["type"]) for card in cards)
+  return binary + ", ".join(fragments).encode('utf-8') + b", ".join(JSON_CODEC.encode(card) for card in cards)
+
+COMPRESSION_DICTIONARY = _compression_dictionary()
+COMPRESSION_WBITS = 12
+COMPRESSION_MEM_LEVEL = 5
+_decompressor = zlib.decompressobj(COMPRESSION_WBITS, zdict=COMPRESSION_DICTIONARY)
+
+class ZlibCompressor:
+  name = "zlib"
+  __primed: Any
+  __threshold: int
+  frames: int
+  saved: int
+
+  def __init__(self, level: int = 6, threshold: int = 128) -> None:
+    self.__primed = zlib.compressobj(
+      level, zlib.DEFLATED, COMPRESSION_WBITS, COMPRESSION_MEM_LEVEL, zlib.Z_DEFAULT_STRATEGY, COMPRESSION_DICTIONARY
+    )
+    self.__threshold = threshold
+    self.frames = 0
+    self.saved = 0
+
+  def compress(self, parts: list[bytes | memoryview], length: int) -> bytes | None:
+    if length < self.__threshold:
+      return None
+    compressor = self.__primed.copy()
+    compressed = b"".join([*map(compressor.compress, parts), compressor.flush()])
+    if len(compressed) >= length:
+      return None
+    self.frames += 1
+    self.saved += length - len(compressed)
+    return compressed
+
+def decompress_frame(frame: bytes | memoryview) -> bytes:
+  decompressor = _decompressor.copy()
+  try:
+    data = decompressor.decompress(frame, MAX_FRAME_SIZE)
+  except zlib.error as e:
+    raise FrameError(f"invalid compressed frame: {e}")
+  if decompressor.unconsumed_tail or not decompressor.eof:
+    raise FrameError(f"compressed frame exceeds limit of {MAX_FRAME_SIZE} or is truncated")
+  return data
+
+COMPRESSORS = {
+  ZlibCompressor.name: ZlibCompressor,
+}
+
+_compressors: weakref.WeakKeyDictionary[Any, ZlibCompressor] = weakref.WeakKeyDictionary()
+
+def set_compression(connection: socket.socket, name: str, level: int = 6, threshold: int = 128) -> None:
+  _compressors[connection] = COMPRESSORS[name](level, threshold)
+
+def connection_compressor(connection: socket.socket) -> ZlibCompressor | None:
+  return _compressors.get(connection)
+
+class Traffic:
+  __slots__ = ("received", "sent")
+  received: int
+  sent: int
+
+  def __init__(self) -> None:
+    self.received = 0
+    self.sent = 0
+
+_traffic: weakref.WeakKeyDictionary[Any, Traffic] = weakref.WeakKeyDictionary()
+
+def track_traffic(connection: socket.socket) -> Traffic:
+  traffic = _traffic.get(connection)
+  if traffic is None:
+    traffic = _traffic[connection] = Traffic()
+  return traffic
+
+def live_traffic() -> list[Traffic]:
+  return list(_traffic.values())
+
+class FrameReader:
+  __connection: socket.socket
+  __buffer: bytearray
+  __view: memoryview
+  __start: int
+  __end: int
+  __buffer_size: int
+  __last_frame_size: int
+  __max_frame_size: int
+  __traffic: Traffic | None
+
+  def __init__(self, connection: socket.socket, buffer_size: int = 4 * 1024, max_frame_size: int = MAX_FRAME_SIZE) -> None:
+    self.__connection = connection
+    self.__buffer = bytearray(buffer_size)
+    self.__view = memoryview(self.__buffer)
+    self.__start = 0
+    self.__end = 0
+    self.__buffer_size = buffer_size
+    self.__last_frame_size = 0
+    self.__max_frame_size = max_frame_size
+    self.__traffic = _traffic.get(connection)
+
+  def __fill(self) -> None:
+    received = self.__connection.recv_into(self.__view[self.__end:])
+    if received == 0:
+      raise ConnectionError("connection closed by peer")
+    self.__end += received
+    if self.__traffic is not None:
+      self.__traffic.received += received
+
+  def __reserve(self, size: int) -> None:
+    if self.__start + size <= len(self.__buffer):
+      return
+    pending = self.__end - self.__start
+    if size > len(self.__buffer):
+      self.__replace(max(size, min(1 << (size - 1).bit_length(), HEADER_SIZE + self.__max_frame_size)))
+      return
+    self.__buffer[:pending] = bytes(self.__view[self.__start:self.__end])
+    self.__start = 0
+    self.__end = pending
+
+  def __replace(self, size: int) -> None:
+    pending = self.__end - self.__start
+    buffer = bytearray(size)
+    buffer[:pending] = self.__view[self.__start:self.__end]
+    self.__buffer = buffer
+    self.__view = memoryview(buffer)
+    self.__start = 0
+    self.__end = pending
+
+  @property
+  def capacity(self) -> int:
+    return len(self.__buffer)
+
+  @property
+  def has_frame(self) -> bool:
+    pending = self.__end - self.__start
+    if pending < HEADER_SIZE:
+      return False
+    frame_length = int.from_bytes(self.__view[self.__start:self.__start + HEADER_SIZE]) & ~COMPRESSED_FLAG
+    return pending >= HEADER_SIZE + frame_length
+
+  @property
+  def has_pending(self) -> bool:
+    return self.__end > self.__start
+
+  def pending(self) -> bytes:
+    return bytes(self.__view[self.__start:self.__end])
+
+  def feed(self, data: bytes) -> None:
+    self.__reserve(self.__end - self.__start + len(data))
+    self.__view[self.__end:self.__end + len(data)] = data
+    self.__end += len(data)
+
+  def recv_frame(self) -> memoryview:
+    if len(self.__buffer) > self.__buffer_size and self.__last_frame_size <= self.__buffer_size and self.__end - self.__start < self.__buffer_size:
+      self.__replace(self.__buffer_size)
+    self.__reserve(HEADER_SIZE)
+    while self.__end - self.__start < HEADER_SIZE:
+      self.__fill()
+    header = int.from_bytes(self.__view[self.__start:self.__start + HEADER_SIZE])
+    frame_length = header & ~COMPRESSED_FLAG
+    if frame_length > self.__max_frame_size:
+      raise FrameError(f"frame of {frame_length} bytes exceeds limit of {self.__max_frame_size}")
+    self.__reserve(HEADER_SIZE + frame_length)
+    while self.__end - self.__start < HEADER_SIZE + frame_length:
+      self.__fill()
+    frame_start = self.__start + HEADER_SIZE
+    self.__start = frame_start + frame_length
+    self.__last_frame_size = HEADER_SIZE + frame_length
+    if self.__start == self.__end:
+      self.__start = self.__end = 0
+    frame = self.__view[frame_start:frame_start + frame_length]
+    if header & COMPRESSED_FLAG:
+      with frame:
+        return memoryview(decompress_frame(frame))
+    return frame
+
+  def recv_message(self) -> dict[str, Any]:
+    frame = self.recv_frame()
+    message = decode_frame(frame)
+    frame.release()
+    return message
+
+_frame_readers: weakref.WeakKeyDictionary[socket.socket, FrameReader] = weakref.WeakKeyDictionary()
+
+def frame_reader(connection: socket.socket) -> FrameReader:
+  reader = _frame_readers.get(connection)
+  if reader is None:
+    reader = FrameReader(connection)
+    _frame_readers[connection] = reader
+  return reader
+
+def coalesce(frames: collections.deque[tuple[str | None, bytes]], key: str, data: bytes) -> bool:
+  for (i, (queued_key, _)) in enumerate(frames):
+    if queued_key == key:
+      del frames[i]
+      frames.append((key, data))
+      return True
+  return False
+
+class Outbox:
+  __connection: socket.socket
+  __frames: collections.deque[tuple[str | None, bytes]]
+  __lock: threading.Lock
+  __drained: threading.Condition
+  __writing: bool
+  __closed: bool
+  __limit: int
+  __stall_timeout: float
+  __full_since: float | None
+  coalesced: int
+  overflowed: bool
+  traffic: Traffic | None
+
+  def __init__(self, connection: socket.socket, limit: int = 64, stall_timeout: float = 10.0) -> None:
+    self.__connection = connection
+    self.__frames = collections.deque()
+    self.__lock = threading.Lock()
+    self.__drained = threading.Condition(self.__lock)
+    self.__writing = False
+    self.__closed = False
+    self.__limit = limit
+    self.__stall_timeout = stall_timeout
+    self.__full_since = None
+    self.coalesced = 0
+    self.overflowed = False
+    self.traffic = None
+
+  def push(self, buffers: list[bytes | memoryview], key: str | None = None) -> None:
+    with self.__lock:
+      if self.__closed:
+        return
+      if not self.__writing:
+        sent = self.__send_now(buffers)
+        self.__count(sent)
+        if sent == sum(map(len, buffers)):
+          return
+        self.__frames.append((key if sent == 0 else None, b"".join(buffers)[sent:]))
+        self.__writing = True
+        threading.Thread(target=self.__write, daemon=True).start()
+        return
+      data = b"".join(buffers)
+      if key is not None and coalesce(self.__frames, key, data):
+        self.coalesced += 1
+        return
+      self.__frames.append((key, data))
+      if len(self.__frames) > self.__limit:
+        now = time.monotonic()
+        if self.__full_since is None:
+          self.__full_since = now
+        elif now - self.__full_since > self.__stall_timeout or len(self.__frames) > 4 * self.__limit:
+          self.__overflow()
+
+  def flush(self, timeout: float) -> bool:
+    with self.__lock:
+      return self.__drained.wait_for(lambda: not self.__writing, timeout)
+
+  @property
+  def backlogged(self) -> bool:
+    return self.__writing
+
+  @property
+  def queued(self) -> int:
+    return len(self.__frames)
+
+  def __send_now(self, buffers: list[bytes | memoryview]) -> int:
+    try:
+      if self.__connection.gettimeout() is None:
+        return self.__connection.sendmsg(buffers, [], socket.MSG_DONTWAIT)
+      return os.writev(self.__connection.fileno(), buffers)
+    except BlockingIOError:
+      return 0
+
+  def __count(self, sent: int) -> None:
+    if self.traffic is not None:
+      self.traffic.sent += sent
+
+  def __overflow(self) -> None:
+    self.__closed = True
+    self.overflowed = True
+    self.__frames.clear()
+    drop_connection(self.__connection)
+
+  def __send_all(self, data: memoryview) -> None:
+    timeout = self.__connection.gettimeout()
+    progressed = time.monotonic()
+    while data:
+      sent = self.__send_now([data])
+      now = time.monotonic()
+      with self.__lock:
+        if sent:
+          self.__count(sent)
+          data = data[sent:]
+          progressed = now
+          continue
+        if self.__closed:
+          return
+        if self.__full_since is not None and now - self.__full_since > self.__stall_timeout:
+          self.__overflow()
+          return
+        wait = self.__stall_timeout if self.__full_since is None else self.__full_since + self.__stall_timeout - now
+      if timeout is not None:
+        if now - progressed > timeout:
+          raise TimeoutError("timed out")
+        wait = min(wait, progressed + timeout - now)
+      select.select([], [self.__connection], [], min(max(wait, 0.01), OUTBOX_POLL_INTERVAL))
+
+  def __write(self) -> None:
+    while (True):
+      with self.__lock:
+        if not self.__frames or self.__closed:
+          self.__frames.clear()
+          self.__writing = False
+          self.__full_since = None
+          self.__drained.notify_all()
+          return
+        _, data = self.__frames.popleft()
+        if len(self.__frames) <= self.__limit:
+          self.__full_since = None
+      try:
+        self.__send_all(memoryview(data))
+      except OSError:
+        with self.__lock:
+          self.__closed = True
+        drop_connection(self.__connection)
+
+class StreamOutbox:
+  __writer: asyncio.StreamWriter
+  __frames: collections.deque[tuple[str | None, bytes]]
+  __task: asyncio.Task | None
+  __closed: bool
+  __limit: int
+  __stall_timeout: float
+  __full_since: float | None
+  __high_water: int
+  coalesced: int
+  overflowed: bool
+  traffic: Traffic | None
+
+  def __init__(self, writer: asyncio.StreamWriter, limit: int = 64, stall_timeout: float = 10.0, high_water: int = 64 * 1024) -> None:
+    self.__writer = writer
+    self.__frames = collections.deque()
+    self.__task = None
+    self.__closed = False
+    self.__limit = limit
+    self.__stall_timeout = stall_timeout
+    self.__full_since = None
+    self.__high_water = high_water
+    self.coalesced = 0
+    self.overflowed = False
+    self.traffic = None
+
+  def push(self, buffers: list[bytes | memoryview], key: str | None = None) -> None:
+    if self.__closed:
+      return
+    if self.__task is None:
+      if self.__writer.transport.get_write_buffer_size() < self.__high_water:
+        self.__writer.writelines(buffers)
+        self.__count(sum(map(len, buffers)))
+        return
+      self.__task = asyncio.get_running_loop().create_task(self.__write())
+    data = b"".join(buffers)
+    if key is not None and coalesce(self.__frames, key, data):
+      self.coalesced += 1
+      return
+    self.__frames.append((key, data))
+    if len(self.__frames) > self.__limit:
+      now = time.monotonic()
+      if self.__full_since is None:
+        self.__full_since = now
+      elif now - self.__full_since > self.__stall_timeout or len(self.__frames) > 4 * self.__limit:
+        self.__overflow()
+
+  @property
+  def backlogged(self) -> bool:
+    return self.__task is not None
+
+  @property
+  def queued(self) -> int:
+    return len(self.__frames)
+
+  async def __write(self) -> None:
+    try:
+      while self.__frames and not self.__closed:
+        await self.__writer.drain()
+        if self.__frames:
+          data = self.__frames.popleft()[1]
+          self.__writer.write(data)
+          self.__count(len(data))
+          if len(self.__frames) <= self.__limit:
+            self.__full_since = None
+    except (ConnectionError, RuntimeError):
+      self.__closed = True
+      self.__frames.clear()
+    finally:
+      self.__task = None
+      self.__full_since = None
+
+  def __count(self, sent: int) -> None:
+    if self.traffic is not None:
+      self.traffic.sent += sent
+
+  def __overflow(self) -> None:
+    self.__closed = True
+    self.overflowed = True
+    self.__frames.clear()
+    self.__writer.transport.abort()
+
+_outboxes: weakref.WeakKeyDictionary[Any, Outbox | StreamOutbox] = weakref.WeakKeyDictionary()
+
+def attach_outbox(connection: socket.socket, outbox: Outbox | StreamOutbox) -> None:
+  outbox.traffic = track_traffic(connection)
+  _outboxes[connection] = outbox
+
+def connection_outbox(connection: socket.socket) -> Outbox | StreamOutbox | None:
+  return _outboxes.get(connection)
+
+def live_outboxes() -> list[Outbox | StreamOutbox]:
+  return list(_outboxes.values())
+
+def is_backlogged(connection: socket.socket) -> bool:
+  outbox = _outboxes.get(connection)
+  return outbox is not None and outbox.backlogged
+
+def release_connection(connection: socket.socket) -> None:
+  _frame_readers.pop(connection, None)
+  _codecs.pop(connection, None)
+  _compressors.pop(connection, None)
+  _traffic.pop(connection, None)
+  _outboxes.pop(connection, None)
+
 def recv_message(connection: socket.socket) -> dict[str, Any]:
-  CHUNK_SIZE = 1024
-  message_length_bytes = connection.recv(4)
-  message_length = int.from_bytes(message_length_bytes)
-  message = b""
-  while (message_length > CHUNK_SIZE):
-    message += connection.recv(CHUNK_SIZE)
-    message_length -= 1024
-  if (message_length > 0):
-    message += connection.recv(message_length)
-  json_message: dict[str, Any]
-  json_message = json.loads(message.decode('utf-8'))
-  return json_message
-    
+  return frame_reader(connection).recv_message()
+
+async def recv_message_async(reader: asyncio.StreamReader, traffic: Traffic | None = None, idle_timeout: float | None = None, read_timeout: float | None = None) -> dict[str, Any]:
+  async with asyncio.timeout(idle_timeout):
+    first_byte = await reader.readexactly(1)
+  async with asyncio.timeout(read_timeout):
+    header = int.from_bytes(first_byte + await reader.readexactly(HEADER_SIZE - 1))
+    message_length = header & ~COMPRESSED_FLAG
+    if message_length > MAX_FRAME_SIZE:
+      raise FrameError(f"frame of {message_length} bytes exceeds limit of {MAX_FRAME_SIZE}")
+    message = await reader.readexactly(message_length)
+  if traffic is not None:
+    traffic.received += HEADER_SIZE + message_length
+  if header & COMPRESSED_FLAG:
+    message = decompress_frame(message)
+  return decode_frame(message)
+
+def send_frame(connection: socket.socket, parts: list[bytes | memoryview], key: str | None = None) -> None:
+  message_length = sum(map(len, parts))
+  header = message_length
+  compressor = _compressors.get(connection)
+  if compressor is not None:
+    compressed = compressor.compress(parts, message_length)
+    if compressed is not None:
+      parts = [compressed]
+      message_length = len(compressed)
+      header = message_length | COMPRESSED_FLAG
+  buffers = [header.to_bytes(4), *parts]
+  outbox = _outboxes.get(connection)
+  if outbox is not None:
+    outbox.push(buffers, key)
+    return
+  sent = connection.sendmsg(buffers)
+  if sent < message_length + HEADER_SIZE:
+    connection.sendall(memoryview(b"".join(buffers))[sent:])
+  traffic = _traffic.get(connection)
+  if traffic is not None:
+    traffic.sent += message_length + HEADER_SIZE
+
+_request: contextvars.ContextVar[tuple[Any, Any] | None] = contextvars.ContextVar("request", default=None)
+
+def begin_request(connection: socket.socket, message: dict[str, Any]) -> contextvars.Token | None:
+  request_id = message.get("request_id")
+  if request_id is None:
+    return None
+  return _request.set((connection, request_id))
+
+def end_request(token: contextvars.Token | None) -> None:
+  if token is not None:
+    _request.reset(token)
+
 def send_message(connection: socket.socket, message: dict[str, Any]):
-  message_bytes = json.dumps(message).encode('utf-8')
-  message_length = len(message_bytes).to_bytes(4)
-  connection.sendall(message_length)
-  connection.sendall(message_bytes)
+  request = _request.get()
+  if request is not None and request[0] is connection and "request_id" not in message:
+    message = {**message, "request_id": request[1]}
+  send_frame(connection, [connection_codec(connection).encode(message)])
+
+def broadcast_message(shared: dict[str, Any], recipients: list[tuple[socket.socket, dict[str, Any]]], key: str | None = None, prepared: dict[str, Any] | None = None) -> None:
+  if prepared is None:
+    prepared = {}
+  request = _request.get()
+  for (connection, private) in recipients:
+    if connection is None:
+      continue
+    codec = connection_codec(connection)
+    if codec.name not in prepared:
+      prepared[codec.name] = codec.prepare(shared)
+    frame_key = key
+    if request is not None and request[0] is connection:
+      private = {**private, "request_id": request[1]}
+      frame_key = None
+    try:
+      send_frame(connection, codec.splice(prepared[codec.name], private), frame_key)
+    except OSError:
+      drop_connection(connection)
+
+def drop_connection(connection: socket.socket) -> None:
+  try:
+    connection.shutdown(socket.SHUT_RDWR)
+  except OSError:
+    pass
     
 def send_and_recv_message(connection: socket.socket, message: dict[str, Any]):
   send_message(connection, message)
-  return recv_message(connection)
\ No newline at end of file
+  return recv_message(connection)
+
+class Dispatcher:
+  __connection: socket.socket
+  __on_event: Callable[[dict[str, Any]], None]
+  __on_close: Callable[[Exception], None] | None
+  __pending: dict[int, Future]
+  __lock: threading.Lock
+  __next_id: int
+  __error: Exception | None
+  __thread: threading.Thread | None
+
+  def __init__(self, connection: socket.socket, on_event: Callable[[dict[str, Any]], None], on_close: Callable[[Exception], None] | None = None) -> None:
+    self.__connection = connection
+    self.__on_event = on_event
+    self.__on_close = on_close
+    self.__pending = {}
+    self.__lock = threading.Lock()
+    self.__next_id = 0
+    self.__error = None
+    self.__thread = None
+
+  def start(self) -> None:
+    self.__thread = threading.Thread(target=self.__run, daemon=True)
+    self.__thread.start()
+
+  def request(self, message: dict[str, Any]) -> Future:
+    future: Future = Future()
+    with self.__lock:
+      if self.__error is not None:
+        future.set_exception(self.__error)
+        return future
+      self.__next_id += 1
+      request_id = self.__next_id
+      self.__pending[request_id] = future
+      try:
+        send_message(self.__connection, {**message, "request_id": request_id})
+      except OSError:
+        del self.__pending[request_id]
+        raise
+    return future
+
+  def call(self, message: dict[str, Any], timeout: float | None = None) -> dict[str, Any]:
+    return self.request(message).result(timeout)
+
+  @property
+  def outstanding(self) -> int:
+    return len(self.__pending)
+
+  def __run(self) -> None:
+    error: Exception = ConnectionError("connection closed")
+    try:
+      while (True):
+        message = recv_message(self.__connection)
+        request_id = message.pop("request_id", None)
+        with self.__lock:
+          future = self.__pending.pop(request_id, None)
+        if future is None or message["type"].endswith("_UPDATE"):
+          self.__on_event(message)
+        if future is not None:
+          future.set_result(message)
+    except Exception as e:
+      error = e
+    with self.__lock:
+      self.__error = error
+      pending, self.__pending = self.__pending, {}
+    for future in pending.values():
+      future.set_exception(error)
+    if self.__on_close is not None:
+      self.__on_close(error)
@@ -0,0 +1,167 @@
+import bisect
+
+from lib.room import Room
+from lib.user import User
+
+BLOCK_SIZE = 512
+
+class SessionRegistry:
+  __sessions: dict[str, User]
+
+  def __init__(self) -> None:
+    self.__sessions = {}
+
+  def add(self, user: User) -> None:
+    self.__sessions[user.name] = user
+
+  def get(self, username: str) -> User | None:
+    return self.__sessions.get(username)
+
+  def remove(self, user: User) -> bool:
+    if self.__sessions.get(user.name) is not user:
+      return False
+    del self.__sessions[user.name]
+    return True
+
+  def __contains__(self, username: str) -> bool:
+    return username in self.__sessions
+
+  def __len__(self) -> int:
+    return len(self.__sessions)
+
+class SortedIds:
+  __blocks: list[list[int]]
+  __maxes: list[int]
+  __size: int
+
+  def __init__(self) -> None:
+    self.__blocks = []
+    self.__maxes = []
+    self.__size = 0
+
+  def add(self, value: int) -> bool:
+    if not self.__blocks:
+      self.__blocks.append([value])
+      self.__maxes.append(value)
+      self.__size += 1
+      return True
+    b = min(bisect.bisect_left(self.__maxes, value), len(self.__blocks) - 1)
+    block = self.__blocks[b]
+    i = bisect.bisect_left(block, value)
+    if i < len(block) and block[i] == value:
+      return False
+    block.insert(i, value)
+    self.__maxes[b] = block[-1]
+    self.__size += 1
+    if len(block) > 2 * BLOCK_SIZE:
+      self.__blocks[b:b + 1] = [block[:BLOCK_SIZE], block[BLOCK_SIZE:]]
+      self.__maxes[b:b + 1] = [block[BLOCK_SIZE - 1], block[-1]]
+    return True
+
+  def discard(self, value: int) -> bool:
+    b = bisect.bisect_left(self.__maxes, value)
+    if b == len(self.__blocks):
+      return False
+    block = self.__blocks[b]
+    i = bisect.bisect_left(block, value)
+    if block[i] != value:
+      return False
+    del block[i]
+    self.__size -= 1
+    if block:
+      self.__maxes[b] = block[-1]
+    else:
+      del self.__blocks[b]
+      del self.__maxes[b]
+    return True
+
+  def after(self, value: int | None, limit: int) -> list[int]:
+    b, i = 0, 0
+    if value is not None:
+      b = bisect.bisect_right(self.__maxes, value)
+      if b < len(self.__blocks):
+        i = bisect.bisect_right(self.__blocks[b], value)
+    values: list[int] = []
+    while b < len(self.__blocks) and len(values) < limit:
+      values.extend(self.__blocks[b][i:i + limit - len(values)])
+      b += 1
+      i = 0
+    return values
+
+  def __contains__(self, value: int) -> bool:
+    b = bisect.bisect_left(self.__maxes, value)
+    return b < len(self.__blocks) and self.__blocks[b][bisect.bisect_left(self.__blocks[b], value)] == value
+
+  def __len__(self) -> int:
+    return self.__size
+
+class RoomRegistry:
+  __rooms: dict[int, Room]
+  __owners: dict[str, Room]
+  __members: dict[str, Room]
+  __open: SortedIds
+
+  def __init__(self) -> None:
+    self.__rooms = {}
+    self.__owners = {}
+    self.__members = {}
+    self.__open = SortedIds()
+
+  def add(self, room: Room) -> None:
+    if room.owner.name in self.__owners:
+      raise Exception("user already has a room")
+    self.__rooms[room.id] = room
+    self.__owners[room.owner.name] = room
+    for user in room.users:
+      self.__members[user.name] = room
+    if not room.is_full:
+      self.__open.add(room.id)
+
+  def get(self, room_id: int) -> Room | None:
+    return self.__rooms.get(room_id)
+
+  def by_owner(self, username: str) -> Room | None:
+    return self.__owners.get(username)
+
+  def by_member(self, username: str) -> Room | None:
+    return self.__members.get(username)
+
+  def join(self, room: Room, user: User) -> None:
+    room.add_user(user)
+    self.__members[user.name] = room
+    if room.is_full:
+      self.__open.discard(room.id)
+
+  def leave(self, room: Room, user: User) -> None:
+    owner = room.owner
+    room.remove_user(user)
+    if self.__members.get(user.name) is room:
+      del self.__members[user.name]
+    if room.owner is not owner and self.__owners.get(owner.name) is room:
+      del self.__owners[owner.name]
+      self.__owners[room.owner.name] = room
+    if self.__rooms.get(room.id) is room:
+      self.__open.add(room.id)
+
+  def remove(self, room: Room) -> bool:
+    if self.__rooms.pop(room.id, None) is not room:
+      return False
+    if self.__owners.get(room.owner.name) is room:
+      del self.__owners[room.owner.name]
+    for user in room.users:
+      if self.__members.get(user.name) is room:
+        del self.__members[user.name]
+    self.__open.discard(room.id)
+    return True
+
+  def open_rooms(self, after: int | None, limit: int) -> list[Room]:
+    return [self.__rooms[room_id] for room_id in self.__open.after(after, limit)]
+
+  def __contains__(self, room_id: int) -> bool:
+    return room_id in self.__rooms
+
+  def __len__(self) -> int:
+    return len(self.__rooms)
+
+  def __iter__(self):
+    return iter(list(self.__rooms.values()))
@@ -1,3 +1,8 @@
+import itertools
+import random
+import threading
+import time
+
 from lib.user import User
 from uno.uno import UnoGame
 
@@ -5,17 +10,52 @@ class Room:
   __owner: User
   __users: list[User]
   __id: int
-  __id_counter: int = 0
-  __game: UnoGame
+  __id_counter = itertools.count()
+  __game: UnoGame | None
+  __state: bytes | None
+  __seed: int
+  __turn_started: float
   __max_player_count: int
+  __version: int
+  __lock: threading.Lock
     
   def __init__(self, creator: User, player_count: int) -> None:
     self.__users = [creator]
     self.__owner = creator
-    self.__id = Room.__id_counter
     self.__max_player_count = player_count
-    Room.__id_counter += 1
-    self.__game = UnoGame(player_count)
+    self.__seed = random.getrandbits(64)
+    self.__game = UnoGame(player_count, seed=self.__seed)
+    self.__state = None
+    self.__version = 0
+    self.__lock = threading.Lock()
+    self.__turn_started = time.monotonic()
+    self.__id = next(Room.__id_counter)
+
+  @classmethod
+  def restore(cls, room_id: int, users: list[User], owner: User, max_player_count: int, version: int, state: bytes) -> "Room":
+    room = cls.__new__(cls)
+    room.__users = users
+    room.__owner = owner
+    room.__max_player_count = max_player_count
+    room.__game = None
+    room.__state = state
+    room.__seed = random.getrandbits(64)
+    room.__version = version
+    room.__lock = threading.Lock()
+    room.__turn_started = time.monotonic()
+    room.__id = room_id
+    return room
+
+  @staticmethod
+  def stride_ids(start: int, step: int) -> None:
+    Room.__id_counter = itertools.count(start, step)
+
+  def start_turn(self) -> None:
+    self.__turn_started = time.monotonic()
+
+  def bump_version(self) -> int:
+    self.__version += 1
+    return self.__version
 
   def has_user(self, user: User) -> bool:
     return len(list(filter(lambda u : u.name == user.name, self.users))) != 0
@@ -35,6 +75,20 @@ class Room:
     self.__users.remove(user)
     if user == self.owner:
       self.__owner = self.__users[0]
+
+  def reseat(self, user: User) -> int:
+    for (i, user_in_room) in enumerate(self.__users):
+      if user_in_room.name == user.name:
+        self.__users[i] = user
+        if self.__owner.name == user.name:
+          self.__owner = user
+        return i
+    raise Exception("user not in room")
+
+  def game_state(self) -> bytes:
+    if self.__game is None and self.__state is not None:
+      return self.__state
+    return self.game.state()
       
   @property
   def users(self) -> list[User]:
@@ -62,4 +116,24 @@ class Room:
   
   @property
   def game(self) -> UnoGame:
-    return self.__game
\ No newline at end of file
+    if self.__game is None:
+      assert self.__state is not None
+      self.__game = UnoGame.from_state(self.__state, self.__seed)
+      self.__state = None
+    return self.__game
+
+  @property
+  def turn_started(self) -> float:
+    return self.__turn_started
+
+  @property
+  def seed(self) -> int:
+    return self.__seed
+
+  @property
+  def version(self) -> int:
+    return self.__version
+
+  @property
+  def lock(self) -> threading.Lock:
+    return self.__lock
\ No newline at end of file
@@ -0,0 +1,129 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+from typing import Any, Callable
+
+HANDOFF_SIZE = 1 << 21
+
+class HandOff(Exception):
+  shard: int
+  message: dict[str, Any]
+
+  def __init__(self, shard: int, message: dict[str, Any]) -> None:
+    super().__init__(f"connection handed off to shard {shard}")
+    self.shard = shard
+    self.message = message
+
+class Directory:
+  __connection: sqlite3.Connection
+  __lock: threading.Lock
+
+  def __init__(self, path: str) -> None:
+    self.__connection = sqlite3.connect(path, timeout=5.0, isolation_level=None, check_same_thread=False)
+    self.__lock = threading.Lock()
+    with self.__lock:
+      self.__connection.execute("PRAGMA journal_mode = wal")
+      self.__connection.execute("PRAGMA synchronous = off")
+      self.__connection.execute("CREATE TABLE IF NOT EXISTS session (username TEXT PRIMARY KEY, shard INTEGER NOT NULL)")
+      self.__connection.execute(
+        "CREATE TABLE IF NOT EXISTS room (id INTEGER PRIMARY KEY, owner TEXT UNIQUE NOT NULL, shard INTEGER NOT NULL)"
+      )
+      self.__connection.execute("CREATE TABLE IF NOT EXISTS seat (username TEXT PRIMARY KEY, shard INTEGER NOT NULL)")
+
+  def add_session(self, username: str, shard: int) -> None:
+    with self.__lock:
+      self.__connection.execute("INSERT OR REPLACE INTO session (username, shard) VALUES (?, ?)", (username, shard))
+
+  def remove_session(self, username: str, shard: int) -> None:
+    with self.__lock:
+      self.__connection.execute("DELETE FROM session WHERE username = ? AND shard = ?", (username, shard))
+
+  def session_count(self) -> int:
+    with self.__lock:
+      return self.__connection.execute("SELECT COUNT(*) FROM session").fetchone()[0]
+
+  def add_room(self, room_id: int, owner: str, shard: int) -> bool:
+    with self.__lock:
+      try:
+        self.__connection.execute("INSERT INTO room (id, owner, shard) VALUES (?, ?, ?)", (room_id, owner, shard))
+        return True
+      except sqlite3.IntegrityError:
+        return False
+
+  def remove_room(self, room_id: int) -> None:
+    with self.__lock:
+      self.__connection.execute("DELETE FROM room WHERE id = ?", (room_id,))
+
+  def room_shard(self, room_id: int) -> int | None:
+    with self.__lock:
+      row = self.__connection.execute("SELECT shard FROM room WHERE id = ?", (room_id,)).fetchone()
+    return row[0] if row else None
+
+  def add_seats(self, usernames: list[str], shard: int) -> None:
+    with self.__lock:
+      self.__connection.executemany(
+        "INSERT OR REPLACE INTO seat (username, shard) VALUES (?, ?)", [(username, shard) for username in usernames]
+      )
+
+  def seat_shard(self, username: str) -> int | None:
+    with self.__lock:
+      row = self.__connection.execute("SELECT shard FROM seat WHERE username = ?", (username,)).fetchone()
+    return row[0] if row else None
+
+  def remove_seat(self, username: str) -> None:
+    with self.__lock:
+      self.__connection.execute("DELETE FROM seat WHERE username = ?", (username,))
+
+  def close(self) -> None:
+    with self.__lock:
+      self.__connection.close()
+
+class Shard:
+  __index: int
+  __count: int
+  __rundir: str
+  __directory: Directory
+
+  def __init__(self, index: int, count: int, rundir: str) -> None:
+    self.__index = index
+    self.__count = count
+    self.__rundir = rundir
+    self.__directory = Directory(directory_path(rundir))
+
+  def socket_path(self, index: int) -> str:
+    return os.path.join(self.__rundir, f"shard-{index}.sock")
+
+  def send(self, index: int, connection: socket.socket, payload: dict[str, Any]) -> None:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET) as link:
+      link.connect(self.socket_path(index))
+      socket.send_fds(link, [json.dumps(payload).encode('utf-8')], [connection.fileno()])
+
+  def receive(self, adopt: Callable[[socket.socket, dict[str, Any]], None]) -> None:
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+    listener.bind(self.socket_path(self.__index))
+    listener.listen(socket.SOMAXCONN)
+    def run() -> None:
+      while (True):
+        link, _ = listener.accept()
+        with link:
+          data, fds, _, _ = socket.recv_fds(link, HANDOFF_SIZE, 1)
+        if fds:
+          adopt(socket.socket(fileno=fds[0]), json.loads(data))
+    threading.Thread(target=run, daemon=True).start()
+
+  @property
+  def index(self) -> int:
+    return self.__index
+
+  @property
+  def count(self) -> int:
+    return self.__count
+
+  @property
+  def directory(self) -> Directory:
+    return self.__directory
+
+def directory_path(rundir: str) -> str:
+  return os.path.join(rundir, "directory.db")
@@ -0,0 +1,101 @@
+import logging
+import os
+import struct
+import threading
+import time
+from typing import Callable
+
+from lib.metrics import metrics
+from lib.room import Room
+from lib.user import User
+
+MAGIC = b"UNOS\x01"
+ROOM_HEADER = struct.Struct(">QBBIBH")
+
+logger = logging.getLogger("snapshots")
+
+def encode_room(room: Room) -> bytes:
+  users = room.users
+  state = room.game_state()
+  owner_index = next(i for (i, user) in enumerate(users) if user.name == room.owner.name)
+  names = b"".join(
+    len(encoded).to_bytes(2) + encoded
+    for encoded in [user.name.encode('utf-8') for user in users]
+  )
+  record = ROOM_HEADER.pack(room.id, room.max_player_count, len(users), room.version, owner_index, len(state)) + names + state
+  return len(record).to_bytes(4) + record
+
+def decode_rooms(data: bytes | memoryview) -> list[Room]:
+  if bytes(data[:len(MAGIC)]) != MAGIC:
+    raise ValueError("not a room snapshot")
+  view = memoryview(data)
+  offset = len(MAGIC)
+  rooms = []
+  while offset < len(view):
+    record_length = int.from_bytes(view[offset:offset + 4])
+    offset += 4
+    record_end = offset + record_length
+    room_id, max_player_count, player_count, version, owner_index, state_length = ROOM_HEADER.unpack_from(view, offset)
+    offset += ROOM_HEADER.size
+    users = []
+    for i in range(player_count):
+      name_length = int.from_bytes(view[offset:offset + 2])
+      user = User(str(view[offset + 2:offset + 2 + name_length], 'utf-8'), None)
+      user.id = i
+      users.append(user)
+      offset += 2 + name_length
+    state = bytes(view[offset:offset + state_length])
+    rooms.append(Room.restore(room_id, users, users[owner_index], max_player_count, version, state))
+    offset = record_end
+  return rooms
+
+def read_snapshot(path: str) -> list[Room]:
+  with open(path, "rb") as snapshot:
+    return decode_rooms(snapshot.read())
+
+class SnapshotWriter:
+  __path: str
+  __rooms: Callable[[], list[Room]]
+  __interval: float
+  __stopped: threading.Event
+  __thread: threading.Thread | None
+
+  def __init__(self, path: str, rooms: Callable[[], list[Room]], interval: float = 5.0) -> None:
+    self.__path = path
+    self.__rooms = rooms
+    self.__interval = interval
+    self.__stopped = threading.Event()
+    self.__thread = None
+
+  def write(self) -> int:
+    start = time.perf_counter()
+    records = [MAGIC]
+    for room in self.__rooms():
+      with room.lock:
+        records.append(encode_room(room))
+    temporary_path = f"{self.__path}.tmp"
+    with open(temporary_path, "wb") as snapshot:
+      snapshot.write(b"".join(records))
+      snapshot.flush()
+      os.fsync(snapshot.fileno())
+    os.replace(temporary_path, self.__path)
+    metrics.observe("snapshot_seconds", time.perf_counter() - start)
+    return len(records) - 1
+
+  def start(self) -> None:
+    self.__thread = threading.Thread(target=self.__run, daemon=True)
+    self.__thread.start()
+
+  def stop(self) -> None:
+    if self.__thread:
+      self.__stopped.set()
+      self.__thread.join()
+      self.__thread = None
+    self.write()
+
+  def __run(self) -> None:
+    while not self.__stopped.wait(self.__interval):
+      try:
+        self.write()
+      except Exception as e:
+        logger.error("failed to write room snapshot: %s", e)
@@ -0,0 +1,142 @@
+import asyncio
+import contextvars
+import logging
+import queue
+import socket
+import threading
+import time
+from typing import Any, Iterator
+
+from lib.metrics import metrics
+from lib.proto import MessageType, broadcast_message
+
+logger = logging.getLogger("spectators")
+
+def update_key(message: dict[str, Any]) -> str | None:
+  return message["type"] if message["type"] == MessageType.SPECTATE_UPDATE.name else None
+
+class SpectatorHub:
+  __rooms: dict[int, dict[socket.socket, None]]
+  __watching: dict[socket.socket, int]
+  __lock: threading.Lock
+  __queue: queue.SimpleQueue
+  __interval: float
+  __chunk_size: int
+  __loop: asyncio.AbstractEventLoop | None
+  __pending: list[tuple[int, dict[str, Any] | None, socket.socket | None]]
+  __task: asyncio.Task | None
+  __thread: threading.Thread | None
+
+  def __init__(self, interval: float = 0.05, chunk_size: int = 64) -> None:
+    self.__rooms = {}
+    self.__watching = {}
+    self.__lock = threading.Lock()
+    self.__queue = queue.SimpleQueue()
+    self.__interval = interval
+    self.__chunk_size = chunk_size
+    self.__loop = None
+    self.__pending = []
+    self.__task = None
+    self.__thread = None
+
+  def subscribe(self, room_id: int, connection: socket.socket, snapshot: dict[str, Any] | None = None) -> None:
+    with self.__lock:
+      self.__unsubscribe(connection)
+      self.__rooms.setdefault(room_id, {})[connection] = None
+      self.__watching[connection] = room_id
+    if snapshot is not None:
+      self.__schedule((room_id, snapshot, connection))
+
+  def unsubscribe(self, connection: socket.socket) -> None:
+    with self.__lock:
+      self.__unsubscribe(connection)
+
+  def publish(self, room_id: int, message: dict[str, Any]) -> None:
+    if room_id in self.__rooms:
+      self.__schedule((room_id, message, None))
+
+  def close_room(self, room_id: int) -> None:
+    if room_id in self.__rooms:
+      self.__schedule((room_id, None, None))
+
+  def count(self, room_id: int) -> int:
+    return len(self.__rooms.get(room_id, ()))
+
+  def __len__(self) -> int:
+    return len(self.__watching)
+
+  def start(self) -> None:
+    self.__thread = threading.Thread(target=self.__run, daemon=True)
+    self.__thread.start()
+
+  def attach_loop(self, loop: asyncio.AbstractEventLoop) -> None:
+    self.__loop = loop
+
+  def __schedule(self, item: tuple[int, dict[str, Any] | None, socket.socket | None]) -> None:
+    if self.__loop is None:
+      self.__queue.put(item)
+      return
+    self.__pending.append(item)
+    if self.__task is None:
+      self.__task = self.__loop.create_task(self.__drain(), context=contextvars.Context())
+
+  def __unsubscribe(self, connection: socket.socket) -> None:
+    room_id = self.__watching.pop(connection, None)
+    if room_id is None:
+      return
+    watchers = self.__rooms.get(room_id)
+    if watchers is not None:
+      watchers.pop(connection, None)
+      if not watchers:
+        del self.__rooms[room_id]
+
+  async def __drain(self) -> None:
+    try:
+      while self.__pending:
+        await asyncio.sleep(self.__interval)
+        batch, self.__pending = self.__pending, []
+        for _ in self.__deliver(batch):
+          await asyncio.sleep(0)
+    except Exception as e:
+      logger.error("failed to deliver spectator updates: %s", e)
+    finally:
+      self.__task = None
+
+  def __run(self) -> None:
+    while (True):
+      batch = [self.__queue.get()]
+      while not self.__queue.empty():
+        batch.append(self.__queue.get())
+      try:
+        for _ in self.__deliver(batch):
+          time.sleep(0)
+      except Exception as e:
+        logger.error("failed to deliver spectator updates: %s", e)
+      time.sleep(self.__interval)
+
+  def __deliver(self, batch: list[tuple[int, dict[str, Any] | None, socket.socket | None]]) -> Iterator[None]:
+    latest: dict[int, int] = {}
+    for (i, (room_id, message, target)) in enumerate(batch):
+      if message is not None and target is None and message["type"] == MessageType.SPECTATE_UPDATE.name:
+        latest[room_id] = i
+    for (i, (room_id, message, target)) in enumerate(batch):
+      if message is None:
+        with self.__lock:
+          for connection in list(self.__rooms.get(room_id, ())):
+            self.__unsubscribe(connection)
+      elif target is not None:
+        with self.__lock:
+          watching = self.__watching.get(target) == room_id
+        if watching:
+          broadcast_message(message, [(target, {})], key=update_key(message))
+      elif message["type"] == MessageType.SPECTATE_UPDATE.name and latest[room_id] != i:
+        metrics.increment("spectator_updates_skipped_total")
+      else:
+        with self.__lock:
+          watchers = list(self.__rooms.get(room_id, ()))
+        prepared: dict[str, Any] = {}
+        for start in range(0, len(watchers), self.__chunk_size):
+          chunk = watchers[start:start + self.__chunk_size]
+          broadcast_message(message, [(connection, {}) for connection in chunk], update_key(message), prepared)
+          yield
+        metrics.increment("spectator_frames_total", len(watchers))
@@ -3,11 +3,13 @@ import socket
 class User:
   __name: str
   id: int
+  delta: bool
   __id_counter: int = 0
   __connection: socket.socket
   def __init__(self, name: str, connection: socket.socket) -> None:
     self.__name = name
     self.__connection = connection
+    self.delta = False
     User.__id_counter += 1
 
   @property
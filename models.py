@@ -1,7 +1,28 @@
-from peewee import SqliteDatabase, Model, CharField, IntegerField
+from collections import OrderedDict
+import logging
+import queue
+import threading
+import time
+from typing import Callable
+
+from peewee import SQL, SqliteDatabase, Model, CharField, IntegerField
+
+from lib.metrics import metrics
+
+logger = logging.getLogger("models")
 
 db = SqliteDatabase("uno.db")
 
+PRAGMAS = {"journal_mode": "wal", "synchronous": "normal"}
+
+RETRY_DELAY_LIMIT = 30.0
+FINAL_WRITE_ATTEMPTS = 3
+
+RATE_SCALE = 1_000_000
+MIN_RATED_GAMES = 10
+RATE_EXPRESSION = f"wins * {RATE_SCALE} / (wins + losses)"
+RATED_CONDITION = f"wins + losses >= {MIN_RATED_GAMES}"
+
 class User(Model):
     id = IntegerField(primary_key=True)
     username = CharField(unique=True, null=False)
@@ -12,8 +33,269 @@ class User(Model):
     class Meta:
         database = db
 
-db.connect()
-if __name__ == "__main__":
-  db.create_tables([User])
+User.add_index(SQL('CREATE INDEX IF NOT EXISTS "user_wins" ON "user" (wins DESC, username)'))
+User.add_index(SQL(
+    f'CREATE INDEX IF NOT EXISTS "user_win_rate" ON "user" ({RATE_EXPRESSION} DESC, username) WHERE {RATED_CONDITION}'
+))
+
+LEADER_QUERIES = {
+    "wins": 'SELECT username, wins, losses FROM "user" ORDER BY wins DESC, username LIMIT ?',
+    "win_rate": f'SELECT username, wins, losses FROM "user" WHERE {RATED_CONDITION} ORDER BY {RATE_EXPRESSION} DESC, username LIMIT ?',
+}
+COUNT_QUERIES = {
+    "wins": 'SELECT wins, COUNT(*) FROM "user" GROUP BY wins',
+    "win_rate": f'SELECT {RATE_EXPRESSION}, COUNT(*) FROM "user" WHERE {RATED_CONDITION} GROUP BY 1',
+}
+
+def open_database(path: str, timeout: float = 5.0) -> None:
+    db.init(path, pragmas=PRAGMAS, timeout=timeout)
+
+def ensure_indexes() -> None:
+    with db.atomic():
+        User._schema.create_indexes(safe=True)
+
+def select_stats(usernames: list[str]) -> list[tuple[str, int, int]]:
+    rows = []
+    for start in range(0, len(usernames), 500):
+        chunk = usernames[start:start + 500]
+        rows += db.execute_sql(
+            f'SELECT username, wins, losses FROM "user" WHERE username IN ({", ".join("?" * len(chunk))})', chunk
+        ).fetchall()
+    return rows
+
+class UserProfile:
+    __slots__ = ("id", "username", "wins", "losses")
+    id: int
+    username: str
+    wins: int
+    losses: int
+
+    def __init__(self, id: int, username: str, wins: int, losses: int) -> None:
+        self.id = id
+        self.username = username
+        self.wins = wins
+        self.losses = losses
+
+class UserCache:
+    __profiles: OrderedDict[str, UserProfile]
+    __lock: threading.Lock
+    __capacity: int
+    __hits: int
+    __misses: int
+
+    def __init__(self, stats_writer: "StatsWriter", capacity: int = 10_000) -> None:
+        self.__stats_writer = stats_writer
+        self.__profiles = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__capacity = capacity
+        self.__hits = 0
+        self.__misses = 0
+        stats_writer.attach_cache(self)
+
+    def get(self, username: str) -> UserProfile | None:
+        with self.__lock:
+            profile = self.__profiles.get(username)
+            if profile:
+                self.__profiles.move_to_end(username)
+                self.__hits += 1
+                return profile
+            self.__misses += 1
+        return self.__stats_writer.load_profile(username)
+
+    def put(self, profile: UserProfile) -> None:
+        with self.__lock:
+            self.__profiles[profile.username] = profile
+            self.__profiles.move_to_end(profile.username)
+            while len(self.__profiles) > self.__capacity:
+                self.__profiles.popitem(last=False)
+
+    def apply(self, username: str, wins: int, losses: int) -> None:
+        with self.__lock:
+            profile = self.__profiles.get(username)
+            if profile:
+                profile.wins += wins
+                profile.losses += losses
+
+    def invalidate(self, username: str) -> None:
+        with self.__lock:
+            self.__profiles.pop(username, None)
+
+    @property
+    def hits(self) -> int:
+        return self.__hits
 
+    @property
+    def misses(self) -> int:
+        return self.__misses
 
+    def __len__(self) -> int:
+        return len(self.__profiles)
+
+StatsChange = tuple[str, tuple[int, int] | None, tuple[int, int]]
+
+class StatsWriter:
+    __database: SqliteDatabase
+    __queue: queue.Queue
+    __thread: threading.Thread | None
+    __interval: float
+    __batch_size: int
+    __lock: threading.Lock
+    __flush_lock: threading.RLock
+    __flushes: int
+    __pending: dict[str, list[int]]
+    __caches: list[UserCache]
+    __listeners: list[Callable[[list[StatsChange]], None]]
+
+    def __init__(self, database: SqliteDatabase, interval: float = 1.0, batch_size: int = 256) -> None:
+        self.__database = database
+        self.__queue = queue.Queue()
+        self.__thread = None
+        self.__interval = interval
+        self.__batch_size = batch_size
+        self.__lock = threading.Lock()
+        self.__flush_lock = threading.RLock()
+        self.__flushes = 0
+        self.__pending = {}
+        self.__caches = []
+        self.__listeners = []
+
+    def attach_cache(self, cache: UserCache) -> None:
+        self.__caches.append(cache)
+
+    def add_listener(self, listener: Callable[[list[StatsChange]], None]) -> None:
+        self.__listeners.append(listener)
+
+    def paused(self) -> threading.RLock:
+        return self.__flush_lock
+
+    def create_user(self, username: str, password_hash: str) -> None:
+        with self.__flush_lock:
+            with metrics.timer("db_seconds", operation="create_user"), self.__database.atomic():
+                User.create(username=username, password=password_hash)
+            self.__notify([(username, None, (0, 0))])
+
+    def record_game(self, winner: str, losers: list[str]) -> None:
+        with self.__lock:
+            for (username, wins, losses) in [(winner, 1, 0), *[(loser, 0, 1) for loser in losers]]:
+                pending = self.__pending.setdefault(username, [0, 0])
+                pending[0] += wins
+                pending[1] += losses
+                for cache in self.__caches:
+                    cache.apply(username, wins, losses)
+        self.__queue.put((winner, losers))
+
+    def load_profile(self, username: str) -> UserProfile | None:
+        while True:
+            with self.__lock:
+                flushes = self.__flushes
+            with metrics.timer("db_seconds", operation="load_profile"), self.__database.atomic():
+                user = User.get_or_none(User.username == username)
+            if not user:
+                return None
+            with self.__lock:
+                if self.__flushes != flushes:
+                    continue
+                wins, losses = self.__pending.get(username, [0, 0])
+                profile = UserProfile(user.id, user.username, user.wins + wins, user.losses + losses)
+                for cache in self.__caches:
+                    cache.put(profile)
+                return profile
+
+    def load_leaders(self, order: str, limit: int) -> tuple[tuple[str, int, int] | None, list[tuple[str, int, int]]]:
+        with self.__flush_lock:
+            with metrics.timer("db_seconds", operation="load_leaders"), self.__database.atomic():
+                rows = self.__database.execute_sql(LEADER_QUERIES[order], (limit,)).fetchall()
+        return (rows[limit - 1] if len(rows) == limit else None), rows
+
+    def load_counts(self, order: str) -> list[tuple[int, int]]:
+        with self.__flush_lock:
+            with metrics.timer("db_seconds", operation="load_counts"), self.__database.atomic():
+                return self.__database.execute_sql(COUNT_QUERIES[order]).fetchall()
+
+    @property
+    def queued(self) -> int:
+        return self.__queue.qsize()
+
+    def start(self) -> None:
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+
+    def stop(self) -> None:
+        if self.__thread:
+            self.__queue.put(None)
+            self.__thread.join()
+            self.__thread = None
+
+    def __run(self) -> None:
+        batch: list[tuple[str, list[str]]] = []
+        deadline = time.monotonic() + self.__interval
+        failures = 0
+        while True:
+            try:
+                game = self.__queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                if game is None:
+                    break
+                batch.append(game)
+            except queue.Empty:
+                pass
+            if batch and (time.monotonic() >= deadline or not failures and len(batch) >= self.__batch_size):
+                if self.__write(batch):
+                    batch = []
+                    failures = 0
+                else:
+                    failures += 1
+                    deadline = time.monotonic() + self.__retry_delay(failures)
+                    continue
+            if time.monotonic() >= deadline:
+                deadline = time.monotonic() + self.__interval
+        for attempt in range(FINAL_WRITE_ATTEMPTS):
+            if attempt:
+                time.sleep(self.__retry_delay(attempt))
+            if not batch or self.__write(batch):
+                return
+        logger.error("dropped stats for %d games after %d failed writes", len(batch), FINAL_WRITE_ATTEMPTS)
+
+    def __retry_delay(self, failures: int) -> float:
+        return min(RETRY_DELAY_LIMIT, self.__interval * 2 ** failures)
+
+    def __write(self, batch: list[tuple[str, list[str]]]) -> bool:
+        deltas: dict[str, list[int]] = {}
+        for (winner, losers) in batch:
+            deltas.setdefault(winner, [0, 0])[0] += 1
+            for loser in losers:
+                deltas.setdefault(loser, [0, 0])[1] += 1
+        rows = [(wins, losses, username) for (username, (wins, losses)) in deltas.items()]
+        with self.__flush_lock:
+            try:
+                with metrics.timer("db_seconds", operation="write_stats"), self.__database.atomic():
+                    self.__database.cursor().executemany(
+                        'UPDATE "user" SET wins = wins + ?, losses = losses + ? WHERE username = ?', rows
+                    )
+                    stored = select_stats(list(deltas)) if self.__listeners else []
+            except Exception as e:
+                logger.error("failed to write stats for %d games, will retry: %s", len(batch), e)
+                metrics.increment("stats_write_failures_total")
+                return False
+            with self.__lock:
+                for (wins, losses, username) in rows:
+                    pending = self.__pending[username]
+                    pending[0] -= wins
+                    pending[1] -= losses
+                    if pending == [0, 0]:
+                        del self.__pending[username]
+                self.__flushes += 1
+            self.__notify([
+                (username, (wins - deltas[username][0], losses - deltas[username][1]), (wins, losses))
+                for (username, wins, losses) in stored
+            ])
+        return True
+
+    def __notify(self, changes: list[StatsChange]) -> None:
+        for listener in self.__listeners:
+            try:
+                listener(changes)
+            except Exception as e:
+                logger.error("stats listener failed: %s", e)
+
+if __name__ == "__main__":
+  db.create_tables([User])
@@ -0,0 +1,119 @@
+import argparse
+import json
+import time
+from typing import Any, Iterable
+
+from lib.journal import END, MOVE, RESTORE, START, read_journal
+from uno.uno import UnoGame
+
+class ReplayStats:
+  games: int
+  mismatches: int
+  abandoned: int
+  orphaned_moves: int
+  moves: int
+  draws: int
+  game_moves: list[int]
+  game_seconds: list[float]
+  seat_wins: dict[int, int]
+  errors: list[str]
+
+  def __init__(self) -> None:
+    self.games = 0
+    self.mismatches = 0
+    self.abandoned = 0
+    self.orphaned_moves = 0
+    self.moves = 0
+    self.draws = 0
+    self.game_moves = []
+    self.game_seconds = []
+    self.seat_wins = {}
+    self.errors = []
+
+  def mismatch(self, room_id: int, reason: str) -> None:
+    self.mismatches += 1
+    if len(self.errors) < 20:
+      self.errors.append(f"room {room_id}: {reason}")
+
+def replay(records: Iterable[tuple], stats: ReplayStats) -> None:
+  games: dict[int, tuple[UnoGame, float, list[int]]] = {}
+  for record in records:
+    kind, room_id, timestamp = record[:3]
+    if kind == START:
+      if room_id in games:
+        stats.abandoned += 1
+      games[room_id] = (UnoGame(record[3], seed=record[4]), timestamp, [0])
+    elif kind == RESTORE:
+      entry = games.get(room_id)
+      if entry and entry[0].state() != record[4]:
+        stats.mismatch(room_id, "restored state differs from replayed state")
+        entry = None
+      started_at, moves = (entry[1], entry[2]) if entry else (timestamp, [0])
+      games[room_id] = (UnoGame.from_state(record[4], record[3]), started_at, moves)
+    elif kind == MOVE:
+      entry = games.get(room_id)
+      if not entry:
+        stats.orphaned_moves += 1
+        continue
+      game, _, moves = entry
+      _, _, _, player, card_index, card_code, color = record
+      try:
+        if card_index is None:
+          game.play(player)
+          stats.draws += 1
+        else:
+          hand = game.players[player].hand
+          if card_index >= len(hand) or hand[card_index].code != card_code:
+            raise ValueError(f"card {card_code} is not at index {card_index} of player {player}")
+          game.play(player, card_index, color)
+      except ValueError as e:
+        stats.mismatch(room_id, str(e))
+        del games[room_id]
+        continue
+      moves[0] += 1
+      stats.moves += 1
+    elif kind == END:
+      entry = games.pop(room_id, None)
+      if not entry:
+        continue
+      game, started_at, moves = entry
+      if game.winner is None or game.winner.player_id != record[3]:
+        stats.mismatch(room_id, f"journal winner {record[3]} but engine winner {game.winner}")
+        continue
+      stats.games += 1
+      stats.game_moves.append(moves[0])
+      stats.game_seconds.append(timestamp - started_at)
+      stats.seat_wins[record[3]] = stats.seat_wins.get(record[3], 0) + 1
+  stats.abandoned += len(games)
+
+def percentiles(values: list[float]) -> dict[str, float]:
+  ordered = sorted(values)
+  pick = lambda fraction: ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+  return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99)}
+
+def run(paths: list[str]) -> dict[str, Any]:
+  stats = ReplayStats()
+  start = time.perf_counter()
+  for path in paths:
+    with open(path, "rb") as journal:
+      replay(read_journal(journal.read()), stats)
+  elapsed = time.perf_counter() - start
+  return {
+    "games": stats.games,
+    "moves": stats.moves,
+    "draws": stats.draws,
+    "mismatches": stats.mismatches,
+    "abandoned": stats.abandoned,
+    "orphaned_moves": stats.orphaned_moves,
+    "replay_moves_per_sec": stats.moves / elapsed if elapsed else 0.0,
+    "moves_per_game": percentiles(stats.game_moves),
+    "game_seconds": percentiles(stats.game_seconds),
+    "seat_wins": {str(seat): wins for (seat, wins) in sorted(stats.seat_wins.items())},
+    "errors": stats.errors,
+  }
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="replay move journals through the engine, verify them and report stats")
+  parser.add_argument("journals", nargs="+")
+  args = parser.parse_args()
+  print(json.dumps(run(args.journals)))
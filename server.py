@@ -1,35 +1,83 @@
+import argparse
+import asyncio
+import logging
+import logging.handlers
+import multiprocessing
+import os
+import queue
+import shutil
+import signal
 import socket
+import sys
+import tempfile
 import threading
+import time
+from typing import Any
 
-from lib.proto import MessageType, recv_message, send_message
+from lib.auth import Authenticator
+from lib.journal import Journal
+from lib.leaderboard import ORDERS, Leaderboard
+from lib.matchmaking import Matchmaker
+from lib.metrics import SIZE_BUCKETS, metrics
+from lib.proto import CODECS, COMPRESSORS, MessageType, Outbox, StreamConnection, StreamOutbox, attach_outbox, begin_request, broadcast_message, connection_codec, connection_compressor, connection_outbox, end_request, frame_reader, is_backlogged, live_outboxes, live_traffic, recv_message, recv_message_async, release_connection, send_message, set_codec, set_compression, track_traffic
+from lib.registry import RoomRegistry, SessionRegistry
 from lib.room import Room
+from lib.shards import Directory, HandOff, Shard, directory_path
+from lib.snapshots import SnapshotWriter, read_snapshot
+from lib.spectators import SpectatorHub
 from lib.user import User
+from uno.uno import MAX_PLAYERS, MIN_PLAYERS, UnoCard, UnoGame
 
 import models
 from models import db
 
-active_rooms: list[Room] = []
+active_rooms = RoomRegistry()
 active_rooms_lock = threading.Lock()
-active_sessions: list[User] = []
+active_sessions = SessionRegistry()
 active_sessions_lock = threading.Lock()
+stats_writer = models.StatsWriter(db)
+user_cache = models.UserCache(stats_writer)
+leaderboard = Leaderboard(stats_writer, user_cache)
+authenticator = Authenticator()
+matchmaker = Matchmaker()
+spectators = SpectatorHub()
+shard: Shard | None = None
+journal: Journal | None = None
+read_timeout: float | None = None
+idle_timeout: float | None = None
+turn_timeout: float | None = None
+outbox_limit = 64
+outbox_stall_timeout = 10.0
+compression_level = 6
+compression_threshold = 128
+logger = logging.getLogger("server")
+
+def create_user(username: str, password_hash: str) -> bool:
+  try:
+    stats_writer.create_user(username, password_hash)
+  except:
+    return False
+  return True
+
+def reply_register(connection: socket.socket, username: str, created: bool) -> None:
+  if created:
+    send_message(connection, {
+      "type": MessageType.OK.name
+    })
+    logger.info("user %s registered", username)
+  else:
+    send_message(connection, {
+      "type": MessageType.ERROR.name
+    })
+    logger.warning("failed to register user %s", username)
 
 def register_user(connection: socket.socket, message: dict[str, str]) -> None:
   username: str = message["username"]
   password: str = message["password"]
-  with db.atomic():
-    try:
-      models.User.create(username=username, password=password)
-      send_message(connection, {
-        "type": MessageType.OK.name
-      })
-      print(f"user {username} registered")
-    except:
-      send_message(connection, {
-        "type": MessageType.ERROR.name
-      })
-      print(f"failed to register user {username}")
+  password_hash = authenticator.hash(password).result()
+  reply_register(connection, username, create_user(username, password_hash))
 
-def login_user(connection: socket.socket, message: dict[str, str], active_session: User | None) -> User | None:
+def login_user(connection: socket.socket, message: dict[str, str], active_session: User | None, verified: bool | None = None) -> User | None:
   username: str = message["username"]
   password: str = message["password"]
   try:
@@ -37,61 +85,83 @@ def login_user(connection: socket.socket, message: dict[str, str], active_sessio
       send_message(connection, {
         "type": MessageType.ERROR.name
       })
-      print(f"user {active_session.name} already logged in")
+      logger.warning("user %s already logged in", active_session.name)
       return active_session
-    with db.atomic():
-      user = models.User.get_or_none(models.User.username == username, models.User.password == password)
-    if not user:
+    if verified is None:
+      verified = authenticator.verify(username, password).result()
+    if not verified:
       send_message(connection, {
         "type": MessageType.ERROR.name
       })
-      print(f"failed to login user {username}")
+      logger.warning("failed to login user %s", username)
       return None
     with active_sessions_lock:
       active_session = User(username, connection)
-      active_sessions.append(active_session)
-    send_message(connection, {
+      active_sessions.add(active_session)
+    if shard:
+      shard.directory.add_session(username, shard.index)
+      user_cache.invalidate(username)
+    response: dict[str, Any] = {
       "type": MessageType.OK.name
-    })
-    print(f"user {username} logged in")
+    }
+    codec = message.get("codec")
+    if codec in CODECS:
+      response["codec"] = codec
+    if message.get("delta"):
+      active_session.delta = True
+      response["delta"] = True
+    compression = message.get("compression")
+    if compression in COMPRESSORS and compression_threshold:
+      response["compression"] = compression
+    send_message(connection, response)
+    if codec in CODECS:
+      set_codec(connection, codec)
+    if "compression" in response:
+      set_compression(connection, compression, compression_level, compression_threshold)
+    logger.info("user %s logged in", username)
     return active_session
   except:
     send_message(connection, {
       "type": MessageType.ERROR.name
     })
-    print(f"failed to login user {username}")
+    logger.warning("failed to login user %s", username)
     return None
 
 def whoami(connection: socket.socket, client_address: tuple[str, int], user: User | None) -> None:
-  if not user:
+  send_profile(connection, client_address, user, user_cache.get(user.name) if user else None)
+
+def send_profile(connection: socket.socket, client_address: tuple[str, int], user: User | None, user_data: models.UserProfile | None) -> None:
+  if not user or not user_data:
     send_message(connection, {
       "type": MessageType.ERROR.name
     })
-    print(f"failed to get user information for {client_address}")
-  else:
-    with db.atomic():
-      user_data = models.User.get(models.User.username == user.name)
-    send_message(connection, {
-      "type": MessageType.OK.name,
-      "username": user.name,
-      "wins": user_data.wins,
-      "losses": user_data.losses
-    })
-    print(f"sent user information for {client_address}")
+    logger.warning("failed to get user information for %s", client_address)
+    return
+  send_message(connection, {
+    "type": MessageType.OK.name,
+    "username": user.name,
+    "wins": user_data.wins,
+    "losses": user_data.losses
+  })
+  logger.debug("sent user information for %s", client_address)
 
 def logout_user(connection: socket.socket, client_address: tuple[str, int], user: User | None) -> None:
-  with active_sessions_lock:
-    if user:
+  if user:
+    matchmaker.cancel(user)
+    authenticator.forget(user.name)
+    with active_sessions_lock:
       active_sessions.remove(user)
-      send_message(connection, {
-        "type": MessageType.OK.name
-      })
-      print(f"user {user.name} logged out")
-    else:
-      send_message(connection, {
-        "type": MessageType.ERROR.name
-      })
-      print(f"failed to logout user {client_address}")
+    if shard:
+      shard.directory.remove_session(user.name, shard.index)
+    send_message(connection, {
+      "type": MessageType.OK.name
+    })
+    logger.info("user %s logged out", user.name)
+  else:
+    send_message(connection, {
+      "type": MessageType.ERROR.name
+    })
+    logger.warning("failed to logout user %s", client_address)
 
 def create_room(connection: socket.socket, message: dict[str, int], user: User | None) -> Room | None:
   player_count = message["player_count"]
@@ -99,115 +169,367 @@ def create_room(connection: socket.socket, message: dict[str, int], user: User |
     send_message(connection, {
       "type": MessageType.ERROR.name
     })
-    print(f"failed to create room")
+    logger.warning("failed to create room")
+    return None
+  matchmaker.cancel(user)
+  try:
+    room = Room(user, player_count)
+  except:
+    send_message(connection, {
+      "type": MessageType.ERROR.name
+    })
+    logger.warning("failed to create room for %s", user.name)
+    return None
+  if shard and not shard.directory.add_room(room.id, user.name, shard.index):
+    send_message(connection, {
+      "type": MessageType.ERROR.name
+    })
+    logger.warning("user %s already has a room", user.name)
     return None
   with active_rooms_lock:
-    room = next(filter(lambda r: r.owner.name == user.name if user else None, active_rooms), None)
-    if room:
-      send_message(connection, {
-        "type": MessageType.ERROR.name
-      })
-      print(f"user {user.name} already has a room")
-      return None
-  with active_rooms_lock:
-    try:
-      room = Room(user, player_count)
-      active_rooms.append(room)
-    except:
-      send_message(connection, {
-        "type": MessageType.ERROR.name
-      })
-      print(f"failed to create room for {user.name}")
-      return None
+    has_room = active_rooms.by_owner(user.name) is not None
+    if not has_room:
+      active_rooms.add(room)
+  if has_room:
+    forget_room(room)
+    send_message(connection, {
+      "type": MessageType.ERROR.name
+    })
+    logger.warning("user %s already has a room", user.name)
+    return None
+  if journal:
+    journal.record_start(room)
   send_message(connection, {
     "type": MessageType.OK.name,
     "room_id": room.id
   })
   user.id = 0
-  print(f"room {room.id} created by {user.name}")
+  logger.info("room %s created by %s", room.id, user.name)
   return room
 
+def forget_room(room: Room) -> None:
+  spectators.close_room(room.id)
+  if shard:
+    shard.directory.remove_room(room.id)
+
+def serialize_card(card: UnoCard) -> dict[str, Any]:
+  return {
+    "color": card.color,
+    "type": card.card_type,
+  }
+
+def serialize_current_card(game: UnoGame) -> dict[str, Any]:
+  return {
+    "color": game.current_card.color 
+      if game.current_card.color != "black" or game.current_card.temp_color == None 
+      else game.current_card.temp_color,
+    "type": game.current_card.card_type,
+  }
+
+def game_snapshot(room: Room, player_id: int) -> dict[str, Any]:
+  return {
+    "type": MessageType.GAME_UPDATE.name,
+    "version": room.version,
+    "hand": list(map(serialize_card, room.game.players[player_id].hand)),
+    "turn": room.game.current_player.player_id,
+    "id": player_id,
+    "current_card": serialize_current_card(room.game),
+  }
+
+def send_game_update(room: Room, hand_sizes: list[int], mover_id: int, dropped_index: int | None) -> None:
+  full_update: dict[str, Any] = {
+    "type": MessageType.GAME_UPDATE.name,
+    "version": room.bump_version(),
+    "turn": room.game.current_player.player_id,
+    "current_card": serialize_current_card(room.game),
+  }
+  delta_update = dict(full_update)
+  if dropped_index is None:
+    del delta_update["current_card"]
+  full_recipients: list[tuple[socket.socket, dict[str, Any]]] = []
+  delta_recipients: list[tuple[socket.socket, dict[str, Any]]] = []
+  for (i, user_in_room) in enumerate(room.users):
+    hand = room.game.players[i].hand
+    if not user_in_room.delta or is_backlogged(user_in_room.connection):
+      full_recipients.append((user_in_room.connection, {
+        "hand": list(map(serialize_card, hand)),
+      }))
+      continue
+    removed = [dropped_index] if i == mover_id and dropped_index is not None else []
+    delta_recipients.append((user_in_room.connection, {
+      "removed": removed,
+      "added": list(map(serialize_card, hand[hand_sizes[i] - len(removed):])),
+    }))
+  broadcast_message(full_update, full_recipients, key=MessageType.GAME_UPDATE.name)
+  broadcast_message(delta_update, delta_recipients)
+  if spectators.count(room.id):
+    spectators.publish(room.id, public_update(room))
+
 def join_room(connection: socket.socket, message: dict[str, str], user: User | None) -> Room | None:
   if not user:
-    print(f"user cannot join because not logged in")
+    logger.warning("user cannot join because not logged in")
     send_message(connection, {
       "type": MessageType.ERROR.name
     })
     return None
+  matchmaker.cancel(user)
   room_id = message["room_id"]
   with active_rooms_lock:
-    active_room = next(filter(lambda room : room.id == room_id, active_rooms), None)
-    if not active_room:
-      print(f"user {user.name} cannot join because room {room_id} does not exists")
+    active_room = active_rooms.get(room_id)
+  if not active_room and shard:
+    owner_shard = shard.directory.room_shard(room_id)
+    if owner_shard is not None and owner_shard != shard.index:
+      raise HandOff(owner_shard, message)
+  if not active_room:
+    logger.warning("user %s cannot join because room %s does not exists", user.name, room_id)
+    send_message(connection, {
+      "type": MessageType.ERROR.name
+    })
+    return None
+  with active_room.lock:
+    joined = False
+    with active_rooms_lock:
+      is_active = room_id in active_rooms
+      is_full = active_room.is_full
+      if is_active and not is_full:
+        try:
+          active_rooms.join(active_room, user)
+          joined = True
+        except:
+          pass
+    if not is_active:
+      logger.warning("user %s cannot join because room %s does not exists", user.name, room_id)
       send_message(connection, {
         "type": MessageType.ERROR.name
       })
       return None
-    if active_room.is_full:
-      print(f"user {user.name} cannot join because room {room_id} is full")
+    if is_full:
+      logger.warning("user %s cannot join because room %s is full", user.name, room_id)
       send_message(connection, {
         "type": MessageType.ERROR.name
       })
       return None
-    try:
-      active_room.add_user(user)
-      print(f"user {user.name} joined room {room_id}")
-    except:
-      print(f"user {user.name} cannot join because room {room_id} already is joined")
+    if not joined:
+      logger.warning("user %s cannot join because room %s already is joined", user.name, room_id)
       send_message(connection, {
         "type": MessageType.ERROR.name
       })
       return None
-    for user_in_room in active_room.users:
-      send_message(user_in_room.connection, {
-        "type": MessageType.ROOM_JOIN_UPDATE.name,
-        "username": user.name,
-        "max_player_count": active_room.max_player_count,
-        "current_player_count": len(active_room.users)
-      })
-    if active_room.is_full:
-      print(f"game with id {room_id} started")
-      for (i, user_in_room) in enumerate(active_room.users):
-        send_message(user_in_room.connection, {
-          "type": MessageType.GAME_START_UPDATE.name,
-          "hand": list(map(lambda card: {
-              "color": card.color,
-              "type": card.card_type,
-            }, 
-            active_room.game.players[i].hand
-          )),
-          "turn": active_room.game.current_player.player_id,
-          "id": i,
-          "current_card": {
-            "color": active_room.game.current_card.color,
-            "type": active_room.game.current_card.card_type,
-          }
-        })
+    logger.info("user %s joined room %s", user.name, room_id)
     user.id = len(active_room.users) - 1
+    broadcast_message({
+      "type": MessageType.ROOM_JOIN_UPDATE.name,
+      "username": user.name,
+      "max_player_count": active_room.max_player_count,
+      "current_player_count": len(active_room.users)
+    }, [(user_in_room.connection, {}) for user_in_room in active_room.users])
+    if active_room.is_full:
+      start_game(active_room)
     return active_room
+
+def start_game(room: Room) -> None:
+  room.start_turn()
+  logger.info("game with id %s started", room.id)
+  broadcast_message({
+    "type": MessageType.GAME_START_UPDATE.name,
+    "room_id": room.id,
+    "version": room.version,
+    "turn": room.game.current_player.player_id,
+    "current_card": serialize_current_card(room.game)
+  }, [
+    (user_in_room.connection, {
+      "hand": list(map(serialize_card, room.game.players[i].hand)),
+      "id": i,
+    })
+    for (i, user_in_room) in enumerate(room.users)
+  ])
+  if spectators.count(room.id):
+    spectators.publish(room.id, public_update(room))
+
+def public_update(room: Room) -> dict[str, Any]:
+  return {
+    "type": MessageType.SPECTATE_UPDATE.name,
+    "room_id": room.id,
+    "version": room.version,
+    "turn": room.game.current_player.player_id,
+    "current_card": serialize_current_card(room.game),
+    "hand_sizes": [len(player.hand) for player in room.game.players],
+  }
+
+def spectate(connection: socket.socket, message: dict[str, Any]) -> None:
+  with active_rooms_lock:
+    room = active_rooms.get(message.get("room_id"))
+  if not room:
+    send_message(connection, {
+      "type": MessageType.ERROR.name
+    })
+    logger.warning("cannot spectate missing room %s", message.get("room_id"))
+    return
+  with room.lock:
+    with active_rooms_lock:
+      is_active = active_rooms.get(room.id) is room
+    if not is_active:
+      send_message(connection, {
+        "type": MessageType.ERROR.name
+      })
+      return
+    send_message(connection, {
+      "type": MessageType.OK.name,
+      "room_id": room.id,
+      "max_player_count": room.max_player_count,
+      "current_player_count": room.player_count,
+    })
+    spectators.subscribe(room.id, connection, public_update(room) if room.is_full else None)
+  logger.debug("connection now spectating room %s", room.id)
+
+def list_rooms(connection: socket.socket, message: dict[str, Any]) -> None:
+  cursor = message.get("cursor")
+  limit = message.get("limit", 20)
+  if (cursor is not None and type(cursor) is not int) or type(limit) is not int:
+    send_message(connection, {
+      "type": MessageType.ERROR.name
+    })
+    logger.warning("invalid room list request")
+    return
+  limit = max(1, min(100, limit))
+  with active_rooms_lock:
+    rooms = active_rooms.open_rooms(cursor, limit)
+  send_message(connection, {
+    "type": MessageType.OK.name,
+    "rooms": [
+      {
+        "room_id": room.id,
+        "username": room.owner.name,
+        "max_player_count": room.max_player_count,
+        "current_player_count": room.player_count,
+      }
+      for room in rooms
+    ],
+    "cursor": rooms[-1].id if len(rooms) == limit else None,
+  })
+
+def leaderboard_response(message: dict[str, Any], user: User | None) -> dict[str, Any]:
+  order = message.get("order", ORDERS[0])
+  cursor = message.get("cursor") or 0
+  limit = message.get("limit", 20)
+  if order not in ORDERS or type(cursor) is not int or cursor < 0 or type(limit) is not int:
+    logger.warning("invalid leaderboard request")
+    return {
+      "type": MessageType.ERROR.name
+    }
+  entries, next_cursor = leaderboard.page(order, cursor, max(1, min(100, limit)))
+  response: dict[str, Any] = {
+    "type": MessageType.OK.name,
+    "order": order,
+    "entries": entries,
+    "cursor": next_cursor,
+  }
+  if user:
+    response["rank"] = leaderboard.rank(order, user.name)
+  return response
+
+def leaderboard_page(connection: socket.socket, message: dict[str, Any], user: User | None) -> None:
+  send_message(connection, leaderboard_response(message, user))
+
+def refresh_leaderboard(interval: float) -> None:
+  while (True):
+    time.sleep(interval)
+    try:
+      leaderboard.load()
+    except Exception as e:
+      logger.error("failed to refresh leaderboard: %s", e)
+
+def matchmake(connection: socket.socket, message: dict[str, Any], user: User | None, profile: models.UserProfile | None) -> Room | None:
+  player_count = message.get("player_count")
+  if not user or type(player_count) is not int or not MIN_PLAYERS <= player_count <= MAX_PLAYERS:
+    send_message(connection, {
+      "type": MessageType.ERROR.name
+    })
+    logger.warning("failed to queue for matchmaking")
+    return None
+  with active_rooms_lock:
+    in_room = active_rooms.by_member(user.name) is not None
+  if in_room or not profile:
+    send_message(connection, {
+      "type": MessageType.ERROR.name
+    })
+    logger.warning("user %s cannot queue for matchmaking", user.name)
+    return None
+  send_message(connection, {
+    "type": MessageType.OK.name
+  })
+  logger.debug("user %s queued for a %d player game", user.name, player_count)
+  users = matchmaker.enqueue(user, player_count, profile.wins, profile.losses)
+  return start_match(users) if users else None
+
+def start_match(users: list[User]) -> Room | None:
+  owner = users[0]
+  room: Room | None = Room(owner, len(users))
+  if shard and not shard.directory.add_room(room.id, owner.name, shard.index):
+    room = None
+  if room:
+    with room.lock:
+      with active_rooms_lock:
+        conflict = any(active_rooms.by_member(user.name) for user in users)
+        if not conflict:
+          active_rooms.add(room)
+          for user in users[1:]:
+            active_rooms.join(room, user)
+      if conflict:
+        forget_room(room)
+        room = None
+      else:
+        for (i, user) in enumerate(users):
+          user.id = i
+        if journal:
+          journal.record_start(room)
+        start_game(room)
+  if not room:
+    logger.warning("failed to start matched game for %s", ", ".join(user.name for user in users))
+    broadcast_message({
+      "type": MessageType.ERROR.name
+    }, [(user.connection, {}) for user in users])
+    return None
+  metrics.increment("matches_total", player_count=len(users))
+  logger.info("matched %s into room %s", ", ".join(user.name for user in users), room.id)
+  return room
+
+def seated_room(user: User | None) -> Room | None:
+  if not user:
+    return None
+  with active_rooms_lock:
+    room = active_rooms.by_member(user.name)
+  if room and any(seat is user for seat in room.users):
+    return room
+  return None
    
 def drop_card(connection: socket.socket, message: dict[str, int], user: User | None, room: Room | None) -> None:
   if not user or not room:
-    print(f"failed to drop card")
+    logger.warning("failed to drop card")
     send_message(connection, {
       "type": MessageType.ERROR.name
     })
     return 
+  with room.lock:
+    play_card(connection, message, user, room)
+
+def play_card(connection: socket.socket, message: dict[str, int], user: User, room: Room) -> None:
   card_index = message["card_index"]
   current_player = room.game.current_player
-  if user.id != current_player.player_id:
-    print(f"failed to drop card")
+  if user.id != current_player.player_id or not room.is_full or not 0 <= card_index < len(current_player.hand):
+    logger.warning("failed to drop card")
     send_message(connection, {
       "type": MessageType.ERROR.name
     })
     return
   card = current_player.hand[card_index]
+  hand_sizes = [len(player.hand) for player in room.game.players]
   if current_player.can_play(room.game.current_card) and room.game.current_card.playable(card):
     new_color = None
     if card.color == 'black':
       new_color = message["color"]
       if new_color not in ["red", "green", "blue", "yellow"]:
-        print(f"failed to drop card")
+        logger.warning("failed to drop card")
         send_message(connection, {
           "type": MessageType.ERROR.name
         })
@@ -215,170 +537,656 @@ def drop_card(connection: socket.socket, message: dict[str, int], user: User | N
       room.game.play(player=current_player.player_id, card=card_index, new_color=new_color)
     else:
       room.game.play(player=current_player.player_id, card=card_index)
+    room.start_turn()
+    if journal:
+      journal.record_move(room.id, current_player.player_id, card_index, card.code, new_color)
     if len(current_player.hand) == 0:
-      for (i, user_in_room) in enumerate(room.users):
-        send_message(user_in_room.connection, {
-          "type": MessageType.GAME_END_UPDATE.name,
-          "winner": room.users[current_player.player_id].name
-        })
-        if i == current_player.player_id:
-          with db.atomic():
-            user = models.User.get(models.User.username == user_in_room.name)
-            if type(user) == models.User:  
-              user.wins += 1
-              user.save()
-          continue
-        with db.atomic():
-          user = models.User.get(models.User.username == user_in_room.name)
-          if type(user) == models.User:  
-            user.losses += 1
-            user.save()
+      if journal:
+        journal.record_end(room.id, current_player.player_id)
+      winner = room.users[current_player.player_id].name
+      losers = [user_in_room.name for (i, user_in_room) in enumerate(room.users) if i != current_player.player_id]
+      stats_writer.record_game(winner, losers)
       with active_rooms_lock:
         active_rooms.remove(room)
+      game_end = {
+        "type": MessageType.GAME_END_UPDATE.name,
+        "winner": room.users[current_player.player_id].name
+      }
+      spectators.publish(room.id, game_end)
+      forget_room(room)
+      broadcast_message(game_end, [(user_in_room.connection, {}) for user_in_room in room.users])
     else:
-      for (i, user_in_room) in enumerate(room.users):
-        send_message(user_in_room.connection, { 
-          "type": MessageType.GAME_UPDATE.name,
-          "hand": list(map(lambda card: {
-              "color": card.color,
-              "type": card.card_type,
-            }, 
-            room.game.players[i].hand
-          )),
-          "turn": room.game.current_player.player_id,
-          "current_card": {
-            "color": room.game.current_card.color 
-            if room.game.current_card.color != "black" or room.game.current_card.temp_color == None 
-            else room.game.current_card.temp_color,
-            "type": room.game.current_card.card_type,
-          },
-        })
+      send_game_update(room, hand_sizes, current_player.player_id, card_index)
     return
   
-  print(f"failed to drop card")
+  logger.warning("failed to drop card")
   send_message(connection, {
     "type": MessageType.ERROR.name
   })
   
 def draw_card(connection: socket.socket, message: dict[str, int], user: User | None, room: Room | None) -> None:
   if not user or not room:
-    print(f"failed to draw card")
+    logger.warning("failed to draw card")
     send_message(connection, {
       "type": MessageType.ERROR.name
     })
     return 
+  with room.lock:
+    pick_card(connection, user, room)
+
+def pick_card(connection: socket.socket, user: User, room: Room) -> None:
   current_player = room.game.current_player
-  if user.id != current_player.player_id:
-    print(f"failed to draw card")
+  if user.id != current_player.player_id or not room.is_full:
+    logger.warning("failed to draw card")
     send_message(connection, {
       "type": MessageType.ERROR.name
     })
     return
+  draw_for_current_player(room)
+
+def draw_for_current_player(room: Room) -> None:
+  current_player = room.game.current_player
+  hand_sizes = [len(player.hand) for player in room.game.players]
   room.game.play(player=current_player.player_id, card=None)
-  for (i, user_in_room) in enumerate(room.users):
-    send_message(user_in_room.connection, { 
-      "type": MessageType.GAME_UPDATE.name,
-      "hand": list(map(lambda card: {
-          "color": card.color,
-          "type": card.card_type,
-        }, 
-        room.game.players[i].hand
-      )),
-      "turn": room.game.current_player.player_id,
-      "current_card": {
-        "color": room.game.current_card.color 
-          if room.game.current_card.color != "black" or room.game.current_card.temp_color == None 
-          else room.game.current_card.temp_color,
-        "type": room.game.current_card.card_type,
-      }
-    })
+  room.start_turn()
+  if journal:
+    journal.record_move(room.id, current_player.player_id, None, None, None)
+  send_game_update(room, hand_sizes, current_player.player_id, None)
   if len(current_player.hand) == 0:
-    for user_in_room in room.users:
-      send_message(user_in_room.connection, {
-        "type": MessageType.GAME_END_UPDATE.name,
-        "winner": current_player.name
-      })
+    if journal:
+      journal.record_end(room.id, current_player.player_id)
     with active_rooms_lock:
       active_rooms.remove(room)
+    game_end = {
+      "type": MessageType.GAME_END_UPDATE.name,
+      "winner": room.users[current_player.player_id].name
+    }
+    spectators.publish(room.id, game_end)
+    forget_room(room)
+    broadcast_message(game_end, [(user_in_room.connection, {}) for user_in_room in room.users])
     return
   
-def serve_client(connection: socket.socket, client_address: tuple[str, int]) -> None:
+def reclaim_seat(user: User, message: dict[str, Any]) -> Room | None:
+  with active_rooms_lock:
+    room = active_rooms.by_member(user.name)
+  if not room and shard:
+    seat_shard = shard.directory.seat_shard(user.name)
+    if seat_shard is not None and seat_shard != shard.index:
+      raise HandOff(seat_shard, message)
+  if not room:
+    return None
+  with room.lock:
+    user.id = room.reseat(user)
+  if shard:
+    shard.directory.remove_seat(user.name)
+  logger.info("user %s reclaimed seat %d in room %d", user.name, user.id, room.id)
+  return room
+
+def resync_game(connection: socket.socket, message: dict[str, Any], user: User | None, room: Room | None) -> Room | None:
+  if user and not room:
+    room = reclaim_seat(user, message)
+  if not user or not room or not room.is_full:
+    logger.warning("failed to resync game")
+    send_message(connection, {
+      "type": MessageType.ERROR.name
+    })
+    return room
+  with room.lock:
+    snapshot = game_snapshot(room, user.id)
+  send_message(connection, snapshot)
+  logger.debug("sent game snapshot to %s", user.name)
+  return room
+
+def handle_message(connection: socket.socket, client_address: tuple[str, int], message: dict[str, Any], user: User | None, room: Room | None) -> tuple[User | None, Room | None]:
+  if message["type"] == MessageType.REGISTER_REQUEST.name:
+    register_user(connection, message)
+  elif message["type"] == MessageType.LOGIN_REQUEST.name:
+    with metrics.timer("handler_seconds", handler="login_user"):
+      user = login_user(connection, message, user)
+  elif message["type"] == MessageType.WHOAMI_REQUEST.name:
+    whoami(connection, client_address, user)
+  elif (message["type"] == MessageType.LOGOUT_REQUEST.name):
+    logout_user(connection, client_address, user)
+    user = None
+  elif (message["type"] == MessageType.ROOM_CREATION_REQUEST.name):
+    room = create_room(connection, message, user)
+  elif (message["type"] == MessageType.ROOM_CONNECTION_REQUEST.name):
+    with metrics.timer("handler_seconds", handler="join_room"):
+      room = join_room(connection, message, user)
+  elif (message["type"] == MessageType.CARD_DROP_REQUEST.name):
+    with metrics.timer("handler_seconds", handler="drop_card"):
+      room = room or seated_room(user)
+      drop_card(connection, message, user, room)
+  elif message["type"] == MessageType.DRAW_CARD_REQUEST.name:
+    with metrics.timer("handler_seconds", handler="draw_card"):
+      room = room or seated_room(user)
+      draw_card(connection, message, user, room)
+  elif message["type"] == MessageType.RESYNC_REQUEST.name:
+    room = resync_game(connection, message, user, room)
+  elif message["type"] == MessageType.ROOM_LIST_REQUEST.name:
+    list_rooms(connection, message)
+  elif message["type"] == MessageType.MATCHMAKE_REQUEST.name:
+    with metrics.timer("handler_seconds", handler="matchmake"):
+      room = matchmake(connection, message, user, user_cache.get(user.name) if user else None)
+  elif message["type"] == MessageType.SPECTATE_REQUEST.name:
+    spectate(connection, message)
+  elif message["type"] == MessageType.LEADERBOARD_REQUEST.name:
+    with metrics.timer("handler_seconds", handler="leaderboard_page"):
+      leaderboard_page(connection, message, user)
+  elif message["type"] == MessageType.HEARTBEAT_REQUEST.name:
+    send_message(connection, {
+      "type": MessageType.OK.name
+    })
+  else:
+    send_message(connection, {
+      "type": MessageType.ERROR.name
+    })
+    logger.warning("received invalid message from %s", client_address)
+  return user, room
+
+def message_label(message: dict[str, Any]) -> str:
+  message_type = message.get("type")
+  if isinstance(message_type, str) and message_type in MessageType.__members__:
+    return MessageType[message_type].name
+  return "invalid"
+
+def record_traffic(connection: socket.socket) -> None:
+  traffic = track_traffic(connection)
+  metrics.increment("closed_connection_bytes_total", traffic.received, direction="in")
+  metrics.increment("closed_connection_bytes_total", traffic.sent, direction="out")
+  metrics.observe("connection_bytes", traffic.received, SIZE_BUCKETS, direction="in")
+  metrics.observe("connection_bytes", traffic.sent, SIZE_BUCKETS, direction="out")
+  compressor = connection_compressor(connection)
+  if compressor:
+    metrics.increment("compressed_frames_total", compressor.frames)
+    metrics.increment("compression_saved_bytes_total", compressor.saved)
+
+def leave_active_room(user: User) -> None:
+  with active_rooms_lock:
+    active_room = active_rooms.by_member(user.name)
+  if not active_room:
+    return
+  with active_room.lock:
+    if active_room.is_full:
+      if any(seat is user for seat in active_room.users):
+        active_room.reseat(User(user.name, None))
+        logger.info("user %s left seat in room %s", user.name, active_room.id)
+      return
+    with active_rooms_lock:
+      is_member = active_rooms.by_member(user.name) is active_room
+      is_owner = is_member and active_room.owner.name == user.name
+      if is_owner:
+        active_rooms.remove(active_room)
+      elif is_member:
+        active_rooms.leave(active_room, user)
+    if is_owner:
+      spectators.publish(active_room.id, {
+        "type": MessageType.ROOM_CLOSE_UPDATE.name
+      })
+      forget_room(active_room)
+      for active_user in active_room.users:
+        if active_user is user or active_user.connection is None:
+          continue
+        logger.debug("closing room connection with %s", active_user.name)
+        try:
+          send_message(active_user.connection, {
+            "type": MessageType.ROOM_CLOSE_UPDATE.name
+          })
+        except:
+          active_user.connection.close()
+      logger.info("closing room %s", active_room.id)
+
+def close_client(connection: socket.socket, client_address: tuple[str, int], user: User | None) -> None:
+  logger.debug("connection with %s closed", client_address)
+  record_traffic(connection)
+  spectators.unsubscribe(connection)
+  outbox = connection_outbox(connection)
+  if outbox:
+    metrics.increment("coalesced_frames_total", outbox.coalesced)
+    if outbox.overflowed:
+      logger.warning("dropped slow consumer %s", client_address)
+      metrics.increment("slow_consumer_disconnects_total")
+  release_connection(connection)
+  if user:
+    with active_sessions_lock:
+      if active_sessions.remove(user):
+        logger.info("logging out user %s", user.name)
+    matchmaker.cancel(user)
+    if shard:
+      shard.directory.remove_session(user.name, shard.index)
+    leave_active_room(user)
+  connection.close()
+
+def hand_off(connection: socket.socket, client_address: tuple[str, int], user: User, handoff: HandOff) -> None:
+  assert shard
+  leave_active_room(user)
+  with active_sessions_lock:
+    active_sessions.remove(user)
+  compressor = connection_compressor(connection)
+  payload = {
+    "username": user.name,
+    "delta": user.delta,
+    "codec": connection_codec(connection).name,
+    "compression": compressor.name if compressor else None,
+    "pending": frame_reader(connection).pending().hex(),
+    "address": list(client_address),
+    "message": handoff.message,
+  }
+  outbox = connection_outbox(connection)
+  if isinstance(outbox, Outbox):
+    outbox.flush(outbox_stall_timeout)
+  try:
+    shard.send(handoff.shard, connection, payload)
+  except Exception as e:
+    logger.error("failed to hand off %s to shard %d: %s", user.name, handoff.shard, e)
+    close_client(connection, client_address, user)
+    return
+  logger.debug("handed off %s to shard %d", user.name, handoff.shard)
+  metrics.increment("handoffs_total", direction="out")
+  record_traffic(connection)
+  release_connection(connection)
+  connection.close()
+
+def adopt_client(connection: socket.socket, payload: dict[str, Any]) -> None:
+  assert shard
+  connection.settimeout(socket_timeout())
+  attach_outbox(connection, Outbox(connection, outbox_limit, outbox_stall_timeout))
+  track_traffic(connection)
+  set_codec(connection, payload["codec"])
+  if payload["compression"]:
+    set_compression(connection, payload["compression"], compression_level, compression_threshold)
+  frame_reader(connection).feed(bytes.fromhex(payload["pending"]))
+  user = User(payload["username"], connection)
+  user.delta = payload["delta"]
+  with active_sessions_lock:
+    active_sessions.add(user)
+  shard.directory.add_session(user.name, shard.index)
+  metrics.increment("handoffs_total", direction="in")
+  client_address = tuple(payload["address"])
+  thread = threading.Thread(target=serve_client, daemon=True, args=[connection, client_address, user, payload["message"]])
+  thread.start()
+
+def serve_client(connection: socket.socket, client_address: tuple[str, int], user: User | None = None, message: dict[str, Any] | None = None) -> None:
+  room: Room | None = None
+  track_traffic(connection)
+  last_seen = time.monotonic()
+  try:
+    while (True):
+      if message is None:
+        try:
+          message = recv_message(connection)
+        except TimeoutError:
+          if frame_reader(connection).has_pending or idle_timeout and time.monotonic() - last_seen > idle_timeout:
+            raise
+          continue
+        last_seen = time.monotonic()
+        metrics.increment("messages_total", type=message_label(message))
+      token = begin_request(connection, message)
+      try:
+        user, room = handle_message(connection, client_address, message, user, room)
+      finally:
+        end_request(token)
+      message = None
+  except HandOff as handoff:
+    assert user
+    hand_off(connection, client_address, user, handoff)
+  except TimeoutError:
+    logger.info("connection with %s timed out", client_address)
+    metrics.increment("timed_out_connections_total")
+    close_client(connection, client_address, user)
+  except Exception as e:
+    logger.info("connection with %s ended: %s", client_address, e)
+    close_client(connection, client_address, user)
+
+async def register_user_async(connection: StreamConnection, message: dict[str, Any]) -> None:
+  password_hash = await asyncio.wrap_future(authenticator.hash(message["password"]))
+  created = await asyncio.to_thread(create_user, message["username"], password_hash)
+  reply_register(connection, message["username"], created)
+
+async def serve_client_async(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+  client_address = writer.get_extra_info("peername")
+  logger.debug("connection established with %s:%s", client_address[0], client_address[1])
+  connection = StreamConnection(writer)
+  attach_outbox(connection, StreamOutbox(writer, outbox_limit, outbox_stall_timeout))
+  traffic = track_traffic(connection)
   user: User | None = None
   room: Room | None = None
   try:
-    while (True):      
-      message = recv_message(connection)
-      if message["type"] == MessageType.REGISTER_REQUEST.name:
-        register_user(connection, message)
-      elif message["type"] == MessageType.LOGIN_REQUEST.name:
-        user = login_user(connection, message, user)
-      elif message["type"] == MessageType.WHOAMI_REQUEST.name:
-        whoami(connection, client_address, user)
-      elif (message["type"] == MessageType.LOGOUT_REQUEST.name):
-        logout_user(connection, client_address, user)
-        user = None
-      elif (message["type"] == MessageType.ROOM_CREATION_REQUEST.name):
-        room = create_room(connection, message, user)
-      elif (message["type"] == MessageType.ROOM_CONNECTION_REQUEST.name):
-        room = join_room(connection, message, user)
-      elif (message["type"] == MessageType.CARD_DROP_REQUEST.name):
-        drop_card(connection, message, user, room)
-      elif message["type"] == MessageType.DRAW_CARD_REQUEST.name:
-        draw_card(connection, message, user, room)
-      else:
-        send_message(connection, {
-          "type": MessageType.ERROR.name
-        })
-        print(f"received invalid message from {client_address}")
+    while (True):
+      message = await recv_message_async(reader, traffic, idle_timeout, read_timeout)
+      metrics.increment("messages_total", type=message_label(message))
+      token = begin_request(connection, message)
+      try:
+        if message["type"] == MessageType.REGISTER_REQUEST.name:
+          await register_user_async(connection, message)
+        elif message["type"] == MessageType.WHOAMI_REQUEST.name and user:
+          user_data = await asyncio.to_thread(user_cache.get, user.name)
+          send_profile(connection, client_address, user, user_data)
+        elif message["type"] == MessageType.LOGIN_REQUEST.name and not user:
+          with metrics.timer("handler_seconds", handler="login_user"):
+            verified = await asyncio.wrap_future(authenticator.verify(message["username"], message["password"]))
+            user = login_user(connection, message, user, verified)
+        elif message["type"] == MessageType.MATCHMAKE_REQUEST.name:
+          with metrics.timer("handler_seconds", handler="matchmake"):
+            profile = await asyncio.to_thread(user_cache.get, user.name) if user else None
+            room = matchmake(connection, message, user, profile)
+        elif message["type"] == MessageType.LEADERBOARD_REQUEST.name:
+          with metrics.timer("handler_seconds", handler="leaderboard_page"):
+            send_message(connection, await asyncio.to_thread(leaderboard_response, message, user))
+        else:
+          user, room = handle_message(connection, client_address, message, user, room)
+      finally:
+        end_request(token)
+  except TimeoutError:
+    logger.info("connection with %s timed out", client_address)
+    metrics.increment("timed_out_connections_total")
+    close_client(connection, client_address, user)
   except Exception as e:
-    print(e)
-    print(f"connection with {client_address} closed")
-    if user:
-      with active_sessions_lock:
-        for active_session in active_sessions:
-          if active_session.name == user.name:
-            print(f"logging out user {active_session.name}")
-            active_sessions.remove(active_session)
-      with active_rooms_lock:
-        for active_room in active_rooms:
-          if active_room.owner.name == user.name:
-            for active_user in active_room.users:
-              print(f"closing room connection with {active_user.name}")
-              try:
-                send_message(active_user.connection, {
-                  "type": MessageType.ROOM_CLOSE_UPDATE.name
-                })
-              except:
-                active_user.connection.close()
-            print(f"closing room {active_room.id}")
-            active_rooms.remove(active_room)
-          elif active_room.has_user(user):
-            active_room.remove_user(user)
-    connection.close()
-      
-    
+    logger.info("connection with %s ended: %s", client_address, e)
+    close_client(connection, client_address, user)
 
-if __name__ == "__main__":
-  SERVER_IP = "127.0.0.1"
-  server_port = 12345
+def auto_draw(room: Room, now: float) -> None:
+  with room.lock:
+    with active_rooms_lock:
+      if active_rooms.get(room.id) is not room:
+        return
+    if not room.is_full or room.game.winner is not None or now - room.turn_started <= turn_timeout:
+      return
+    if all(user.connection is None for user in room.users):
+      return
+    logger.info("turn timed out in room %s", room.id)
+    metrics.increment("turn_timeouts_total")
+    draw_for_current_player(room)
+
+def reap_room(room: Room, now: float) -> None:
+  with room.lock:
+    if any(user.connection is not None for user in room.users) or now - room.turn_started <= idle_timeout:
+      return
+    with active_rooms_lock:
+      if not active_rooms.remove(room):
+        return
+  spectators.publish(room.id, {
+    "type": MessageType.ROOM_CLOSE_UPDATE.name
+  })
+  forget_room(room)
+  if shard:
+    for user in room.users:
+      shard.directory.remove_seat(user.name)
+  logger.info("reaped abandoned room %s", room.id)
+  metrics.increment("reaped_rooms_total")
+
+def run_timers() -> None:
+  now = time.monotonic()
+  for users in matchmaker.sweep(now):
+    start_match(users)
+  for room in live_rooms():
+    if idle_timeout:
+      reap_room(room, now)
+    if turn_timeout:
+      auto_draw(room, now)
+
+def run_timers_threaded(interval: float) -> None:
+  while (True):
+    time.sleep(interval)
+    try:
+      run_timers()
+    except Exception as e:
+      logger.error("timer sweep failed: %s", e)
+
+async def run_timers_async(interval: float) -> None:
+  while (True):
+    await asyncio.sleep(interval)
+    try:
+      run_timers()
+    except Exception as e:
+      logger.error("timer sweep failed: %s", e)
+
+def socket_timeout() -> float | None:
+  return min([timeout for timeout in [read_timeout, idle_timeout] if timeout], default=None)
+
+def serve_threaded(server_ip: str, server_port: int, reuse_port: bool = False, timer_interval: float = 1.0) -> None:
   server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+  if reuse_port:
+    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
   try:    
     while (True):
-      server_address = (SERVER_IP, server_port)
+      server_address = (server_ip, server_port)
       try:    
         server_socket.bind(server_address)
         break
       except:
         server_port += 1
-    server_socket.listen(1)
-    print(f"listening on {SERVER_IP}:{server_port}")
+    server_socket.listen(socket.SOMAXCONN)
+    print(f"listening on {server_ip}:{server_port}", flush=True)
+    threading.Thread(target=run_timers_threaded, daemon=True, args=[timer_interval]).start()
+    spectators.start()
     while (True):
-      print("waiting for connection")
+      logger.debug("waiting for connection")
       connection, client_address = server_socket.accept()
+      connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+      connection.settimeout(socket_timeout())
+      attach_outbox(connection, Outbox(connection, outbox_limit, outbox_stall_timeout))
       client_ip, client_port = client_address
-      print(f"connection established with {client_ip}:{client_port}")
+      logger.debug("connection established with %s:%s", client_ip, client_port)
       thread = threading.Thread(target=serve_client, daemon=True, args=[connection, client_address])
       thread.start()
   except Exception as e:
-    print(e)
+    logger.error("server stopped: %s", e)
     server_socket.close()
+
+async def serve_asyncio(server_ip: str, server_port: int, timer_interval: float = 1.0) -> None:
+  while (True):
+    try:
+      server = await asyncio.start_server(serve_client_async, server_ip, server_port, backlog=socket.SOMAXCONN)
+      break
+    except OSError:
+      server_port += 1
+  print(f"listening on {server_ip}:{server_port}", flush=True)
+  spectators.attach_loop(asyncio.get_running_loop())
+  timers = asyncio.create_task(run_timers_async(timer_interval))
+  async with server:
+    await server.serve_forever()
+
+def configure_logging(level: str) -> logging.handlers.QueueListener | None:
+  if level == "off":
+    logging.disable(logging.CRITICAL)
+    return None
+  records: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+  handler = logging.StreamHandler(sys.stdout)
+  handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+  listener = logging.handlers.QueueListener(records, handler)
+  root = logging.getLogger()
+  root.addHandler(logging.handlers.QueueHandler(records))
+  root.setLevel(level.upper())
+  listener.start()
+  return listener
+
+def register_gauges() -> None:
+  metrics.gauge("active_rooms", lambda: len(active_rooms))
+  metrics.gauge("active_sessions", lambda: len(active_sessions))
+  metrics.gauge("open_connection_bytes", lambda: sum(traffic.received for traffic in live_traffic()), direction="in")
+  metrics.gauge("open_connection_bytes", lambda: sum(traffic.sent for traffic in live_traffic()), direction="out")
+  metrics.gauge("outbox_queued_frames", lambda: sum(outbox.queued for outbox in live_outboxes()))
+  metrics.gauge("matchmaking_waiting", lambda: len(matchmaker))
+  metrics.gauge("spectators", lambda: len(spectators))
+  metrics.gauge("stats_queued_games", lambda: stats_writer.queued)
+  if journal:
+    metrics.gauge("journal_queued_records", lambda: journal.queued if journal else 0)
+  metrics.gauge("user_cache_hits", lambda: user_cache.hits)
+  metrics.gauge("user_cache_misses", lambda: user_cache.misses)
+  metrics.gauge("user_cache_size", lambda: len(user_cache))
+  if shard:
+    metrics.gauge("directory_sessions", shard.directory.session_count)
+
+def live_rooms() -> list[Room]:
+  with active_rooms_lock:
+    return list(active_rooms)
+
+def restore_rooms(path: str) -> None:
+  start = time.perf_counter()
+  rooms = read_snapshot(path)
+  with active_rooms_lock:
+    for room in rooms:
+      active_rooms.add(room)
+  if journal:
+    for room in rooms:
+      journal.record_restore(room)
+  if rooms:
+    next_id = max(room.id for room in rooms) + 1
+    step = shard.count if shard else 1
+    Room.stride_ids(next_id + ((shard.index if shard else 0) - next_id) % step, step)
+  if shard:
+    for room in rooms:
+      shard.directory.add_room(room.id, room.owner.name, shard.index)
+    shard.directory.add_seats([user.name for room in rooms for user in room.users], shard.index)
+  logger.info("restored %d rooms from %s in %.1f ms", len(rooms), path, (time.perf_counter() - start) * 1000)
+
+def serve(args: argparse.Namespace, server_ip: str, server_port: int, sharding: Shard | None = None) -> None:
+  global authenticator, stats_writer, user_cache, leaderboard, matchmaker, spectators, shard, journal, read_timeout, idle_timeout, turn_timeout
+  global outbox_limit, outbox_stall_timeout, compression_level, compression_threshold
+  log_listener = configure_logging(args.log_level)
+  models.open_database(db.database)
+  authenticator = Authenticator(args.auth_workers, args.auth_cache_ttl)
+  stats_writer = models.StatsWriter(db, args.stats_interval, args.stats_batch_size)
+  user_cache = models.UserCache(stats_writer, args.user_cache_size)
+  leaderboard = Leaderboard(stats_writer, user_cache, args.leaderboard_size)
+  matchmaker = Matchmaker(args.matchmaking_widen_after)
+  spectators = SpectatorHub(args.spectator_interval)
+  shard = sharding
+  read_timeout = args.read_timeout or None
+  idle_timeout = args.idle_timeout or None
+  turn_timeout = args.turn_timeout or None
+  outbox_limit = args.outbox_limit
+  outbox_stall_timeout = args.outbox_stall_timeout
+  compression_level = args.compression_level
+  compression_threshold = args.compression_threshold
+  journal_file = args.journal_file
+  if shard and journal_file:
+    journal_file = f"{journal_file}.{shard.index}"
+  journal = Journal(journal_file) if journal_file else None
+  if journal:
+    journal.start()
+  register_gauges()
+  metrics_port = args.metrics_port
+  metrics_file = args.metrics_file
+  if shard and metrics_port is not None:
+    metrics_port += shard.index
+  if shard and metrics_file:
+    metrics_file = f"{metrics_file}.{shard.index}"
+  snapshot_file = args.snapshot_file
+  if shard and snapshot_file:
+    snapshot_file = f"{snapshot_file}.{shard.index}"
+  if snapshot_file and os.path.exists(snapshot_file):
+    restore_rooms(snapshot_file)
+  start = time.perf_counter()
+  models.ensure_indexes()
+  leaderboard.load()
+  logger.info("loaded leaderboard in %.1f ms", (time.perf_counter() - start) * 1000)
+  if shard and args.leaderboard_refresh:
+    threading.Thread(target=refresh_leaderboard, daemon=True, args=[args.leaderboard_refresh]).start()
+  snapshot_writer = SnapshotWriter(snapshot_file, live_rooms, args.snapshot_interval) if snapshot_file else None
+  if snapshot_writer:
+    snapshot_writer.start()
+  metrics_server = metrics.serve(server_ip, metrics_port) if metrics_port is not None else None
+  snapshots_stopped = metrics.write_snapshots(metrics_file, args.metrics_interval) if metrics_file else None
+  stats_writer.start()
+  signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+  try:
+    if args.engine == "asyncio":
+      asyncio.run(serve_asyncio(server_ip, server_port, args.timer_interval))
+    else:
+      serve_threaded(server_ip, server_port, reuse_port=shard is not None, timer_interval=args.timer_interval)
+  except KeyboardInterrupt:
+    pass
+  finally:
+    if snapshot_writer:
+      snapshot_writer.stop()
+    if journal:
+      journal.stop()
+    stats_writer.stop()
+    authenticator.shutdown()
+    if metrics_server:
+      metrics_server.shutdown()
+    if snapshots_stopped and metrics_file:
+      snapshots_stopped.set()
+      metrics.write_snapshot(metrics_file)
+    if log_listener:
+      log_listener.stop()
+
+def run_shard(args: argparse.Namespace, server_ip: str, server_port: int, index: int, count: int, rundir: str) -> None:
+  Room.stride_ids(index, count)
+  sharding = Shard(index, count, rundir)
+  sharding.receive(adopt_client)
+  serve(args, server_ip, server_port, sharding)
+
+def serve_sharded(args: argparse.Namespace, server_ip: str, server_port: int) -> None:
+  reserved = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+  reserved.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+  while (True):
+    try:
+      reserved.bind((server_ip, server_port))
+      break
+    except OSError:
+      server_port += 1
+  rundir = tempfile.mkdtemp(prefix="uno-shards-")
+  Directory(directory_path(rundir)).close()
+  context = multiprocessing.get_context("spawn")
+  workers = [
+    context.Process(target=run_shard, args=[args, server_ip, server_port, i, args.workers, rundir], daemon=True)
+    for i in range(args.workers)
+  ]
+  signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+  try:
+    for worker in workers:
+      worker.start()
+    for worker in workers:
+      worker.join()
+  except KeyboardInterrupt:
+    for worker in workers:
+      worker.join()
+  finally:
+    for worker in workers:
+      if worker.is_alive():
+        worker.terminate()
+        worker.join()
+    reserved.close()
+    shutil.rmtree(rundir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+  SERVER_IP = "127.0.0.1"
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--engine", choices=["thread", "asyncio"], default="thread")
+  parser.add_argument("--port", type=int, default=12345)
+  parser.add_argument("--stats-interval", type=float, default=1.0)
+  parser.add_argument("--stats-batch-size", type=int, default=256)
+  parser.add_argument("--user-cache-size", type=int, default=10_000)
+  parser.add_argument("--auth-workers", type=int, default=None)
+  parser.add_argument("--auth-cache-ttl", type=float, default=30.0)
+  parser.add_argument("--log-level", choices=["debug", "info", "warning", "error", "off"], default="info")
+  parser.add_argument("--metrics-port", type=int, default=None, help="serve metrics as text on this local port")
+  parser.add_argument("--metrics-file", default=None, help="periodically write a metrics snapshot to this file")
+  parser.add_argument("--metrics-interval", type=float, default=10.0)
+  parser.add_argument("--snapshot-file", default=None, help="restore live rooms from and periodically save them to this file")
+  parser.add_argument("--snapshot-interval", type=float, default=5.0)
+  parser.add_argument("--journal-file", default=None, help="append every accepted move to this binary journal")
+  parser.add_argument("--read-timeout", type=float, default=30.0, help="drop clients that stall mid-frame this long (0 disables)")
+  parser.add_argument("--idle-timeout", type=float, default=300.0, help="drop silent clients and reap abandoned rooms after this long (0 disables)")
+  parser.add_argument("--turn-timeout", type=float, default=60.0, help="draw for a player whose turn lasts this long (0 disables)")
+  parser.add_argument("--timer-interval", type=float, default=1.0)
+  parser.add_argument("--matchmaking-widen-after", type=float, default=5.0, help="widen a waiting player's rating range by one bucket per this many seconds")
+  parser.add_argument("--spectator-interval", type=float, default=0.05, help="minimum seconds between spectator fan-outs; updates in between are merged")
+  parser.add_argument("--outbox-limit", type=int, default=64, help="queued frames per client before it counts as a slow consumer")
+  parser.add_argument("--outbox-stall-timeout", type=float, default=10.0, help="drop clients whose queue stays over the limit this long")
+  parser.add_argument("--leaderboard-size", type=int, default=1000, help="ranks served from memory for each leaderboard order")
+  parser.add_argument("--leaderboard-refresh", type=float, default=30.0, help="seconds between leaderboard reloads when sharded, 0 to disable")
+  parser.add_argument("--compression-level", type=int, default=6, help="zlib level for clients that negotiate compression")
+  parser.add_argument("--compression-threshold", type=int, default=128, help="compress frames of at least this many bytes, 0 to refuse compression")
+  parser.add_argument("--workers", type=int, default=0, help="run this many shard processes sharing the port")
+  args = parser.parse_args()
+  if args.workers and args.engine != "thread":
+    parser.error("sharded mode only supports the thread engine")
+  if args.workers:
+    serve_sharded(args, SERVER_IP, args.port)
+  else:
+    serve(args, SERVER_IP, args.port)
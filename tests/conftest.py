@@ -0,0 +1,184 @@
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+from typing import Any, Callable, Iterator
+
+import pytest
+
+import models
+import server as server_module
+from lib.journal import Journal
+from lib.leaderboard import Leaderboard
+from lib.matchmaking import Matchmaker
+from lib.proto import CARD_COLORS, CARD_TYPES, HEADER_SIZE, MessageType, decode_frame, send_and_recv_message
+from lib.registry import RoomRegistry, SessionRegistry
+from lib.room import Room
+from lib.spectators import SpectatorHub
+from lib.user import User
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class CaptureConnection:
+  __lock: threading.Lock
+  messages: list[dict[str, Any]]
+
+  def __init__(self) -> None:
+    self.__lock = threading.Lock()
+    self.messages = []
+
+  def sendmsg(self, buffers: list[bytes | memoryview]) -> int:
+    frame = b"".join(buffers)
+    with self.__lock:
+      self.messages.append(decode_frame(frame[HEADER_SIZE:]))
+    return len(frame)
+
+  def sendall(self, data: bytes | memoryview) -> None:
+    self.sendmsg([data])
+
+  def close(self) -> None:
+    pass
+
+  def last(self, message_type: MessageType) -> dict[str, Any] | None:
+    with self.__lock:
+      return next((message for message in reversed(self.messages) if message["type"] == message_type.name), None)
+
+class ChunkedConnection:
+  __data: bytes
+  __offset: int
+  __chunk_size: int
+
+  def __init__(self, data: bytes, chunk_size: int) -> None:
+    self.__data = data
+    self.__offset = 0
+    self.__chunk_size = chunk_size
+
+  def recv_into(self, buffer: memoryview) -> int:
+    size = min(len(buffer), self.__chunk_size, len(self.__data) - self.__offset)
+    buffer[:size] = self.__data[self.__offset:self.__offset + size]
+    self.__offset += size
+    return size
+
+def random_card(rng: random.Random) -> dict[str, Any]:
+  color = rng.choice(CARD_COLORS)
+  if color == "black":
+    return {"color": color, "type": rng.choice(["wildcard", "+4"])}
+  return {"color": color, "type": rng.choice(CARD_TYPES[:13])}
+
+def random_messages(count: int) -> list[dict[str, Any]]:
+  rng = random.Random(7)
+  messages = []
+  for i in range(count):
+    messages.append({
+      "type": rng.choice(list(MessageType)).name,
+      "version": rng.randrange(1 << 40),
+      "turn": rng.randrange(-5, 5),
+      "hand": [random_card(rng) for _ in range(rng.randrange(0, 20))],
+      "current_card": random_card(rng),
+      "username": f"player-{i}-ü",
+      "delta": rng.random() < 0.5,
+      "cursor": None,
+      "rank": rng.random(),
+      "entries": [{"username": "a", "wins": 1, "losses": 2, "rank": 3}],
+      "unlisted_field": {"nested": [1, "two", None]},
+    })
+  return messages
+
+def seated_room(players: int) -> Room:
+  users = [User(f"seat-{i}", None) for i in range(players)]
+  room = Room(users[0], players)
+  for user in users[1:]:
+    room.add_user(user)
+  return room
+
+def play_move(room: Room, rng: random.Random, journal: Journal | None = None) -> None:
+  game = room.game
+  player = game.current_player
+  playable = [i for (i, card) in enumerate(player.hand) if game.current_card.playable(card)]
+  if playable and player.can_play(game.current_card):
+    card_index = rng.choice(playable)
+    card = player.hand[card_index]
+    color = rng.choice(["red", "green", "blue", "yellow"]) if card.color == "black" else None
+    game.play(player.player_id, card_index, color)
+    if journal:
+      journal.record_move(room.id, player.player_id, card_index, card.code, color)
+  else:
+    game.play(player.player_id)
+    if journal:
+      journal.record_move(room.id, player.player_id, None, None, None)
+  room.bump_version()
+
+def exchange(connection: socket.socket, message_type: MessageType, **fields: Any) -> dict[str, Any]:
+  return send_and_recv_message(connection, {"type": message_type.name, **fields})
+
+def sign_in(connection: socket.socket, username: str) -> None:
+  assert exchange(connection, MessageType.REGISTER_REQUEST, username=username, password="secret")["type"] == MessageType.OK.name
+  assert exchange(connection, MessageType.LOGIN_REQUEST, username=username, password="secret")["type"] == MessageType.OK.name
+
+@pytest.fixture
+def database(tmp_path: Any) -> Iterator[Any]:
+  models.db.close()
+  models.open_database(str(tmp_path / "uno.db"))
+  models.db.connect()
+  models.db.create_tables([models.User])
+  yield models.db
+  models.db.close()
+
+@pytest.fixture
+def server(database: Any, monkeypatch: pytest.MonkeyPatch) -> Iterator[Any]:
+  stats_writer = models.StatsWriter(database, interval=0.05)
+  user_cache = models.UserCache(stats_writer)
+  monkeypatch.setattr(server_module, "stats_writer", stats_writer)
+  monkeypatch.setattr(server_module, "user_cache", user_cache)
+  monkeypatch.setattr(server_module, "leaderboard", Leaderboard(stats_writer, user_cache))
+  monkeypatch.setattr(server_module, "active_rooms", RoomRegistry())
+  monkeypatch.setattr(server_module, "active_sessions", SessionRegistry())
+  monkeypatch.setattr(server_module, "matchmaker", Matchmaker())
+  monkeypatch.setattr(server_module, "spectators", SpectatorHub())
+  monkeypatch.setattr(server_module, "journal", None)
+  stats_writer.start()
+  yield server_module
+  stats_writer.stop()
+
+@pytest.fixture
+def create_users(database: Any) -> Callable[[list[str]], None]:
+  def create(usernames: list[str]) -> None:
+    with database.atomic():
+      for username in usernames:
+        models.User.create(username=username, password="test")
+  return create
+
+def free_port() -> int:
+  with socket.socket() as probe:
+    probe.bind(("127.0.0.1", 0))
+    return probe.getsockname()[1]
+
+@pytest.fixture
+def launch(tmp_path: Any) -> Iterator[Callable[..., int]]:
+  processes: list[subprocess.Popen] = []
+  def launch(engine: str, *options: str) -> int:
+    subprocess.run([sys.executable, os.path.join(REPO_ROOT, "models.py")], cwd=tmp_path, check=True)
+    port = free_port()
+    process = subprocess.Popen(
+      [sys.executable, "-u", os.path.join(REPO_ROOT, "server.py"), "--engine", engine, "--port", str(port), *options],
+      cwd=tmp_path,
+      stdout=subprocess.PIPE,
+      stderr=subprocess.STDOUT,
+      text=True,
+    )
+    processes.append(process)
+    assert process.stdout
+    listeners = int(options[options.index("--workers") + 1]) if "--workers" in options else 1
+    for line in process.stdout:
+      if "listening on" in line:
+        listeners -= 1
+        if not listeners:
+          break
+    threading.Thread(target=lambda: [None for _ in process.stdout or []], daemon=True).start()
+    return port
+  yield launch
+  for process in processes:
+    process.terminate()
+    process.wait()
@@ -0,0 +1,57 @@
+import time
+from typing import Any, Callable
+
+import pytest
+
+import models
+from conftest import CaptureConnection
+from lib.auth import Authenticator, hash_password, is_hashed, verify_password
+from lib.proto import MessageType
+
+def stored_password(username: str) -> str:
+  return models.User.get(models.User.username == username).password
+
+def set_password(username: str, password: str) -> None:
+  models.User.update(password=hash_password(password)).where(models.User.username == username).execute()
+
+def test_scrypt_hashes_verify_only_the_original_password() -> None:
+  stored = hash_password("secret")
+  assert is_hashed(stored)
+  assert stored != hash_password("secret")
+  assert verify_password("secret", stored)
+  assert not verify_password("Secret", stored)
+
+def test_legacy_plaintext_rows_are_upgraded_on_login(database: Any, create_users: Callable[[list[str]], None]) -> None:
+  create_users(["legacy"])
+  authenticator = Authenticator(1)
+  assert not authenticator.verify("legacy", "wrong").result()
+  assert stored_password("legacy") == "test"
+  assert authenticator.verify("legacy", "test").result()
+  assert is_hashed(stored_password("legacy"))
+  assert verify_password("test", stored_password("legacy"))
+  assert not Authenticator(1).verify("legacy", "wrong").result()
+  authenticator.shutdown()
+
+def test_cached_logins_expire(database: Any, create_users: Callable[[list[str]], None]) -> None:
+  create_users(["cached"])
+  authenticator = Authenticator(1, cache_ttl=0.2)
+  assert authenticator.verify("cached", "test").result()
+  set_password("cached", "changed")
+  assert authenticator.verify("cached", "test").result()
+  assert not authenticator.verify("cached", "other").result()
+  time.sleep(0.3)
+  assert not authenticator.verify("cached", "test").result()
+  authenticator.shutdown()
+
+def test_logout_forgets_the_cached_login(server: Any, create_users: Callable[[list[str]], None], monkeypatch: pytest.MonkeyPatch) -> None:
+  create_users(["leaving"])
+  monkeypatch.setattr(server, "authenticator", Authenticator(1))
+  connection = CaptureConnection()
+  credentials = {"username": "leaving", "password": "test"}
+  user = server.login_user(connection, credentials, None)
+  assert user
+  set_password("leaving", "changed")
+  server.logout_user(connection, ("127.0.0.1", 0), user)
+  assert server.login_user(connection, credentials, None) is None
+  assert connection.messages[-1]["type"] == MessageType.ERROR.name
+  server.authenticator.shutdown()
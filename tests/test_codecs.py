@@ -0,0 +1,23 @@
+import pytest
+
+from conftest import random_messages
+from lib.proto import BINARY_CODEC, CODECS, JSON_CODEC, MessageType, decode_frame
+
+@pytest.mark.parametrize("codec_name", list(CODECS))
+def test_codec_round_trip(codec_name: str) -> None:
+  codec = CODECS[codec_name]
+  for message in random_messages(200):
+    assert decode_frame(codec.encode(message)) == message
+
+@pytest.mark.parametrize("codec_name", list(CODECS))
+def test_splice_matches_full_encoding(codec_name: str) -> None:
+  codec = CODECS[codec_name]
+  shared = {"type": MessageType.GAME_UPDATE.name, "version": 3, "turn": 1, "current_card": {"color": "red", "type": 7}}
+  prepared = codec.prepare(shared)
+  for private in [{}, {"hand": [{"color": "blue", "type": "skip"}], "id": 2}, {"request_id": 9}]:
+    frame = b"".join(codec.splice(prepared, private))
+    assert decode_frame(frame) == {**shared, **private}
+
+def test_binary_is_smaller_than_json() -> None:
+  message = random_messages(1)[0]
+  assert len(BINARY_CODEC.encode(message)) < len(JSON_CODEC.encode(message))
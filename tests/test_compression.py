@@ -0,0 +1,19 @@
+import pytest
+
+from conftest import ChunkedConnection
+from lib.proto import (
+  COMPRESSED_FLAG, HEADER_SIZE, JSON_CODEC, FrameError, FrameReader, MessageType, ZlibCompressor, decompress_frame,
+)
+
+def test_compressed_frames_round_trip() -> None:
+  compressor = ZlibCompressor(6, 64)
+  message = {"type": MessageType.GAME_UPDATE.name, "hand": [{"color": "red", "type": 1}] * 30, "version": 4}
+  frame = JSON_CODEC.encode(message)
+  compressed = compressor.compress([frame], len(frame))
+  assert compressed is not None and len(compressed) < len(frame)
+  assert decompress_frame(compressed) == frame
+  assert compressor.compress([b"{}"], 2) is None
+  stream = (len(compressed) | COMPRESSED_FLAG).to_bytes(HEADER_SIZE) + compressed
+  assert FrameReader(ChunkedConnection(stream, 5)).recv_message() == message
+  with pytest.raises(FrameError):
+    decompress_frame(compressed[:-3])
@@ -0,0 +1,62 @@
+from typing import Any
+
+import pytest
+
+from conftest import CaptureConnection
+from lib.proto import MessageType, set_codec
+from lib.user import User
+
+def seat_players(server: Any, names: list[str], codec: str) -> tuple[Any, list[User]]:
+  users = [User(name, CaptureConnection()) for name in names]
+  for user in users:
+    user.delta = user.name.startswith("delta")
+    set_codec(user.connection, codec)
+  room = server.create_room(users[0].connection, {"player_count": len(users)}, users[0])
+  for user in users[1:]:
+    server.join_room(user.connection, {"room_id": room.id}, user)
+  return room, users
+
+def apply_update(state: dict[str, Any], message: dict[str, Any]) -> None:
+  assert message["version"] == state["version"] + 1
+  if "hand" in message:
+    state["hand"] = message["hand"]
+  else:
+    for card_index in sorted(message["removed"], reverse=True):
+      state["hand"].pop(card_index)
+    state["hand"].extend(message["added"])
+  state["version"] = message["version"]
+  state["turn"] = message["turn"]
+  state["current_card"] = message.get("current_card", state["current_card"])
+
+@pytest.mark.parametrize("codec", ["json", "binary"])
+def test_delta_updates_rebuild_full_hands(server: Any, codec: str) -> None:
+  room, users = seat_players(server, ["delta-a", "full-b", "delta-c"], codec)
+  states = [dict(user.connection.last(MessageType.GAME_START_UPDATE)) for user in users]
+  seen = [len(user.connection.messages) for user in users]
+  while room.game.winner is None:
+    game = room.game
+    user = users[game.current_player.player_id]
+    playable = [i for (i, card) in enumerate(game.current_player.hand) if game.current_card.playable(card)]
+    if playable and game.current_player.can_play(game.current_card):
+      server.drop_card(user.connection, {"card_index": playable[0], "color": "green"}, user, room)
+    else:
+      server.draw_card(user.connection, {}, user, room)
+    if room.game.winner is not None:
+      break
+    for (i, other) in enumerate(users):
+      for message in other.connection.messages[seen[i]:]:
+        if message["type"] == MessageType.GAME_UPDATE.name:
+          apply_update(states[i], message)
+      seen[i] = len(other.connection.messages)
+      assert states[i]["hand"] == list(map(server.serialize_card, room.game.players[i].hand))
+      assert states[i]["current_card"] == server.serialize_current_card(room.game)
+      assert states[i]["turn"] == room.game.current_player.player_id
+  assert all(user.connection.last(MessageType.GAME_END_UPDATE) for user in users)
+
+def test_resync_returns_the_current_snapshot(server: Any) -> None:
+  room, users = seat_players(server, ["delta-a", "delta-b"], "json")
+  user = users[1]
+  server.resync_game(user.connection, {}, user, room)
+  snapshot = user.connection.messages[-1]
+  assert snapshot["version"] == room.version
+  assert snapshot["hand"] == list(map(server.serialize_card, room.game.players[1].hand))
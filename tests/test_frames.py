@@ -0,0 +1,46 @@
+from typing import Any
+
+import pytest
+
+from conftest import ChunkedConnection, random_messages
+from lib.proto import HEADER_SIZE, JSON_CODEC, FrameError, FrameReader, MessageType
+
+def frames(messages: list[dict[str, Any]]) -> bytes:
+  encoded = [JSON_CODEC.encode(message) for message in messages]
+  return b"".join(len(frame).to_bytes(HEADER_SIZE) + frame for frame in encoded)
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 4096, 1 << 20])
+def test_frame_reader_reassembles_partial_reads(chunk_size: int) -> None:
+  messages = random_messages(50)
+  reader = FrameReader(ChunkedConnection(frames(messages), chunk_size))
+  assert [reader.recv_message() for _ in messages] == messages
+  with pytest.raises(ConnectionError):
+    reader.recv_message()
+
+def test_frame_reader_returns_pipelined_frames_from_one_read() -> None:
+  messages = random_messages(5)
+  reader = FrameReader(ChunkedConnection(frames(messages), 1 << 20))
+  reader.recv_message()
+  assert reader.has_frame
+  assert [reader.recv_message() for _ in messages[1:]] == messages[1:]
+  assert not reader.has_pending
+
+def test_frame_reader_rejects_oversized_frames() -> None:
+  reader = FrameReader(ChunkedConnection((1 << 20 + 1).to_bytes(HEADER_SIZE), 1 << 20))
+  with pytest.raises(FrameError):
+    reader.recv_frame()
+
+def test_frame_reader_grows_and_shrinks_its_buffer() -> None:
+  small = {"type": MessageType.OK.name}
+  large = {"type": MessageType.GAME_UPDATE.name, "hand": [{"color": "red", "type": 1}] * 5000}
+  reader = FrameReader(ChunkedConnection(frames([small, large, large, small, small]), 1024))
+  base = reader.capacity
+  assert reader.recv_message() == small
+  assert reader.recv_message() == large
+  grown = reader.capacity
+  assert grown > base
+  assert reader.recv_message() == large
+  assert reader.capacity == grown
+  assert reader.recv_message() == small
+  assert reader.recv_message() == small
+  assert reader.capacity == base
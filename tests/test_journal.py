@@ -0,0 +1,29 @@
+import random
+from typing import Any
+
+import replay
+from conftest import play_move, seated_room
+from lib.journal import Journal, read_journal
+
+def test_journal_replays_without_mismatches(tmp_path: Any) -> None:
+  rng = random.Random(5)
+  path = str(tmp_path / "moves.journal")
+  journal = Journal(path)
+  journal.start()
+  rooms = [seated_room(players) for players in [2, 4]]
+  for room in rooms:
+    journal.record_start(room)
+  while any(room.game.winner is None for room in rooms):
+    for room in rooms:
+      if room.game.winner is None:
+        play_move(room, rng, journal)
+        if room.game.winner is not None:
+          journal.record_end(room.id, room.game.winner.player_id)
+  journal.stop()
+  with open(path, "rb") as data:
+    records = list(read_journal(data.read()))
+  stats = replay.ReplayStats()
+  replay.replay(records, stats)
+  assert stats.errors == []
+  assert stats.games == len(rooms)
+  assert stats.mismatches == stats.abandoned == stats.orphaned_moves == 0
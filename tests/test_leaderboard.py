@@ -0,0 +1,44 @@
+import random
+import threading
+import time
+from typing import Any, Callable
+
+import models
+from lib.leaderboard import ORDERS, Leaderboard
+
+def test_rankings_match_a_fresh_load_after_concurrent_games(database: Any, create_users: Callable[[list[str]], None]) -> None:
+  usernames = [f"player-{i}" for i in range(40)]
+  create_users(usernames)
+  stats_writer = models.StatsWriter(database, interval=0.005, batch_size=8)
+  leaderboard = Leaderboard(stats_writer, models.UserCache(stats_writer), size=10)
+  leaderboard.load()
+  stats_writer.start()
+  def play(seed: int) -> None:
+    rng = random.Random(seed)
+    for _ in range(100):
+      players = rng.sample(usernames, 3)
+      stats_writer.record_game(players[0], players[1:])
+      time.sleep(0.005)
+  def join(start: int) -> None:
+    for i in range(start, start + 20):
+      stats_writer.create_user(f"late-{i}", "test")
+      time.sleep(0.02)
+  def reload() -> None:
+    for _ in range(4):
+      leaderboard.load()
+      leaderboard.page(ORDERS[1], 0, 10)
+  threads = [threading.Thread(target=play, args=[seed]) for seed in range(4)]
+  threads += [threading.Thread(target=join, args=[start]) for start in [0, 20]]
+  threads.append(threading.Thread(target=reload))
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  stats_writer.stop()
+  fresh_writer = models.StatsWriter(database)
+  fresh = Leaderboard(fresh_writer, models.UserCache(fresh_writer), size=10)
+  fresh.load()
+  everyone = usernames + [f"late-{i}" for i in range(40)]
+  for order in ORDERS:
+    assert leaderboard.page(order, 0, 10) == fresh.page(order, 0, 10)
+    assert [leaderboard.rank(order, username) for username in everyone] == [fresh.rank(order, username) for username in everyone]
@@ -0,0 +1,74 @@
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import time
+from typing import Any, Callable
+
+import models
+from conftest import REPO_ROOT
+
+def stored_stats(username: str) -> tuple[int, int]:
+  user = models.User.get(models.User.username == username)
+  return user.wins, user.losses
+
+def test_failed_stats_writes_are_retried(database: Any, create_users: Callable[[list[str]], None]) -> None:
+  create_users(["winner", "loser"])
+  models.open_database(database.database, timeout=0.01)
+  stats_writer = models.StatsWriter(database, interval=0.01)
+  user_cache = models.UserCache(stats_writer)
+  blocker = sqlite3.connect(database.database, timeout=0)
+  blocker.execute("BEGIN EXCLUSIVE")
+  stats_writer.start()
+  stats_writer.record_game("winner", ["loser"])
+  time.sleep(0.2)
+  blocker.rollback()
+  blocker.close()
+  stats_writer.stop()
+  assert stored_stats("winner") == (1, 0)
+  assert stored_stats("loser") == (0, 1)
+  profile = user_cache.get("winner")
+  assert profile and (profile.wins, profile.losses) == (1, 0)
+
+def test_cached_profiles_are_updated_in_place(database: Any, create_users: Callable[[list[str]], None]) -> None:
+  create_users(["winner", "loser"])
+  stats_writer = models.StatsWriter(database, interval=0.01)
+  user_cache = models.UserCache(stats_writer)
+  assert len(user_cache) == 0
+  profile = user_cache.get("winner")
+  assert len(user_cache) == 1
+  stats_writer.record_game("winner", ["loser"])
+  assert user_cache.get("winner") is profile
+  assert profile and (profile.wins, profile.losses) == (1, 0)
+  assert user_cache.misses == 1
+
+def test_record_game_does_not_wait_for_database_writes(database: Any, create_users: Callable[[list[str]], None]) -> None:
+  create_users(["winner", "loser"])
+  models.open_database(database.database, timeout=1.0)
+  stats_writer = models.StatsWriter(database, interval=0.01)
+  user_cache = models.UserCache(stats_writer)
+  blocker = sqlite3.connect(database.database, timeout=0)
+  blocker.execute("BEGIN EXCLUSIVE")
+  stats_writer.start()
+  stats_writer.record_game("winner", ["loser"])
+  time.sleep(0.1)
+  start = time.perf_counter()
+  stats_writer.record_game("loser", ["winner"])
+  elapsed = time.perf_counter() - start
+  blocker.rollback()
+  blocker.close()
+  stats_writer.stop()
+  assert elapsed < 0.1
+  assert stored_stats("winner") == stored_stats("loser") == (1, 1)
+  profile = user_cache.get("loser")
+  assert profile and (profile.wins, profile.losses) == (1, 1)
+
+def test_importing_the_server_leaves_the_database_file_alone(tmp_path: Any) -> None:
+  path = tmp_path / "uno.db"
+  shutil.copyfile(os.path.join(REPO_ROOT, "uno.db"), path)
+  before = path.read_bytes()
+  environment = {**os.environ, "PYTHONPATH": REPO_ROOT}
+  subprocess.run([sys.executable, "-c", "import models, server"], cwd=tmp_path, env=environment, check=True)
+  assert path.read_bytes() == before
+  assert not (tmp_path / "uno.db-wal").exists()
@@ -0,0 +1,95 @@
+import asyncio
+import socket
+import threading
+from typing import Any
+
+import pytest
+
+from lib.proto import Outbox, StreamOutbox, Traffic
+
+class StalledTransport:
+  aborted = False
+
+  def get_write_buffer_size(self) -> int:
+    return 1 << 30
+
+  def abort(self) -> None:
+    self.aborted = True
+
+class StalledWriter:
+  transport: StalledTransport
+
+  def __init__(self) -> None:
+    self.transport = StalledTransport()
+
+  async def drain(self) -> None:
+    await asyncio.Event().wait()
+
+@pytest.mark.parametrize("stall_timeout, pushes", [(60.0, 4 * 8 + 1), (0.0, 8 + 2)])
+def test_stream_outbox_overflows_after_stall_timeout_or_hard_limit(stall_timeout: float, pushes: int) -> None:
+  async def fill() -> list[bool]:
+    writer: Any = StalledWriter()
+    outbox = StreamOutbox(writer, 8, stall_timeout)
+    overflowed = []
+    for _ in range(pushes):
+      outbox.push([b"frame"])
+      await asyncio.sleep(0.001)
+      overflowed.append(writer.transport.aborted)
+    return overflowed
+  overflowed = asyncio.run(fill())
+  assert overflowed[-1] and not any(overflowed[:-1])
+
+def stalled_pair() -> tuple[socket.socket, socket.socket]:
+  connection, peer = socket.socketpair()
+  connection.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+  peer.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+  peer.settimeout(5)
+  return connection, peer
+
+def read_all(peer: socket.socket) -> bytes:
+  chunks = []
+  while chunk := peer.recv(1 << 16):
+    chunks.append(chunk)
+  return b"".join(chunks)
+
+def test_outbox_overflows_past_hard_limit() -> None:
+  connection, peer = stalled_pair()
+  outbox = Outbox(connection, 4, 60.0)
+  for _ in range(4 * 4 + 2):
+    outbox.push([bytes(1 << 14)])
+  assert outbox.overflowed
+  assert outbox.flush(5)
+  connection.close()
+  peer.close()
+
+def test_outbox_writer_drops_a_stalled_peer_without_further_pushes() -> None:
+  connection, peer = stalled_pair()
+  outbox = Outbox(connection, 2, 0.2)
+  for _ in range(4):
+    outbox.push([bytes(1 << 14)])
+  assert outbox.queued > 2 and not outbox.overflowed
+  assert outbox.flush(5)
+  assert outbox.overflowed
+  connection.close()
+  peer.close()
+
+def test_outbox_coalesces_keyed_frames_and_counts_written_bytes() -> None:
+  connection, peer = stalled_pair()
+  outbox = Outbox(connection, 64, 60.0)
+  outbox.traffic = Traffic()
+  outbox.push([b"x" * (1 << 16)])
+  for i in range(5):
+    outbox.push([f"update-{i};".encode()], "update")
+  outbox.push([b"end"])
+  assert outbox.coalesced == 4
+  received: list[bytes] = []
+  reader = threading.Thread(target=lambda: received.append(read_all(peer)))
+  reader.start()
+  assert outbox.flush(5)
+  connection.shutdown(socket.SHUT_WR)
+  reader.join(5)
+  data = received[0]
+  assert data == b"x" * (1 << 16) + b"update-4;end"
+  assert outbox.traffic.sent == len(data)
+  connection.close()
+  peer.close()
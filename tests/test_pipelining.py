@@ -0,0 +1,43 @@
+import socket
+from typing import Any, Callable
+
+import pytest
+
+from lib.proto import Dispatcher, MessageType, recv_message, send_message
+
+@pytest.mark.parametrize("engine", ["thread", "asyncio"])
+def test_pipelined_register_then_login(engine: str, launch: Callable[..., int]) -> None:
+  connection = socket.create_connection(("127.0.0.1", launch(engine)))
+  dispatcher = Dispatcher(connection, lambda message: None)
+  dispatcher.start()
+  credentials = {"username": "pipelined", "password": "secret"}
+  register = dispatcher.request({"type": MessageType.REGISTER_REQUEST.name, **credentials})
+  login = dispatcher.request({"type": MessageType.LOGIN_REQUEST.name, **credentials})
+  whoami = dispatcher.request({"type": MessageType.WHOAMI_REQUEST.name})
+  assert register.result(30)["type"] == MessageType.OK.name
+  assert login.result(30)["type"] == MessageType.OK.name
+  assert whoami.result(30)["username"] == "pipelined"
+  connection.close()
+
+def test_dispatcher_matches_out_of_order_replies_and_routes_events() -> None:
+  client, peer = socket.socketpair()
+  events: list[dict[str, Any]] = []
+  closed: list[Exception] = []
+  dispatcher = Dispatcher(client, events.append, closed.append)
+  dispatcher.start()
+  futures = [dispatcher.request({"type": MessageType.WHOAMI_REQUEST.name, "username": str(i)}) for i in range(5)]
+  requests = [recv_message(peer) for _ in futures]
+  send_message(peer, {"type": MessageType.ROOM_JOIN_UPDATE.name, "username": "guest"})
+  for request in reversed(requests):
+    send_message(peer, {"type": MessageType.OK.name, "username": request["username"], "request_id": request["request_id"]})
+  assert [future.result(5)["username"] for future in futures] == [str(i) for i in range(5)]
+  assert events == [{"type": MessageType.ROOM_JOIN_UPDATE.name, "username": "guest"}]
+  pending = dispatcher.request({"type": MessageType.WHOAMI_REQUEST.name})
+  recv_message(peer)
+  peer.close()
+  with pytest.raises(ConnectionError):
+    pending.result(5)
+  with pytest.raises(ConnectionError):
+    dispatcher.request({"type": MessageType.WHOAMI_REQUEST.name}).result(5)
+  assert len(closed) == 1 and dispatcher.outstanding == 0
+  client.close()
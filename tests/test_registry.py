@@ -0,0 +1,44 @@
+import bisect
+import random
+
+from lib.registry import RoomRegistry, SortedIds
+from lib.room import Room
+from lib.user import User
+
+def test_sorted_ids_match_a_sorted_list() -> None:
+  rng = random.Random(11)
+  ids = SortedIds()
+  expected: list[int] = []
+  for _ in range(20_000):
+    value = rng.randrange(5_000)
+    i = bisect.bisect_left(expected, value)
+    present = i < len(expected) and expected[i] == value
+    if rng.random() < 0.6:
+      assert ids.add(value) == (not present)
+      if not present:
+        expected.insert(i, value)
+    else:
+      assert ids.discard(value) == present
+      if present:
+        del expected[i]
+  assert len(ids) == len(expected)
+  for after in [None, -1, 0, 2_500, 4_999, 6_000, *(rng.randrange(5_000) for _ in range(50))]:
+    limit = rng.randrange(1, 2_000)
+    start = 0 if after is None else bisect.bisect_right(expected, after)
+    assert ids.after(after, limit) == expected[start:start + limit]
+  assert all((value in ids) == (value in expected) for value in range(-1, 5_001, 7))
+
+def test_open_rooms_track_joins_and_leaves() -> None:
+  registry = RoomRegistry()
+  owners = [User(f"owner-{i}", None) for i in range(3)]
+  rooms = [Room(owner, 2) for owner in owners]
+  for room in rooms:
+    registry.add(room)
+  guest = User("guest", None)
+  registry.join(rooms[1], guest)
+  assert registry.open_rooms(None, 10) == [rooms[0], rooms[2]]
+  assert registry.open_rooms(rooms[0].id, 10) == [rooms[2]]
+  registry.leave(rooms[1], guest)
+  assert registry.open_rooms(None, 2) == rooms[:2]
+  registry.remove(rooms[0])
+  assert registry.open_rooms(None, 10) == rooms[1:]
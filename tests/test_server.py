@@ -0,0 +1,93 @@
+import asyncio
+import socket
+import threading
+from typing import Any, Callable
+
+import pytest
+from peewee import fn
+
+import models
+from bench import stress
+from conftest import CaptureConnection
+from lib.metrics import Metrics
+from lib.proto import MessageType, send_and_recv_message
+from lib.user import User
+
+def test_concurrent_rooms_stay_consistent(server: Any, create_users: Callable[[list[str]], None]) -> None:
+  rooms, players = 12, 4
+  create_users([f"stress-{i}-{j}" for i in range(rooms) for j in range(players)])
+  result = stress.run(server, rooms, players)
+  assert result["errors"] == []
+  assert result["problems"] == []
+  assert result["live_rooms_after"] == 0
+  server.stats_writer.stop()
+  assert models.User.select(fn.SUM(models.User.wins)).scalar() == rooms
+  assert models.User.select(fn.SUM(models.User.losses)).scalar() == rooms * (players - 1)
+
+def test_room_list_pages_and_rejects_bad_arguments(server: Any) -> None:
+  owners = [User(f"owner-{i}", CaptureConnection()) for i in range(3)]
+  rooms = [server.create_room(owner.connection, {"player_count": 2}, owner) for owner in owners]
+  connection = CaptureConnection()
+  server.list_rooms(connection, {"limit": 2})
+  page = connection.messages[-1]
+  assert [room["room_id"] for room in page["rooms"]] == [room.id for room in rooms[:2]]
+  server.list_rooms(connection, {"limit": 2, "cursor": page["cursor"]})
+  assert [room["room_id"] for room in connection.messages[-1]["rooms"]] == [rooms[2].id]
+  assert connection.messages[-1]["cursor"] is None
+  for message in [{"limit": "5"}, {"limit": None}, {"cursor": "1"}, {"cursor": 1.5}]:
+    server.list_rooms(connection, message)
+    assert connection.messages[-1]["type"] == MessageType.ERROR.name
+
+def test_message_counter_folds_unknown_types_into_one_label(server: Any, monkeypatch: pytest.MonkeyPatch) -> None:
+  monkeypatch.setattr(server, "metrics", Metrics())
+  client, connection = socket.socketpair()
+  thread = threading.Thread(target=server.serve_client, args=(connection, ("test", 0)), daemon=True)
+  thread.start()
+  for message_type in [MessageType.WHOAMI_REQUEST.name, "NOT_A_TYPE", ["list"], {"dict": 1}, None, 7]:
+    assert send_and_recv_message(client, {"type": message_type})["type"] == MessageType.ERROR.name
+  client.close()
+  thread.join(5)
+  lines = [line for line in server.metrics.render().splitlines() if line.startswith("messages_total")]
+  assert lines == ['messages_total{type="WHOAMI_REQUEST"} 1', 'messages_total{type="invalid"} 5']
+
+def on_event_loop() -> bool:
+  try:
+    asyncio.get_running_loop()
+  except RuntimeError:
+    return False
+  return True
+
+def test_asyncio_engine_keeps_database_reads_off_the_loop(server: Any, create_users: Callable[[list[str]], None], monkeypatch: pytest.MonkeyPatch) -> None:
+  create_users(["reader"])
+  blocking_calls: list[str] = []
+  for name in ["load_profile", "load_leaders"]:
+    def traced(*args: Any, method: Any = getattr(server.stats_writer, name), name: str = name) -> Any:
+      if on_event_loop():
+        blocking_calls.append(name)
+      return method(*args)
+    monkeypatch.setattr(server.stats_writer, name, traced)
+  loop = asyncio.new_event_loop()
+  listening = loop.run_until_complete(asyncio.start_server(server.serve_client_async, "127.0.0.1", 0))
+  thread = threading.Thread(target=loop.run_forever, daemon=True)
+  thread.start()
+  try:
+    connection = socket.create_connection(listening.sockets[0].getsockname())
+    assert send_and_recv_message(connection, {"type": MessageType.LOGIN_REQUEST.name, "username": "reader", "password": "test"})["type"] == MessageType.OK.name
+    for message in [
+      {"type": MessageType.LEADERBOARD_REQUEST.name, "order": "wins"},
+      {"type": MessageType.MATCHMAKE_REQUEST.name, "player_count": 2},
+      {"type": MessageType.WHOAMI_REQUEST.name},
+    ]:
+      server.user_cache.invalidate("reader")
+      assert send_and_recv_message(connection, message)["type"] == MessageType.OK.name
+    connection.close()
+  finally:
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    listening.close()
+    tasks = asyncio.all_tasks(loop)
+    for task in tasks:
+      task.cancel()
+    loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+    loop.close()
+  assert blocking_calls == []
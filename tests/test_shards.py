@@ -0,0 +1,49 @@
+import os
+import socket
+from typing import Any, Callable
+
+from conftest import exchange, sign_in
+from lib.proto import MessageType, recv_message
+from lib.shards import Directory
+
+def test_directory_is_shared_between_handles(tmp_path: Any) -> None:
+  path = os.path.join(tmp_path, "directory.db")
+  first, second = Directory(path), Directory(path)
+  assert first.add_room(1, "owner", 0)
+  assert not second.add_room(3, "owner", 1)
+  assert second.room_shard(1) == 0 and second.room_shard(3) is None
+  first.add_seats(["owner", "guest"], 0)
+  assert second.seat_shard("guest") == 0
+  second.remove_seat("guest")
+  assert first.seat_shard("guest") is None
+  first.add_session("owner", 0)
+  second.remove_session("owner", 1)
+  assert second.session_count() == 1
+  second.remove_session("owner", 0)
+  assert first.session_count() == 0
+  first.close()
+  second.close()
+
+def test_join_hands_the_connection_to_the_shard_owning_the_room(launch: Callable[..., int]) -> None:
+  port = launch("thread", "--workers", "2")
+  owner = socket.create_connection(("127.0.0.1", port))
+  sign_in(owner, "owner")
+  room_id = exchange(owner, MessageType.ROOM_CREATION_REQUEST, player_count=2)["room_id"]
+  for _ in range(64):
+    guest = socket.create_connection(("127.0.0.1", port))
+    listed = exchange(guest, MessageType.ROOM_LIST_REQUEST)["rooms"]
+    if not any(room["room_id"] == room_id for room in listed):
+      break
+    guest.close()
+  else:
+    raise AssertionError("every connection landed on the shard owning the room")
+  sign_in(guest, "guest")
+  joined = exchange(guest, MessageType.ROOM_CONNECTION_REQUEST, room_id=room_id)
+  assert joined["type"] == MessageType.ROOM_JOIN_UPDATE.name
+  assert joined["current_player_count"] == 2
+  assert recv_message(guest)["type"] == MessageType.GAME_START_UPDATE.name
+  assert recv_message(owner)["type"] == MessageType.ROOM_JOIN_UPDATE.name
+  assert recv_message(owner)["type"] == MessageType.GAME_START_UPDATE.name
+  assert exchange(guest, MessageType.WHOAMI_REQUEST)["username"] == "guest"
+  guest.close()
+  owner.close()
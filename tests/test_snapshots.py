@@ -0,0 +1,22 @@
+import random
+from typing import Any
+
+from conftest import play_move, seated_room
+from lib.snapshots import SnapshotWriter, read_snapshot
+
+def test_snapshot_restores_rooms_mid_game(tmp_path: Any) -> None:
+  rng = random.Random(3)
+  rooms = [seated_room(players) for players in [2, 3, 4]]
+  for room in rooms:
+    for _ in range(rng.randrange(5, 15)):
+      play_move(room, rng)
+  path = str(tmp_path / "rooms.snapshot")
+  assert SnapshotWriter(path, lambda: rooms).write() == len(rooms)
+  restored = read_snapshot(path)
+  assert [room.id for room in restored] == [room.id for room in rooms]
+  for (original, copy) in zip(rooms, restored):
+    assert copy.version == original.version
+    assert copy.owner.name == original.owner.name
+    assert [user.name for user in copy.users] == [user.name for user in original.users]
+    assert copy.game_state() == original.game_state()
+    assert copy.game.current_player.player_id == original.game.current_player.player_id
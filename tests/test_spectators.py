@@ -0,0 +1,65 @@
+import time
+from typing import Any, Callable
+
+import pytest
+
+from conftest import CaptureConnection
+from lib import proto
+from lib.proto import MessageType
+from lib.spectators import SpectatorHub
+from lib.user import User
+
+def wait_for(predicate: Callable[[], bool], timeout: float = 5.0) -> None:
+  deadline = time.monotonic() + timeout
+  while not predicate():
+    assert time.monotonic() < deadline
+    time.sleep(0.01)
+
+def test_update_is_encoded_once_for_every_watcher(monkeypatch: pytest.MonkeyPatch) -> None:
+  prepared: list[dict[str, Any]] = []
+  def prepare(shared: dict[str, Any], prepare: Any = proto.JSON_CODEC.prepare) -> Any:
+    prepared.append(shared)
+    return prepare(shared)
+  monkeypatch.setattr(proto.JSON_CODEC, "prepare", prepare)
+  hub = SpectatorHub(interval=0.01, chunk_size=3)
+  hub.start()
+  watchers = [CaptureConnection() for _ in range(10)]
+  for watcher in watchers:
+    hub.subscribe(7, watcher)
+  update = {"type": MessageType.SPECTATE_UPDATE.name, "room_id": 7, "version": 1}
+  hub.publish(7, update)
+  wait_for(lambda: all(watcher.messages for watcher in watchers))
+  assert len(prepared) == 1
+  assert all(watcher.messages == [update] for watcher in watchers)
+
+def test_watchers_see_no_hands(server: Any) -> None:
+  server.spectators.start()
+  owner, guest = User("owner", CaptureConnection()), User("guest", CaptureConnection())
+  room = server.create_room(owner.connection, {"player_count": 2}, owner)
+  watcher = CaptureConnection()
+  server.spectate(watcher, {"room_id": room.id})
+  server.join_room(guest.connection, {"room_id": room.id}, guest)
+  mover = [owner, guest][room.game.current_player.player_id]
+  server.draw_card(mover.connection, {}, mover, room)
+  wait_for(lambda: (watcher.last(MessageType.SPECTATE_UPDATE) or {}).get("version") == room.version)
+  assert mover.connection.last(MessageType.GAME_UPDATE)["hand"]
+  assert watcher.messages[0]["type"] == MessageType.OK.name
+  for message in watcher.messages[1:]:
+    assert message["type"] == MessageType.SPECTATE_UPDATE.name
+    assert "hand" not in message and "removed" not in message and "added" not in message
+    assert len(message["hand_sizes"]) == 2
+
+def test_watchers_are_removed_on_disconnect_and_room_close(server: Any) -> None:
+  server.spectators.start()
+  owner = User("owner", CaptureConnection())
+  room = server.create_room(owner.connection, {"player_count": 2}, owner)
+  leaving, staying = CaptureConnection(), CaptureConnection()
+  server.spectate(leaving, {"room_id": room.id})
+  server.spectate(staying, {"room_id": room.id})
+  assert server.spectators.count(room.id) == 2
+  server.close_client(leaving, ("spectator", 0), None)
+  assert server.spectators.count(room.id) == 1 and len(server.spectators) == 1
+  server.leave_active_room(owner)
+  wait_for(lambda: len(server.spectators) == 0)
+  assert server.spectators.count(room.id) == 0
+  assert staying.last(MessageType.ROOM_CLOSE_UPDATE)
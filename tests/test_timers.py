@@ -0,0 +1,78 @@
+import socket
+import time
+from typing import Any, Callable
+
+import pytest
+
+from conftest import exchange, sign_in
+from lib.proto import MessageType, recv_message
+
+ENGINES = ["thread", "asyncio"]
+
+def connect(port: int) -> socket.socket:
+  connection = socket.create_connection(("127.0.0.1", port))
+  connection.settimeout(10)
+  return connection
+
+def start_two_player_game(port: int) -> tuple[list[socket.socket], list[dict[str, Any]], int]:
+  owner, guest = connect(port), connect(port)
+  sign_in(owner, "owner")
+  sign_in(guest, "guest")
+  room_id = exchange(owner, MessageType.ROOM_CREATION_REQUEST, player_count=2)["room_id"]
+  assert exchange(guest, MessageType.ROOM_CONNECTION_REQUEST, room_id=room_id)["type"] == MessageType.ROOM_JOIN_UPDATE.name
+  assert recv_message(owner)["type"] == MessageType.ROOM_JOIN_UPDATE.name
+  starts = [recv_message(owner), recv_message(guest)]
+  assert all(start["type"] == MessageType.GAME_START_UPDATE.name for start in starts)
+  return [owner, guest], starts, room_id
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_idle_connection_is_dropped(engine: str, launch: Callable[..., int]) -> None:
+  connection = connect(launch(engine, "--idle-timeout", "0.5"))
+  started = time.monotonic()
+  assert connection.recv(1) == b""
+  assert time.monotonic() - started >= 0.4
+  connection.close()
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_stalled_frame_is_dropped(engine: str, launch: Callable[..., int]) -> None:
+  connection = connect(launch(engine, "--read-timeout", "0.5"))
+  connection.sendall(b"\x00\x00")
+  assert connection.recv(1) == b""
+  connection.close()
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_heartbeat_keeps_connection_alive(engine: str, launch: Callable[..., int]) -> None:
+  connection = connect(launch(engine, "--idle-timeout", "0.5"))
+  deadline = time.monotonic() + 1.5
+  while time.monotonic() < deadline:
+    assert exchange(connection, MessageType.HEARTBEAT_REQUEST)["type"] == MessageType.OK.name
+    time.sleep(0.15)
+  assert exchange(connection, MessageType.HEARTBEAT_REQUEST)["type"] == MessageType.OK.name
+  connection.close()
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_timed_out_turn_is_drawn(engine: str, launch: Callable[..., int]) -> None:
+  port = launch(engine, "--turn-timeout", "0.3", "--timer-interval", "0.05")
+  players, starts, _ = start_two_player_game(port)
+  mover = starts[0]["turn"]
+  started = time.monotonic()
+  update = recv_message(players[mover])
+  assert time.monotonic() - started >= 0.2
+  assert update["type"] == MessageType.GAME_UPDATE.name
+  assert len(update["hand"]) == len(starts[mover]["hand"]) + 1
+  for player in players:
+    player.close()
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_abandoned_room_is_reaped(engine: str, launch: Callable[..., int]) -> None:
+  port = launch(engine, "--idle-timeout", "1", "--timer-interval", "0.05")
+  players, _, room_id = start_two_player_game(port)
+  for player in players:
+    player.close()
+  probe = connect(port)
+  assert exchange(probe, MessageType.SPECTATE_REQUEST, room_id=room_id)["type"] == MessageType.OK.name
+  probe.close()
+  time.sleep(1.5)
+  probe = connect(port)
+  assert exchange(probe, MessageType.SPECTATE_REQUEST, room_id=room_id)["type"] == MessageType.ERROR.name
+  probe.close()
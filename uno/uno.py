@@ -0,0 +1,271 @@
+import random as _random
+
+COLORS = ["red", "yellow", "green", "blue"]
+ALL_COLORS = COLORS + ["black"]
+CARD_TYPES: list[int | str] = [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, "skip", "reverse", "+2", "wildcard", "+4"]
+BLACK_CARD_TYPES = ["wildcard", "+4"]
+BLACK = ALL_COLORS.index("black")
+SKIP = CARD_TYPES.index("skip")
+REVERSE = CARD_TYPES.index("reverse")
+DRAW_TWO = CARD_TYPES.index("+2")
+WILDCARD = CARD_TYPES.index("wildcard")
+DRAW_FOUR = CARD_TYPES.index("+4")
+HAND_SIZE = 7
+MIN_PLAYERS = 2
+MAX_PLAYERS = 15
+
+def card_code(color: int, card_type: int) -> int:
+  return color << 4 | card_type
+
+def _build_playable_table() -> bytes:
+  table = bytearray(len(ALL_COLORS) << 11)
+  for top in range(len(ALL_COLORS) << 4):
+    for card in range(len(ALL_COLORS) << 4):
+      table[top << 7 | card] = (
+        card >> 4 == BLACK or card >> 4 == top >> 4 or card & 0xF == top & 0xF
+      )
+  return bytes(table)
+
+PLAYABLE = _build_playable_table()
+
+def _deck_codes() -> list[int]:
+  codes = []
+  for color in range(len(COLORS)):
+    codes.append(card_code(color, 0))
+    for card_type in range(1, 10):
+      codes += [card_code(color, card_type)] * 2
+    for card_type in [SKIP, REVERSE, DRAW_TWO]:
+      codes += [card_code(color, card_type)] * 2
+  for card_type in [WILDCARD, DRAW_FOUR]:
+    codes += [card_code(BLACK, card_type)] * 4
+  return codes
+
+DECK_CODES = _deck_codes()
+VALID_CODES = frozenset(DECK_CODES)
+NO_CARD = 0xFF
+
+class UnoCard:
+  __slots__ = ("code", "_effective", "_temp_color")
+  code: int
+  _effective: int
+  _temp_color: str | None
+
+  def __init__(self, color: str, card_type: int | str) -> None:
+    if color not in ALL_COLORS or card_type not in CARD_TYPES:
+      raise ValueError(f"invalid card {color} {card_type}")
+    if (color == "black") != (card_type in BLACK_CARD_TYPES):
+      raise ValueError(f"invalid card {color} {card_type}")
+    self.code = card_code(ALL_COLORS.index(color), CARD_TYPES.index(card_type))
+    self._effective = self.code
+    self._temp_color = None
+
+  @classmethod
+  def from_code(cls, code: int) -> "UnoCard":
+    if code not in VALID_CODES:
+      raise ValueError(f"invalid card code {code}")
+    card = cls.__new__(cls)
+    card.code = code
+    card._effective = code
+    card._temp_color = None
+    return card
+
+  @property
+  def color(self) -> str:
+    return ALL_COLORS[self.code >> 4]
+
+  @property
+  def card_type(self) -> int | str:
+    return CARD_TYPES[self.code & 0xF]
+
+  @property
+  def temp_color(self) -> str | None:
+    return self._temp_color
+
+  @temp_color.setter
+  def temp_color(self, color: str | None) -> None:
+    if color is None:
+      self._effective = self.code
+    elif color in COLORS:
+      self._effective = card_code(COLORS.index(color), self.code & 0xF)
+    else:
+      raise ValueError(f"invalid color {color}")
+    self._temp_color = color
+
+  def playable(self, other: "UnoCard") -> bool:
+    return PLAYABLE[self._effective << 7 | other.code] == 1
+
+  def __repr__(self) -> str:
+    return f"<UnoCard object: {self.color} {self.card_type}>"
+
+class UnoPlayer:
+  __slots__ = ("hand", "player_id")
+  hand: list[UnoCard]
+  player_id: int
+
+  def __init__(self, cards: list[UnoCard], player_id: int) -> None:
+    self.hand = cards
+    self.player_id = player_id
+
+  def can_play(self, current_card: UnoCard) -> bool:
+    row = current_card._effective << 7
+    for card in self.hand:
+      if PLAYABLE[row | card.code]:
+        return True
+    return False
+
+  def __repr__(self) -> str:
+    return f"<UnoPlayer object: player {self.player_id}>"
+
+class UnoGame:
+  __players: list[UnoPlayer]
+  __deck: list[UnoCard]
+  __discard: list[UnoCard]
+  __current_card: UnoCard
+  __current: int
+  __direction: int
+  __winner: UnoPlayer | None
+  __random: bool
+  __rng: _random.Random
+
+  def __init__(self, players: int, random: bool = True, seed: int | None = None) -> None:
+    if not MIN_PLAYERS <= players <= MAX_PLAYERS:
+      raise ValueError(f"invalid player count {players}")
+    self.__random = random
+    self.__rng = _random.Random(seed)
+    self.__deck = [UnoCard.from_code(code) for code in DECK_CODES]
+    self.__discard = []
+    self.__players = [UnoPlayer([self.__draw() for _ in range(HAND_SIZE)], i) for i in range(players)]
+    card = self.__draw()
+    while card.code >> 4 == BLACK:
+      self.__discard.append(card)
+      card = self.__draw()
+    self.__current_card = card
+    self.__current = 0
+    self.__direction = 1
+    self.__winner = None
+
+  @classmethod
+  def from_state(cls, state: bytes, seed: int | None = None) -> "UnoGame":
+    game = cls.__new__(cls)
+    players, current, flags, winner, top, temp_color = state[:6]
+    offset = 6
+    piles: list[list[UnoCard]] = []
+    for _ in range(players + 2):
+      count = state[offset]
+      piles.append([UnoCard.from_code(code) for code in state[offset + 1:offset + 1 + count]])
+      offset += 1 + count
+    game.__random = bool(flags & 2)
+    game.__rng = _random.Random(seed)
+    game.__deck = piles[0]
+    game.__discard = piles[1]
+    game.__players = [UnoPlayer(hand, i) for (i, hand) in enumerate(piles[2:])]
+    game.__current_card = UnoCard.from_code(top)
+    if temp_color != NO_CARD:
+      game.__current_card.temp_color = COLORS[temp_color]
+    game.__current = current
+    game.__direction = -1 if flags & 1 else 1
+    game.__winner = game.__players[winner] if winner != NO_CARD else None
+    return game
+
+  def state(self) -> bytes:
+    temp_color = self.__current_card.temp_color
+    state = bytearray([
+      len(self.__players),
+      self.__current,
+      (1 if self.__direction == -1 else 0) | (2 if self.__random else 0),
+      self.__winner.player_id if self.__winner else NO_CARD,
+      self.__current_card.code,
+      COLORS.index(temp_color) if temp_color else NO_CARD,
+    ])
+    for pile in [self.__deck, self.__discard, *[player.hand for player in self.__players]]:
+      state.append(len(pile))
+      state += bytes([card.code for card in pile])
+    return bytes(state)
+
+  def __draw(self) -> UnoCard:
+    deck = self.__deck
+    if not deck:
+      self.__deck, self.__discard = self.__discard, deck
+      deck = self.__deck
+    if self.__random:
+      i = self.__rng.randrange(len(deck))
+      deck[i], deck[-1] = deck[-1], deck[i]
+    return deck.pop()
+
+  def __pick_up(self, player: UnoPlayer, count: int) -> None:
+    for _ in range(count):
+      if not self.__deck and not self.__discard:
+        return
+      player.hand.append(self.__draw())
+
+  def __advance(self, steps: int) -> None:
+    self.__current = (self.__current + steps * self.__direction) % len(self.__players)
+
+  def play(self, player: int, card: int | None = None, new_color: str | None = None) -> None:
+    if self.__winner is not None:
+      raise ValueError("game is over")
+    if player != self.__current:
+      raise ValueError(f"invalid player: it is player {self.__current}'s turn")
+    current_player = self.__players[player]
+    if card is None:
+      self.__pick_up(current_player, 1)
+      self.__advance(1)
+      return
+    hand = current_player.hand
+    if not 0 <= card < len(hand):
+      raise ValueError(f"invalid card index {card}")
+    played = hand[card]
+    if not self.__current_card.playable(played):
+      raise ValueError(f"{played} cannot be played on {self.__current_card}")
+    is_black = played.code >> 4 == BLACK
+    if is_black and new_color not in COLORS:
+      raise ValueError(f"invalid new color {new_color}")
+    hand.pop(card)
+    previous = self.__current_card
+    previous.temp_color = None
+    self.__discard.append(previous)
+    played.temp_color = new_color if is_black else None
+    self.__current_card = played
+    if not hand:
+      self.__winner = current_player
+      return
+    card_type = played.code & 0xF
+    if card_type == SKIP or card_type == REVERSE and len(self.__players) == 2:
+      self.__advance(2)
+    elif card_type == REVERSE:
+      self.__direction = -self.__direction
+      self.__advance(1)
+    elif card_type == DRAW_TWO or card_type == DRAW_FOUR:
+      self.__advance(1)
+      self.__pick_up(self.__players[self.__current], 2 if card_type == DRAW_TWO else 4)
+      self.__advance(1)
+    else:
+      self.__advance(1)
+
+  @property
+  def players(self) -> list[UnoPlayer]:
+    return self.__players
+
+  @property
+  def current_player(self) -> UnoPlayer:
+    return self.__players[self.__current]
+
+  @property
+  def current_card(self) -> UnoCard:
+    return self.__current_card
+
+  @property
+  def winner(self) -> UnoPlayer | None:
+    return self.__winner
+
+  @property
+  def is_active(self) -> bool:
+    return self.__winner is None
+
+  @property
+  def deck(self) -> list[UnoCard]:
+    return self.__deck
+
+  @property
+  def discard_pile(self) -> list[UnoCard]:
+    return self.__discard